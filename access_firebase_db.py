@@ -1,69 +1,101 @@
-import pandas as pd
+import argparse
+import os
 import firebase_admin
 from firebase_admin import credentials, firestore
+from columnar_store import drop_duplicate_rows, find_table, load_table
+from firestore_bulk_writer import BulkWriter
+from firestore_sync import SyncManifest, match_document_id, rank_document_id, sync_collection
 
-def upload_player_ranks(collection_name, path_csv, db):
+def upload_player_ranks(collection_name, path_csv, db, max_in_flight=4):
     """
     Write table in csv format to Firestore
 
     :param collection_name: str - name of collection on Firestore to save to
-    :param path_csv: str - local path to csv with rank data
+    :param path_csv: str - local path to csv or parquet with rank data
     :param db: google.cloud.firestore_v1.client
-    :return: None
+    :param max_in_flight: int - batches committed concurrently
+    :return: dict - write stats from BulkWriter
 
     """
-    df = pd.read_csv(path_csv)
-    batch = db.batch()
+    df = load_table(path_csv)
 
-    for row_id, row in df.iterrows():
-        doc_name = f"{'_'.join(row.get('Player').lower().split(' '))}_{row.get('tsid')}_{row.get('Category')}"
-        doc_ref = db.collection(collection_name).document(doc_name)
-        batch.set(doc_ref, row.to_dict())
-        if row_id > 0 and row_id % 499 == 0:
-            batch.commit()
-            batch = db.batch()
-            print(f'Completed batch {row_id+1 - 499} --> {row_id+1}')
+    # Document name: player_name_tsid_category
+    doc_names = df['Player'].str.lower().str.split(' ').str.join('_') + '_' \
+        + df['tsid'].astype(str) + '_' + df['Category'].astype(str)
 
+    writer = BulkWriter(db, max_in_flight=max_in_flight)
+    return writer.set_documents(collection_name, doc_names, df.to_dict('records'))
 
-def upload_player_tournament_results(collection_name, path_csv, db):
+
+def upload_player_tournament_results(collection_name, path_csv, db, max_in_flight=4):
     """
      Write table in csv format to Firestore
 
     :param collection_name: str - name of collection on Firestore to save to
-    :param path_csv: str - local path to csv with tournament data
+    :param path_csv: str - local path to csv or parquet with tournament data
     :param db: google.cloud.firestore_v1.client
-    :return: None
+    :param max_in_flight: int - batches committed concurrently
+    :return: dict - write stats from BulkWriter
     """
-    df = pd.read_csv(path_csv)
-    df.drop_duplicates(inplace=True)
+    df = drop_duplicate_rows(load_table(path_csv))
     df.reset_index(inplace=True)
 
-    #Creates a WriteBatch Object - Maximum operations per batch is 500
-    batch = db.batch()
-    size_of_batch = 0
-
-    for row_id, row in df.iterrows():
-        if size_of_batch < 499:
-            #Create an automated document ref
-            doc_ref = db.collection(collection_name).document()
-            #Add document (match results) to batch
-            batch.set(doc_ref, row.to_dict())
-            #Increment batch size
-            size_of_batch += 1
-        else:
-            print(f"Batch size: {size_of_batch}")
-            #Commit batch of 499 results
-            batch.commit()
-            print(f'Completed batch {row_id+1 - 499} --> {row_id+1}')
-            print('-' * 90, '\n')
-            #Create a new empty batch and restart counter
-            batch = db.batch()
-            size_of_batch = 0
-
-
-def main():
+    writer = BulkWriter(db, max_in_flight=max_in_flight)
+    # Automated document refs
+    return writer.set_documents(collection_name, [None] * df.shape[0], df.to_dict('records'))
+
+
+def sync_source(path_csv):
+    """
+    :param path_csv: str - local path to csv or parquet
+    :return: str - name of the file or dataset, the manifest tracks the documents synced from each separately
+    """
+    return os.path.basename(os.path.normpath(path_csv))
+
+
+def sync_player_ranks(collection_name, path_csv, db, manifest, max_in_flight=4):
+    """
+    Sync rank table to Firestore - only rows that are new or changed since the last sync are written
+    and rows no longer in the table are deleted. Rows synced from other files, and documents written by
+    upload_player_ranks, are left alone
+
+    :param collection_name: str - name of collection on Firestore to save to
+    :param path_csv: str - local path to csv or parquet with rank data
+    :param db: google.cloud.firestore_v1.client
+    :param manifest: SyncManifest - record of documents already written
+    :param max_in_flight: int - batches committed concurrently
+    :return: dict - counts of new, changed, deleted and unchanged documents
+    """
+    records = load_table(path_csv).to_dict('records')
+    return sync_collection(db, collection_name, [rank_document_id(r) for r in records], records, manifest,
+                           max_in_flight=max_in_flight, source=sync_source(path_csv))
+
+
+def sync_player_tournament_results(collection_name, path_csv, db, manifest, max_in_flight=4):
+    """
+    Sync tournament results to Firestore - document ids are tournament_id_draw_id_match_id so the same
+    match is never uploaded twice and unchanged matches are not re-written. Matches removed from the file
+    are deleted - matches synced from other files e.g other seasons are left alone, as are documents
+    written with auto ids by upload_player_tournament_results, which sync can't match to a row
+
+    :param collection_name: str - name of collection on Firestore to save to
+    :param path_csv: str - local path to csv or parquet with tournament data
+    :param db: google.cloud.firestore_v1.client
+    :param manifest: SyncManifest - record of documents already written
+    :param max_in_flight: int - batches committed concurrently
+    :return: dict - counts of new, changed, deleted and unchanged documents
+    """
+    df = drop_duplicate_rows(load_table(path_csv))
+    records = df.to_dict('records')
+    return sync_collection(db, collection_name, [match_document_id(r) for r in records], records, manifest,
+                           max_in_flight=max_in_flight, source=sync_source(path_csv))
+
+
+def main(manifest_path=None):
     '''
     Google firebase_admin module Python SDK provides the
+    Set FIRESTORE_EMULATOR_HOST to upload to a local Firestore emulator instead of the live db
+    :param manifest_path: str - path to sync manifest. If given only new or changed documents are written
     :return:
     '''
     #Credentials for Player Firebase DB
@@ -73,12 +105,26 @@ def main():
     #Create google.cloud.firestore_v1.client
     db = firestore.client(app)
 
+    if manifest_path:
+        manifest = SyncManifest(manifest_path)
+        print('='*90, '\nSyncing Rankings')
+        sync_player_ranks('Player_Rankings', find_table('/home/cdsw/player_rankings_2019'), db, manifest)
+        print('=' * 90, '\nSyncing Tournament Results', '\n', '=' * 90)
+        sync_player_tournament_results('Player_Tournament_Results',
+                                       '/home/cdsw/player_tournament_results_2019_.csv', db, manifest)
+        return
+
     print('='*90, '\nUploading Rankings')
-    upload_player_ranks('Player_Rankings','/home/cdsw/player_rankings_2019.csv', db)
+    upload_player_ranks('Player_Rankings',find_table('/home/cdsw/player_rankings_2019'), db)
     print('=' * 90, '\nUploading Tournament Results','\n','=' * 90)
     upload_player_tournament_results('Player_Tournament_Results',
                                      '/home/cdsw/player_tournament_results_2019_.csv', db)
 
 
 if __name__=='__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Upload rankings and tournament results to Firestore')
+    parser.add_argument('--manifest', default=None,
+                        help='sync manifest json - only documents new or changed since the last sync are written '
+                             '(default: upload everything)')
+    args = parser.parse_args()
+    main(args.manifest)
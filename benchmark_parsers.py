@@ -0,0 +1,229 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from match import Match
+from page_parser import configure_parser, get_parser
+from response_cache import ResponseCache
+from scrapper import parseProfilePage, parseRankingPage
+from tournament_crawler import parse_draw_matches_page
+from tournament_results import TournamentResults, parse_results_page
+
+# Page types of a recorded corpus - first url pattern matched wins
+PAGE_TYPES = [('ranking', 'ranking/category.aspx'),
+              ('draw_matches', 'drawmatches.aspx'),
+              ('player_link', 'player.aspx'),
+              ('results', '/tournaments/'),
+              ('profile', '/player-profile/')]
+
+
+def page_type(url):
+    """
+    :param url: str - url of recorded page
+    :return: str - one of PAGE_TYPES, None if the page isn't benchmarked
+    """
+    for name, pattern in PAGE_TYPES:
+        if pattern in url:
+            return name
+    return None
+
+
+class _KnownTsids:
+    """TSID look up that knows every player - so Match never fetches a page while being timed"""
+
+    def __contains__(self, key):
+        return True
+
+    def get(self, tour_ref, tour_player_id, default=None):
+        return None
+
+
+def count_results_page(content):
+    """MatchExtractor - the crawl's parser. :return: int - matches extracted"""
+    results_exist, draws = parse_results_page(content)
+    # Matches Match would fail on are dropped when their TSIDs are resolved
+    return sum(m1.error is None for _, parsed_matches in draws for m1 in parsed_matches)
+
+
+def count_results_page_match(content):
+    """Match.get_match_stats - the original parser, kept for comparison. :return: int - matches extracted"""
+    page = TournamentResults(None, None, None, content=content)
+    if not page.check_if_results_exist():
+        return 0
+    known_tsids = _KnownTsids()
+    matches = 0
+    for _, match_tags in page.iter_draws():
+        for tag in match_tags:
+            try:
+                m1 = Match(tag, None, known_tsids)
+                if not m1.check_for_no_match():
+                    m1.get_match_id()
+                    m1.get_match_stats()
+                    matches += 1
+            except Exception:
+                pass
+    return matches
+
+
+def count_draw_matches_page(content):
+    """:return: int - matches extracted"""
+    return sum(m1.error is None for m1 in parse_draw_matches_page(content))
+
+
+def count_ranking_page(content):
+    """:return: int - ranking rows extracted"""
+    return len(parseRankingPage(content)[1]['Rank'])
+
+
+def count_profile_page(content):
+    """:return: int - 1 per profile"""
+    parseProfilePage(content)
+    return 1
+
+
+# Benchmark name: (page type, parser returning the number of records in the page, record name)
+BENCHMARKS = {
+    'results_page': ('results', count_results_page, 'matches'),
+    'results_page_match': ('results', count_results_page_match, 'matches'),
+    'draw_matches_page': ('draw_matches', count_draw_matches_page, 'matches'),
+    'ranking_page': ('ranking', count_ranking_page, 'rows'),
+    'profile_page': ('profile', count_profile_page, 'profiles'),
+}
+
+
+def load_corpus(cache_dir):
+    """
+    :param cache_dir: str - response cache recorded by a crawl run with --cache-dir
+    :return: dict - page type: list of bytes
+    """
+    corpus = {}
+    for url, content in ResponseCache(cache_dir, max_bytes=None, replay=True).iter_entries():
+        name = page_type(url)
+        if name is not None:
+            corpus.setdefault(name, []).append(content)
+    return corpus
+
+
+def run_benchmark(parse_fn, pages, repeat=3):
+    """
+    time parse_fn over every page, then measure its peak memory per page in a separate pass
+    (tracemalloc slows the code it traces, so it's kept out of the timings)
+    :param parse_fn: function - page html -> number of records
+    :param pages: list of bytes
+    :param repeat: int - timed passes, the fastest is reported
+    :return: dict - pages, records, seconds, pages_per_sec, records_per_sec, peak_memory_bytes
+    """
+    best = None
+    records = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = sum(parse_fn(content) for content in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = 0
+    for content in pages:
+        tracemalloc.start()
+        parse_fn(content)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {'pages': len(pages),
+            'records': records,
+            'seconds': round(best, 6),
+            'pages_per_sec': round(len(pages) / best, 2) if best else None,
+            'records_per_sec': round(records / best, 2) if best else None,
+            'peak_memory_bytes': peak}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(cache_dir, benchmarks=None, repeat=3):
+    """
+    :param cache_dir: str - recorded corpus
+    :param benchmarks: list of str - names in BENCHMARKS, None runs all
+    :param repeat: int - timed passes per benchmark
+    :return: dict - json serialisable report
+    """
+    corpus = load_corpus(cache_dir)
+    report = {'commit': _git_commit(),
+              'python': platform.python_version(),
+              'html_parser': get_parser(),
+              'corpus': {name: len(pages) for name, pages in corpus.items()},
+              'benchmarks': {}}
+    for name in benchmarks or BENCHMARKS:
+        page_name, parse_fn, record_name = BENCHMARKS[name]
+        pages = corpus.get(page_name, [])
+        if not pages:
+            print(f'Skipping {name} - no {page_name} pages in corpus', file=sys.stderr)
+            continue
+        result = run_benchmark(parse_fn, pages, repeat)
+        result['record'] = record_name
+        report['benchmarks'][name] = result
+        print(f'{name}: {result["pages_per_sec"]} pages/s, {result["records_per_sec"]} {record_name}/s, '
+              f'peak {result["peak_memory_bytes"] / 1024:.0f} KiB', file=sys.stderr)
+    return report
+
+
+def compare_reports(previous, current, threshold=0.1):
+    """
+    compare throughput and peak memory against a previous report
+    :param previous: dict - report from run_suite
+    :param current: dict - report from run_suite
+    :param threshold: float - relative change treated as a regression e.g 0.1 = 10%
+    :return: list of str - regressions
+    """
+    regressions = []
+    for name, result in current['benchmarks'].items():
+        before = previous.get('benchmarks', {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in [('pages_per_sec', True), ('records_per_sec', True),
+                                         ('peak_memory_bytes', False)]:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            print(f'{name} {metric}: {old} -> {new} ({change:+.1%})', file=sys.stderr)
+            if (change < -threshold) if higher_is_better else (change > threshold):
+                regressions.append(f'{name} {metric} {change:+.1%}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark page parsers over a recorded corpus - fully offline')
+    parser.add_argument('corpus', help='response cache directory recorded with --cache-dir')
+    parser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS),
+                        help='benchmark to run, may be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes per benchmark (default: 3)')
+    parser.add_argument('--parser', default=None, choices=['lxml', 'html.parser'],
+                        help='html parser (default: lxml if installed)')
+    parser.add_argument('--output', default=None, help='write json report here (default: stdout)')
+    parser.add_argument('--compare', default=None, help='previous json report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slow down or memory growth reported as a regression (default: 0.1)')
+    args = parser.parse_args()
+
+    configure_parser(args.parser)
+    report = run_suite(args.corpus, args.benchmark, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions), file=sys.stderr)
+            sys.exit(1)
@@ -1,38 +1,586 @@
-import pandas as pd
+import argparse
+import asyncio
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import os
 
 os.chdir('/home/cdsw/player_workspace')
 
+from columnar_store import ParquetResultSink, find_table, load_table, results_partition_path
+from crawl_journal import CrawlJournal
+from crawl_metrics import configure_metrics, get_metrics, incr, record_failure, stop_metrics
+from http_client import FetchError, configure_base_url, configure_cache, configure_rate_limiter
+from page_parser import configure_parser
+from parse_pool import configure_parse_pool, shutdown_parse_pool
 from player import Player
+from ranking_index import RankingIndex
+from local_store import LocalStore, StoreResultSink
+from result_sink import CsvResultSink, SeasonResultSinks, TeeResultSink
+from seen_matches import SeenMatches
+from response_cache import CacheMiss
+from tournament_crawler import TournamentCrawler, load_tournaments
+from tsid_resolver import TsidResolver
+from work_queue import LeaseKeeper, WorkQueue, default_worker_id
 
 
-def main():
-    df_player_table = pd.read_csv('/home/cdsw/player_rankings_2019.csv')
+def open_result_sink(year, output_format='csv'):
+    '''
+    Open the file results are written to
+
+    :param year: int - year in format YYYY e.g 2019
+    :param output_format: str - 'csv' or 'parquet'. Parquet results are a dataset with one directory per year
+    :return: CsvResultSink or ParquetResultSink
+    '''
+    if output_format == 'parquet':
+        return ParquetResultSink(results_partition_path('/home/cdsw/player_tournament_results', year))
+    return CsvResultSink(f'/home/cdsw/player_tournament_results_{year}_.csv')
+
+
+def open_season_sinks(years, output_format='csv', store=None):
+    '''
+    Open the files results of each season are written to
+
+    :param years: list of int - years in format YYYY
+    :param output_format: str - 'csv' or 'parquet'
+    :param store: LocalStore - also upsert results into the store. None writes the files only
+    :return: SeasonResultSinks - a csv per year, or a partition per year of the Parquet dataset
+    '''
+    if store is not None:
+        return SeasonResultSinks(lambda year: TeeResultSink([open_result_sink(year, output_format),
+                                                             StoreResultSink(store, year)]), years)
+    return SeasonResultSinks(lambda year: open_result_sink(year, output_format), years)
+
+
+def parse_years(text):
+    '''
+    :param text: str - year e.g '2019', range e.g '2016-2024' or list e.g '2016,2018,2020'
+    :return: list of int - years in format YYYY
+    '''
+    years = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            years.extend(range(int(first), int(last) + 1))
+        else:
+            years.append(int(part))
+    return years
+
+
+def tournament_season(tour_meta, years):
+    '''
+    :param tour_meta: dict - tournament meta with tour_dates e.g '01/01/2019 to 02/01/2019'
+    :param years: list of int - seasons being collected
+    :return: int - the only season, or with several the year the tournament ends in (first season if not shown)
+    '''
+    if len(years) == 1:
+        return years[0]
+    found = re.findall(r'\d{4}', str(tour_meta.get('tour_dates', '')))
+    return int(found[-1]) if found else years[0]
+
+
+def references_path(years):
+    '''
+    :param years: list of int - seasons collected
+    :return: str - references csv of the crawl - TSID mappings don't depend on the season, one csv covers them all
+    '''
+    seasons = str(years[0]) if len(years) == 1 else f'{years[0]}-{years[-1]}'
+    return f'/home/cdsw/player_tournament_results_references_{seasons}_.csv'
+
+
+def collect_player_results(name, url, ranking_index, tsid_resolver, year, seen_matches=None):
+    '''
+    Collect all tournament results for one player - blocking, safe to run in a worker thread
+
+    :param name: str - Player name
+    :param url: str - profile url from tournament software
+    :param ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param year: int - year in format YYYY e.g 2019
+    :param seen_matches: SeenMatches - matches already extracted from other players' pages, skipped
+    :return: list of MatchRecord - match results, None if the results could not be collected
+    '''
+    ply = Player(url, name, ranking_index, tsid_resolver, seen_matches)
+    try:
+        results = ply.get_tournament_results(year)
+    except CacheMiss as e:
+        # Replay mode - page was never downloaded
+        print(f'No cached results page for: {name} in {year}')
+        record_failure('player', e, player=name, url=url, year=year)
+    except FetchError as e:
+        # Skip player rather than save partial results
+        print(f'Failed to collect results for: {name} in {year} - {e}')
+        record_failure('player', e, player=name, url=url, year=year)
+    else:
+        # Later players skip the matches this player claimed from now on
+        if seen_matches is not None:
+            seen_matches.settle()
+        return results
+    # Let other players pick up the matches this player claimed
+    if seen_matches is not None:
+        seen_matches.release(ply.claimed_keys)
+    return None
+
+
+def record_player_results(journal, key, results, tsid_resolver):
+    '''
+    Journal a completed player or tournament with the TSID mappings found since the last one was journaled
+
+    :param journal: CrawlJournal - None if not journaling
+    :param key: str - player or tournament key
+    :param results: list of MatchRecord - match results, None if the unit failed
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :return: list of MatchRecord - results to write, empty if the unit failed
+    '''
+    if results is None:
+        # Not journaled - retried when the crawl is resumed
+        incr('units.failed')
+        return []
+    incr('units.completed')
+    if journal is not None:
+        journal.record(key, results, tsid_resolver.pop_new_entries())
+    return results
+
+
+def collect_tournament_results(tour_meta, ranking_index, tsid_resolver, seen_matches=None):
+    '''
+    Collect all match results of one tournament - blocking, safe to run in a worker thread
+
+    :param tour_meta: dict - {'tournament': name, 'tournament_id': id, 'location': loc, 'tour_dates': date}
+    :param ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param seen_matches: SeenMatches - matches already extracted, skipped
+    :return: list of MatchRecord - match results, None if the results could not be collected
+    '''
+    crawler = TournamentCrawler(tour_meta, ranking_index, tsid_resolver, seen_matches)
+    try:
+        results = crawler.collect_all_results()
+    except CacheMiss as e:
+        # Replay mode - page was never downloaded
+        print(f'No cached pages for tournament: {tour_meta["tournament"]}')
+        record_failure('tournament', e, tournament=tour_meta['tournament'], tournament_id=tour_meta['tournament_id'])
+    except FetchError as e:
+        # Skip tournament rather than save partial results
+        print(f'Failed to collect results for tournament: {tour_meta["tournament"]} - {e}')
+        record_failure('tournament', e, tournament=tour_meta['tournament'], tournament_id=tour_meta['tournament_id'])
+    else:
+        if seen_matches is not None:
+            seen_matches.settle()
+        return results
+    if seen_matches is not None:
+        seen_matches.release(crawler.claimed_keys)
+    return None
+
+
+def unit_claims(seen_matches, unit_idx):
+    '''
+    :param seen_matches: SeenMatches - None if not de-duplicating
+    :param unit_idx: int - position of the unit of work in the crawl
+    :return: OwnedClaims - matches claimed by the unit are owned by its index, so an earlier unit crawled
+                           concurrently takes them over as in a sequential crawl. None if seen_matches is None
+    '''
+    return seen_matches.for_owner(unit_idx) if seen_matches is not None else None
+
+
+def player_units(ranking_index, tsid_resolver, years, seen_matches=None):
+    '''
+    Units of work for a player-centric crawl - one per row of the ranking table and season.
+    A player's seasons are consecutive units, so all seasons are crawled as one pool of work
+
+    :param years: list of int - years in format YYYY
+    :return: list of tuples (journal key, description, collect callable, collect args, season)
+    '''
+    total = len(ranking_index)
+    rows = [(idx, row, year) for idx, row in enumerate(ranking_index.rows) for year in years]
+    return [(CrawlJournal.player_key(idx, row['Profile_url'], year),
+             f'{row["Player"]}, player {idx + 1} of {total}' + (f' in {year}' if len(years) > 1 else ''),
+             collect_player_results,
+             (row['Player'], row['Profile_url'], ranking_index, tsid_resolver, year,
+              unit_claims(seen_matches, unit_idx)),
+             year)
+            for unit_idx, (idx, row, year) in enumerate(rows)]
+
+
+def tournament_units(tournaments, ranking_index, tsid_resolver, seen_matches=None, years=None):
+    '''
+    Units of work for a tournament-centric crawl - one per tournament
+
+    :param tournaments: list of dict - tournament meta, see tournament_crawler.load_tournaments
+    :param years: list of int - seasons being collected. With one season every tournament's results are written
+                                to it, with more each tournament goes to the season its tour_dates end in
+    :return: list of tuples (journal key, description, collect callable, collect args, season)
+    '''
+    years = years or [None]
+    total = len(tournaments)
+    return [(CrawlJournal.tournament_key(tour_meta['tournament_id']),
+             f'{tour_meta["tournament"]}, tournament {idx + 1} of {total}',
+             collect_tournament_results,
+             (tour_meta, ranking_index, tsid_resolver, unit_claims(seen_matches, idx)),
+             tournament_season(tour_meta, years))
+            for idx, tour_meta in enumerate(tournaments)]
+
+
+async def crawl_async(units, tsid_resolver, max_in_flight, sinks, journal=None, seen_matches=None):
+    '''
+    Collect results for every unit of work with up to max_in_flight units being fetched at once.
+    requests is blocking, so each unit is crawled in a worker thread and awaited from the event loop.
+    Each unit's results are written to its season's sink, and journaled, as soon as every unit before it
+    has been written, so the output is in the same order as units. Matches an earlier unit that completed
+    also has are dropped from a unit's results then, so each match is written by the same unit as in crawl -
+    including a match whose earlier owner failed, as the unit keeps its copy until then.
+
+    :param units: list of tuples - from player_units or tournament_units
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param max_in_flight: int - maximum number of units crawled concurrently
+    :param sinks: SeasonResultSinks - destination of match results
+    :param journal: CrawlJournal - units completed by a previous run are read from here, not fetched
+    :param seen_matches: SeenMatches - shared by the units, None if not de-duplicating
+    '''
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    # Units finished out of order, waiting for earlier units to be written
+    finished = {}
+    next_idx = 0
+
+    async def crawl_one(idx, key, description, collect, args, season):
+        nonlocal next_idx
+        if journal is not None and journal.is_complete(key):
+            incr('units.journaled')
+            finished[idx] = key, season, journal.get_results(key), True
+        else:
+            async with semaphore:
+                print(f'Collecting Results for {description}')
+                results = await loop.run_in_executor(executor, collect, *args)
+            finished[idx] = key, season, results, False
+        while next_idx in finished:
+            key, season, results, journaled = finished.pop(next_idx)
+            if not journaled:
+                if results is not None and seen_matches is not None:
+                    # Every earlier unit completed or released its claims - ownership of this unit's matches is final
+                    results = [record for record in results
+                               if seen_matches.owns(SeenMatches.record_key(record), next_idx)]
+                results = record_player_results(journal, key, results, tsid_resolver)
+            sinks.write_many(results, season)
+            next_idx += 1
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        await asyncio.gather(*[crawl_one(idx, *unit) for idx, unit in enumerate(units)])
+
+
+def crawl(units, tsid_resolver, sinks, journal=None):
+    '''
+    Collect results for every unit of work one at a time
+
+    :param units: list of tuples - from player_units or tournament_units
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param sinks: SeasonResultSinks - destination of match results
+    :param journal: CrawlJournal - units completed by a previous run are read from here, not fetched
+    '''
+    for key, description, collect, args, season in units:
+        if journal is not None and journal.is_complete(key):
+            incr('units.journaled')
+            sinks.write_many(journal.get_results(key), season)
+            continue
+        print(f'Collecting Results for {description}')
+        results = collect(*args)
+        sinks.write_many(record_player_results(journal, key, results, tsid_resolver), season)
+
+
+def queue_tasks(ranking_index, years, tournaments=None):
+    '''
+    Units of work for a distributed crawl - the keys, seasons and order of player_units or tournament_units,
+    with a json payload each worker rebuilds its unit from. Player units refer to rows of the ranking table,
+    so every worker must read the same ranking csv
+
+    :param years: list of int - years in format YYYY
+    :param tournaments: list of dict - tournament meta for a tournament-centric crawl. None crawls players
+    :return: list of tuples (key, season, payload) - see WorkQueue.add_units
+    '''
+    if tournaments is not None:
+        return [(CrawlJournal.tournament_key(tour_meta['tournament_id']), tournament_season(tour_meta, years),
+                 {'tour_meta': tour_meta})
+                for tour_meta in tournaments]
+    return [(CrawlJournal.player_key(idx, row['Profile_url'], year), year, {'row': idx, 'year': year})
+            for idx, row in enumerate(ranking_index.rows) for year in years]
+
+
+def leased_unit(lease, ranking_index, tsid_resolver, seen_matches):
+    '''
+    :param lease: Lease - unit leased from the work queue
+    :return: tuple (description, collect callable, collect args)
+    '''
+    if 'tour_meta' in lease.payload:
+        tour_meta = lease.payload['tour_meta']
+        return (tour_meta['tournament'], collect_tournament_results,
+                (tour_meta, ranking_index, tsid_resolver, seen_matches))
+    row = ranking_index.rows[lease.payload['row']]
+    year = lease.payload['year']
+    return (f'{row["Player"]} in {year}', collect_player_results,
+            (row['Player'], row['Profile_url'], ranking_index, tsid_resolver, year, seen_matches))
+
+
+def run_worker(queue, ranking_index, tsid_resolver, seen_matches, worker_id, max_in_flight=1, poll_interval=5):
+    '''
+    Lease units from the work queue and collect them until every unit is done or failed.
+    Leases are heartbeated while the worker runs. A unit that can't be collected is given back to be retried,
+    by this or another worker. Exits once no unit is pending and no other worker holds a lease that could expire
+
+    :param queue: WorkQueue - shared queue of units
+    :param worker_id: str - unique id of this worker
+    :param max_in_flight: int - units collected concurrently
+    :param poll_interval: float - seconds between looks for work while other workers hold the remaining units
+    '''
+    # Start from what other workers have already found
+    for tour_ref, tour_player_id, tsid in queue.iter_tsids():
+        tsid_resolver.add(tour_ref, tour_player_id, tsid)
+    tsid_resolver.pop_new_entries()
+    for _, _, results in queue.iter_results():
+        for record in results:
+            key = SeenMatches.record_key(record)
+            if key is not None:
+                seen_matches.claim(key)
+
+    running = {}
+    with LeaseKeeper(queue, worker_id), ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            for lease in queue.lease(worker_id, max_in_flight - len(running)):
+                description, collect, args = leased_unit(lease, ranking_index, tsid_resolver, seen_matches)
+                print(f'Collecting Results for {description} (attempt {lease.attempt})')
+                running[executor.submit(collect, *args)] = lease
+            if not running:
+                if queue.is_finished():
+                    break
+                # Remaining units are leased to other workers - picked up here if their leases expire
+                time.sleep(poll_interval)
+                continue
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                lease = running.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    record_failure('unit', e, key=lease.key)
+                    results = None
+                    error = repr(e)
+                else:
+                    error = 'results could not be collected'
+                if results is None:
+                    incr('units.failed')
+                    queue.fail(lease, error)
+                    continue
+                # Mappings found by every unit in flight - stored with whichever unit completes first
+                tsid_entries = tsid_resolver.pop_new_entries()
+                if queue.complete(lease, results, tsid_entries):
+                    incr('units.completed')
+                else:
+                    # Lease expired and was taken over - the new holder must be able to claim these matches,
+                    # and the mappings go with the next unit this worker completes
+                    incr('units.lost')
+                    tsid_resolver.restore_new_entries(tsid_entries)
+                    seen_matches.release([SeenMatches.record_key(record) for record in results])
+    print(f'Worker {worker_id} finished - {queue.counts()}')
+
+
+def merge_queue(queue, years, output_format='csv', store=None):
+    '''
+    Write the results and TSID mappings of every completed unit, as a single crawl would have -
+    results to each season's file or partition in unit order, without matches already written by an
+    earlier unit, and one references csv
+
+    :param queue: WorkQueue - queue every worker has finished
+    :param years: list of int - years in format YYYY
+    :param output_format: str - 'csv' or 'parquet'
+    :param store: LocalStore - also upsert results and TSID mappings into the store
+    '''
+    if not queue.is_finished():
+        print(f'Units still to collect - merging those done so far: {queue.counts()}')
+    seen_matches = SeenMatches()
+    with open_season_sinks(years, output_format, store) as sinks:
+        for key, season, results in queue.iter_results():
+            sinks.write_many([record for record in results
+                              if SeenMatches.record_key(record) is None
+                              or seen_matches.claim(SeenMatches.record_key(record))], season)
+    tsid_resolver = TsidResolver()
+    for tour_ref, tour_player_id, tsid in queue.iter_tsids():
+        tsid_resolver.add(tour_ref, tour_player_id, tsid)
+    tsid_resolver.to_csv(references_path(years))
+    if store is not None:
+        store.upsert_resolver(tsid_resolver)
+    for key, attempts, error in queue.failures():
+        print(f'Failed after {attempts} attempts: {key} - {error}')
+    print(f'Merged {sinks.rows_written} results')
+
+
+def main(year=2019, max_in_flight=None, cache_dir=None, replay=False, journal_path=None, tournaments_csv=None,
+         parser=None, parse_workers=None, output_format='csv', base_url=None, metrics_path=None,
+         metrics_interval=30, failures_path=None, max_rate=10, max_concurrency=16, years=None, queue_path=None,
+         queue_role='work', worker_id=None, lease_seconds=300, store_path=None, rankings_path=None):
+    '''
+    Collect tournament results for all ranked players, or for a list of tournaments
+
+    :param year: int - year in format YYYY e.g 2019
+    :param max_in_flight: int - players to crawl concurrently. None crawls one player at a time
+    :param cache_dir: str - directory for the on-disk response cache. None disables caching
+    :param replay: bool - only parse pages already in cache_dir, never touch the network
+    :param journal_path: str - crawl journal. Each completed player is saved here and a restarted
+                               crawl resumes from the first player not in the journal
+    :param tournaments_csv: str - csv of tournaments (tournament, tournament_id, location, tour_dates) e.g a
+                                  previous results csv. If given each tournament is crawled once instead of
+                                  crawling every player's tournament pages
+    :param parser: str - BeautifulSoup tree builder, 'lxml' or 'html.parser'. None uses lxml if installed
+    :param parse_workers: int - number of processes pages are parsed in. None parses in the crawling threads.
+                                TSIDs are resolved and matches de-duplicated in this process either way
+    :param output_format: str - 'csv' or 'parquet'
+    :param base_url: str - host to fetch pages from e.g a mock_server 'http://localhost:8000'. None fetches from
+                           SITE_URL. Urls in the results and response cache are unchanged
+    :param metrics_path: str - json file crawl metrics are written to every metrics_interval seconds and at the end
+    :param metrics_interval: float - seconds between metrics dumps
+    :param failures_path: str - json lines file a record of every failed fetch, match, TSID, player or
+                                tournament is appended to
+    :param max_rate: float - requests per second to the site. None or 0 for no limit
+    :param max_concurrency: int - most requests in flight to the site. Requests in flight start low and grow
+                                  while the site responds quickly, backing off on 429s, errors and slow responses
+    :param years: list of int - seasons to collect in one crawl, instead of year. Every (player, season) page is
+                                crawled as one pool of work sharing TSID look ups, and each season's results are
+                                written to their own file or partition
+    :param queue_path: str - SQLite work queue shared by workers on several nodes. None crawls in this process only
+    :param queue_role: str - with queue_path, 'enqueue' adds the crawl's units to the queue, 'work' leases and
+                             collects units until the queue is finished, 'merge' writes the results of the
+                             finished queue
+    :param worker_id: str - unique id of this worker, default host:pid
+    :param lease_seconds: float - time a worker holds a unit without heartbeating, before it's retried elsewhere
+    :param store_path: str - LocalStore SQLite database results and TSID mappings are also upserted into, and
+                             TSIDs found by earlier crawls are read from. None writes the csv or parquet only
+    :param rankings_path: str - ranking table written by scrapper.py, csv or parquet. None reads
+                                /home/cdsw/player_rankings_2019 in whichever format it was written
+    '''
+    years = list(years) if years else [year]
+    # First - on Python 3.6 parser processes are forked, before the metrics reporter or any fetch thread starts
+    configure_parse_pool(parse_workers)
+    configure_metrics(metrics_path, metrics_interval, failures_path)
+    configure_base_url(base_url)
+    configure_rate_limiter(max_rate=max_rate, max_concurrency=max_concurrency)
+    configure_parser(parser)
+    if cache_dir:
+        configure_cache(cache_dir, replay=replay)
+
+    df_player_table = load_table(rankings_path or find_table('/home/cdsw/player_rankings_2019'))
     # player ref not available without generating
     df_player_table['Id'] = df_player_table.Profile_url.apply(lambda x: x.split('player-profile/')[-1])
+    # Index ranking table once - used to resolve TSIDs without filtering the DataFrame
+    ranking_index = RankingIndex(df_player_table)
+
+    store = LocalStore(store_path) if store_path else None
+    # tour results - (tour_ref, tour_player_id) -> tsid shared by every player
+    tsid_resolver = store.tsid_resolver() if store is not None else TsidResolver()
+    # (tournament_id, draw_id, match_id) of matches already extracted
+    seen_matches = SeenMatches()
+
+    if queue_path:
+        queue = WorkQueue(queue_path, lease_seconds)
+        if queue_role == 'enqueue':
+            tournaments = load_tournaments(tournaments_csv) if tournaments_csv else None
+            print(f'Queued {queue.add_units(queue_tasks(ranking_index, years, tournaments))} units - {queue.counts()}')
+        elif queue_role == 'merge':
+            merge_queue(queue, years, output_format, store)
+        else:
+            run_worker(queue, ranking_index, tsid_resolver, seen_matches, worker_id or default_worker_id(),
+                       max_in_flight or 1)
+        queue.close()
+    else:
+        journal = None
+        if journal_path:
+            journal = CrawlJournal(journal_path)
+            for tour_ref, tour_player_id, tsid in journal.load():
+                tsid_resolver.add(tour_ref, tour_player_id, tsid)
+            # Already journaled
+            tsid_resolver.pop_new_entries()
+            for key in journal.match_keys:
+                if key is not None:
+                    seen_matches.claim(key)
+            if len(journal):
+                print(f'Resuming crawl - {len(journal)} already collected')
 
-    all_results = []
+        if tournaments_csv:
+            units = tournament_units(load_tournaments(tournaments_csv), ranking_index, tsid_resolver, seen_matches,
+                                     years)
+        else:
+            units = player_units(ranking_index, tsid_resolver, years, seen_matches)
 
-    total = df_player_table.shape[0]
+        # Results are written as each player completes
+        with open_season_sinks(years, output_format, store) as sinks:
+            if max_in_flight:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_until_complete(crawl_async(units, tsid_resolver, max_in_flight, sinks, journal,
+                                                        seen_matches))
+                finally:
+                    loop.close()
+            else:
+                crawl(units, tsid_resolver, sinks, journal)
 
-    # df tour results
-    df_tour_res = pd.DataFrame.from_dict({'tsid': [], 'tour_ref': [], 'tour_player_id': []})
-    df_tour_res = df_tour_res.astype('object')
-    for row in df_player_table.iterrows():
-        print(f'Collecting Results for {row[1].Player}, player {row[0] + 1} of {total}')
-        name, url = row[1].loc[['Player', 'Profile_url']]
-        ply = Player(url, name, df_player_table, df_tour_res)
-        # list of dictionaries
-        ply_results = ply.get_tournament_results(2019)
-        all_results += ply_results
-        # Update tour results dataframe
-        df_tour_res = ply.get_df_tour_res()
-        df_tour_res.drop_duplicates(inplace=True)
+        if journal is not None:
+            journal.close()
+        tsid_resolver.to_csv(references_path(years))
+        if store is not None:
+            store.upsert_resolver(tsid_resolver)
 
-    df_all_results = pd.DataFrame.from_dict(all_results)
-    df_all_results.to_csv('/home/cdsw/player_tournament_results_2019_.csv', index=False)
-    df_tour_res.to_csv('/home/cdsw/player_tournament_results_references_2019_.csv', index=False)
+    if store is not None:
+        store.close()
+    shutdown_parse_pool()
+    stop_metrics()
+    print(get_metrics().summary())
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Collect tournament results for all ranked players')
+    parser.add_argument('--year', type=int, default=2019)
+    parser.add_argument('--years', type=parse_years, default=None,
+                        help='seasons to collect in one crawl e.g 2016-2024 or 2017,2019 (default: --year)')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='number of players (or tournaments) to crawl at once (default: one at a time)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory to cache downloaded pages in')
+    parser.add_argument('--replay', action='store_true',
+                        help='re-run parsers over pages in --cache-dir without fetching')
+    parser.add_argument('--journal', default=None,
+                        help='crawl journal file - a restarted crawl resumes from where it stopped')
+    parser.add_argument('--tournaments', default=None,
+                        help='csv of tournaments to crawl once each, instead of crawling every player')
+    parser.add_argument('--parser', default=None, choices=['lxml', 'html.parser'],
+                        help='html parser (default: lxml if installed)')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='number of processes to parse pages in (default: parse in the crawling threads)')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'],
+                        help='results file format (default: csv)')
+    parser.add_argument('--base-url', default=None,
+                        help='host to fetch pages from e.g a mock_server http://localhost:8000 (default: the live site)')
+    parser.add_argument('--metrics', default=None,
+                        help='json file crawl metrics are written to periodically (default: printed at the end only)')
+    parser.add_argument('--metrics-interval', type=float, default=30,
+                        help='seconds between metrics dumps (default: 30)')
+    parser.add_argument('--failures', default=None,
+                        help='json lines file a record of every failure is appended to')
+    parser.add_argument('--queue', default=None,
+                        help='SQLite work queue shared by workers on several nodes (default: crawl in this process)')
+    parser.add_argument('--role', default='work', choices=['enqueue', 'work', 'merge'],
+                        help='with --queue: add units, collect units, or write the results (default: work)')
+    parser.add_argument('--worker-id', default=None, help='unique worker id (default: host:pid)')
+    parser.add_argument('--lease-seconds', type=float, default=300,
+                        help='seconds a unit stays leased to a worker that stops heartbeating (default: 300)')
+    parser.add_argument('--store', default=None,
+                        help='SQLite store results and TSID mappings are also written to (see local_store.py)')
+    parser.add_argument('--rankings', default=None,
+                        help='ranking table from scrapper.py, csv or parquet '
+                             '(default: /home/cdsw/player_rankings_2019.csv, or .parquet if only that exists)')
+    parser.add_argument('--max-rate', type=float, default=10,
+                        help='requests per second to the site, 0 for no limit (default: 10)')
+    parser.add_argument('--max-concurrency', type=int, default=16,
+                        help='most requests in flight to the site - adapted below this to how the site '
+                             'responds (default: 16)')
+    args = parser.parse_args()
+    main(args.year, args.concurrency, args.cache_dir, args.replay, args.journal, args.tournaments, args.parser,
+         args.parse_workers, args.format, args.base_url, args.metrics, args.metrics_interval, args.failures,
+         args.max_rate, args.max_concurrency, args.years, args.queue, args.role, args.worker_id,
+         args.lease_seconds, args.store, args.rankings)
@@ -0,0 +1,242 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from match_record import CATEGORY_COLUMNS, SCORE_COLUMNS, MatchTable
+from result_sink import RESULT_COLUMNS
+
+# Match results - repeated strings dictionary encoded, scores list<int32>, everything else string
+RESULTS_SCHEMA = pa.schema([
+    pa.field(col, pa.dictionary(pa.int32(), pa.string()) if col in CATEGORY_COLUMNS
+             else pa.list_(pa.int32()) if col in SCORE_COLUMNS
+             else pa.string())
+    for col in RESULT_COLUMNS])
+
+# Ranking table columns - dictionary encoded and numeric. All other columns are strings
+RANKING_CATEGORY_COLUMNS = ['Category', 'County', 'region']
+RANKING_NUMERIC_COLUMNS = ['Rank', 'Year of birth', 'Points', 'Total points', 'Tournaments']
+
+
+def results_partition_path(root, year, part=0):
+    """
+    path of a part of the results dataset - one directory per season, read back with the year column
+    :param root: str - dataset directory
+    :param year: int - year in format YYYY e.g 2019
+    :param part: int - part number within the season
+    :return: str - root/year=YYYY/part-NNNNN.parquet
+    """
+    return os.path.join(root, f'year={year}', f'part-{part:05d}.parquet')
+
+
+def _str_or_none(value):
+    """ids are strings - TSIDs read from the ranking csv may be numbers"""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def match_table_to_arrow(table):
+    """
+    :param table: MatchTable
+    :return: pyarrow.Table - RESULTS_SCHEMA
+    """
+    arrays = []
+    for column in RESULT_COLUMNS:
+        if column in CATEGORY_COLUMNS:
+            codes = np.asarray(table.codes(column), dtype='int32')
+            indices = pa.array(codes, mask=codes < 0, type=pa.int32())
+            dictionary = pa.array([str(value) for value in table.categories(column)], type=pa.string())
+            arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+        elif column in SCORE_COLUMNS:
+            arrays.append(pa.array([list(value) if value is not None else None for value in table.column(column)],
+                                   type=pa.list_(pa.int32())))
+        else:
+            arrays.append(pa.array([_str_or_none(value) for value in table.column(column)], type=pa.string()))
+    return pa.Table.from_arrays(arrays, schema=RESULTS_SCHEMA)
+
+
+class ParquetResultSink:
+    """
+    Write match records to a Parquet file as they are collected - same interface as CsvResultSink
+
+    Records are buffered in a MatchTable and written as a row group every row_group_size records,
+    so memory is bounded by one row group.
+
+        with ParquetResultSink(results_partition_path(root, 2019)) as sink:
+            sink.write_many(records)
+    """
+
+    def __init__(self, path, row_group_size=50000):
+        """
+        instantiate ParquetResultSink class
+        :param path: str - path to parquet file, parent directories are created
+        :param row_group_size: int - records per row group
+        """
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._table = MatchTable()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._writer = pq.ParquetWriter(path, RESULTS_SCHEMA)
+
+    def write(self, record):
+        """
+        :param record: MatchRecord or dict - match record
+        """
+        self._table.append(record)
+        self.rows_written += 1
+        if len(self._table) >= self.row_group_size:
+            self._write_row_group()
+
+    def write_many(self, records):
+        """
+        :param records: iterable of MatchRecord or dict - match records
+        """
+        for record in records:
+            self.write(record)
+
+    def _write_row_group(self):
+        if len(self._table):
+            self._writer.write_table(match_table_to_arrow(self._table))
+            self._table = MatchTable()
+
+    def flush(self):
+        """write buffered records as a row group"""
+        self._write_row_group()
+
+    def close(self):
+        if self._writer is not None:
+            self._write_row_group()
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_rankings(df_rank_results, path):
+    """
+    write ranking table to Parquet - numeric columns as numbers, repeated columns dictionary encoded
+    :param df_rank_results: DataFrame - ranking results, see scrapper.generateResultsDF
+    :param path: str - path to parquet file
+    """
+    arrays = []
+    for column in df_rank_results.columns:
+        values = df_rank_results[column]
+        if column in RANKING_NUMERIC_COLUMNS:
+            try:
+                values = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                # Unexpected text in column - keep as scraped
+                pass
+        if values.dtype == object:
+            array = pa.array([_str_or_none(v) if v == v else None for v in values], type=pa.string())
+        else:
+            array = pa.array(np.asarray(values), mask=values.isnull().values)
+        if column in RANKING_CATEGORY_COLUMNS:
+            array = array.dictionary_encode()
+        arrays.append(array)
+    pq.write_table(pa.Table.from_arrays(arrays, names=[str(col) for col in df_rank_results.columns]), path)
+
+
+def _dictionary_to_categorical(column):
+    """
+    :param column: pyarrow.ChunkedArray - dictionary encoded
+    :return: Categorical - built from the indices of each chunk, the dictionary values are only boxed once
+    """
+    categories = []
+    positions = {}
+    codes = []
+    for chunk in column.chunks:
+        # Chunks from different files of a dataset have their own dictionary - map each onto one set of categories
+        mapping = np.array([positions.setdefault(value, len(positions)) for value in chunk.dictionary.to_pylist()]
+                           + [-1], dtype='int64')
+        indices = chunk.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype('int64')
+        # -1 (null) maps to the last entry of mapping, which is -1
+        codes.append(mapping[indices])
+    categories.extend(positions)
+    return pd.Categorical.from_codes(np.concatenate(codes) if codes else np.array([], dtype='int64'), categories)
+
+
+def _numeric_to_numpy(column):
+    """
+    :param column: pyarrow.ChunkedArray - integer or floating point
+    :return: numpy array - float with nan where there are nulls
+    """
+    if not column.num_chunks:
+        return np.array([], dtype=column.type.to_pandas_dtype())
+    return np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in column.chunks])
+
+
+def _to_dataframe(table):
+    """
+    convert without pyarrow's pandas integration (which needs a newer pandas than the pinned 0.20) -
+    dictionary columns become categoricals from their codes, numeric columns numpy arrays (float where there
+    are nulls), list columns lists
+    :param table: pyarrow.Table
+    :return: DataFrame
+    """
+    data = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_dictionary(column.type):
+            data[name] = _dictionary_to_categorical(column)
+        elif pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+            data[name] = _numeric_to_numpy(column)
+        else:
+            data[name] = column.to_pylist()
+    return pd.DataFrame(data, columns=table.column_names)
+
+
+def read_parquet(path, columns=None):
+    """
+    read match results or rankings written here. Only the columns asked for are read from disk.
+    :param path: str - parquet file, or dataset directory e.g results root with a year=YYYY directory per season
+    :param columns: list of str - columns to read, None reads all. A dataset's partition column (year) can be asked for
+    :return: DataFrame
+    """
+    return _to_dataframe(pq.read_table(path, columns=columns))
+
+
+def drop_duplicate_rows(df):
+    """
+    DataFrame.drop_duplicates - also works for score lists read from Parquet, which are compared as tuples
+    :param df: DataFrame
+    :return: DataFrame - first of each set of identical rows
+    """
+    list_columns = [col for col in df.columns if df[col].dtype == object
+                    and df[col].map(lambda v: isinstance(v, list)).any()]
+    if not list_columns:
+        return df.drop_duplicates()
+    keys = df.copy()
+    for col in list_columns:
+        keys[col] = keys[col].map(lambda v: tuple(v) if isinstance(v, list) else v)
+    return df[~keys.duplicated()]
+
+
+def find_table(stem):
+    """
+    path of a table written as csv or Parquet e.g by scrapper.py --format
+    :param stem: str - path without extension e.g /home/cdsw/player_rankings_2019
+    :return: str - stem.csv, or stem.parquet if only that exists
+    """
+    if not os.path.exists(stem + '.csv') and os.path.exists(stem + '.parquet'):
+        return stem + '.parquet'
+    return stem + '.csv'
+
+
+def load_table(path, columns=None):
+    """
+    read a csv or Parquet table
+    :param path: str - .csv file, or parquet file / dataset directory
+    :param columns: list of str - columns to read, None reads all
+    :return: DataFrame
+    """
+    if path.endswith('.csv'):
+        return pd.read_csv(path, usecols=columns)
+    return read_parquet(path, columns)
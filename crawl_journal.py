@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from match_record import MatchRecord
+from seen_matches import SeenMatches
+
+
+def json_default(value):
+    """serialise match records as match dicts and numpy scalars (e.g TSIDs read from the ranking csv) as python values"""
+    if isinstance(value, MatchRecord):
+        return value.to_dict()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class CrawlJournal:
+    """
+    Append-only journal of completed players (or tournaments), used to resume an interrupted crawl
+
+    Each line of the journal is json for one completed unit of work:
+
+        {"key": "...", "results": [match records], "tsids": [[tour_ref, tour_player_id, tsid], ...]}
+
+    A line is flushed and fsynced before the player is treated as done, so a crash can lose at most
+    the players in flight. On restart load() returns the TSID mappings found so far and records where
+    each completed player's results are, so they can be re-emitted without fetching them again.
+    The keys of the journaled matches are kept in match_keys to rebuild the set of seen matches.
+    A partially written last line (crash mid-write) is ignored.
+    """
+
+    def __init__(self, path):
+        """
+        instantiate CrawlJournal class
+        :param path: str - path to journal file, created if missing
+        """
+        self.path = path
+        self._offsets = {}
+        self.match_keys = []
+        self._lock = threading.Lock()
+        self._file = None
+
+    @staticmethod
+    def player_key(idx, url, year):
+        """
+        key of a player in the journal
+        :param idx: int - row of player in ranking table
+        :param url: str - profile url
+        :param year: int - year in format YYYY
+        :return: str
+        """
+        return f'{idx}|{url}|{year}'
+
+    @staticmethod
+    def tournament_key(tournament_id):
+        """
+        key of a tournament in the journal - tournament-centric crawl
+        :param tournament_id: str - tournament id
+        :return: str
+        """
+        return f'tournament|{tournament_id}'
+
+    def load(self):
+        """
+        read the journal left by a previous run
+        :return: list of tuples (tour_ref, tour_player_id, tsid) - TSID mappings found so far
+        """
+        tsid_entries = []
+        if not os.path.exists(self.path):
+            return tsid_entries
+        valid_size = 0
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('Incomplete line')
+                    entry = json.loads(line)
+                except ValueError:
+                    # Truncated write from a crash - everything after it is discarded
+                    break
+                self._offsets[entry['key']] = offset
+                tsid_entries += [tuple(mapping) for mapping in entry['tsids']]
+                self.match_keys += [SeenMatches.record_key(record) for record in entry['results']]
+                offset += len(line)
+                valid_size = offset
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_size)
+        return tsid_entries
+
+    def is_complete(self, key):
+        """
+        :param key: str - player key
+        :return: bool - True if player results were journaled by a previous run
+        """
+        return key in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def get_results(self, key):
+        """
+        read journaled results for a completed player
+        :param key: str - player key
+        :return: list of dict - match records
+        """
+        with self._lock, open(self.path, 'rb') as f:
+            f.seek(self._offsets[key])
+            return json.loads(f.readline())['results']
+
+    def record(self, key, results, tsid_entries):
+        """
+        durably record a completed player
+        :param key: str - player key
+        :param results: list of MatchRecord or dict - match records
+        :param tsid_entries: list of tuples (tour_ref, tour_player_id, tsid) - new TSID mappings
+        """
+        line = json.dumps({'key': key, 'results': results, 'tsids': [list(e) for e in tsid_entries]},
+                          default=json_default) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            self._offsets[key] = self._file.tell()
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Upper bounds in seconds of histogram buckets - fetches take 10s of ms to seconds, parses ms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _round(value):
+    return round(value, 6) if value is not None else None
+
+
+class Histogram:
+    """
+    Distribution of observed values - count per bucket, plus count, sum, min and max.
+    Not thread safe on its own - updated under the CrawlMetrics lock
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        instantiate Histogram class
+        :param buckets: tuple of float - ascending bucket upper bounds. Larger values are counted in a last bucket
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        :param q: float - e.g 0.95
+        :return: float - upper bound of the bucket the q quantile falls in, None if nothing observed
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': round(self.total, 6),
+                'mean': round(self.total / self.count, 6) if self.count else None,
+                'min': _round(self.min),
+                'max': _round(self.max),
+                'p50': _round(self.quantile(0.5)),
+                'p95': _round(self.quantile(0.95)),
+                'p99': _round(self.quantile(0.99)),
+                'buckets': {str(bound): count for bound, count in zip(self.buckets + ('inf',), self.counts)}}
+
+
+class CrawlMetrics:
+    """
+    Counters, timing histograms and failure records of a crawl - shared by every fetch and parse thread
+
+    Names are dotted by stage e.g 'fetch.bytes', 'parse.parse_results_page', 'tsid.profile_scrape'.
+    Gauges are functions returning current state e.g of the rate limiter, called on each snapshot.
+    Failures are kept as records of the stage, error and url or ids involved - the last max_failures are
+    held in memory, and every failure is appended to failures_path as a json line if one is given.
+    """
+
+    def __init__(self, max_failures=1000, failures_path=None):
+        """
+        instantiate CrawlMetrics class
+        :param max_failures: int - failure records kept in memory
+        :param failures_path: str - json lines file every failure record is appended to. None keeps them in memory only
+        """
+        self.failures_path = failures_path
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._counters = Counter()
+        self._histograms = {}
+        self._failures = deque(maxlen=max_failures)
+        self._failure_counts = Counter()
+        self.gauges = {}
+
+    def register_gauge(self, name, fn):
+        """
+        :param name: str - gauge name
+        :param fn: function - no arguments, returns json serialisable state
+        """
+        self.gauges[name] = fn
+
+    def incr(self, name, value=1):
+        """
+        :param name: str - counter name
+        :param value: int - amount added
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, value):
+        """
+        :param name: str - histogram name
+        :param value: float - e.g seconds taken
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        observe seconds taken by the with block in histogram name - also when it raises
+        :param name: str - histogram name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_failure(self, stage, error, **context):
+        """
+        :param stage: str - where it failed e.g 'fetch', 'match', 'tsid'
+        :param error: Exception or str - what failed
+        :param context: json serialisable values identifying what failed e.g url, tournament_id, match_id
+        """
+        record = {'time': round(time.time(), 3),
+                  'stage': stage,
+                  'error': type(error).__name__ if isinstance(error, BaseException) else 'error',
+                  'message': str(error)}
+        if isinstance(error, BaseException) and error.__traceback__ is not None:
+            frame = traceback.extract_tb(error.__traceback__)[-1]
+            record['at'] = f'{os.path.basename(frame.filename)}:{frame.lineno}'
+        record.update(context)
+        with self._lock:
+            self._failures.append(record)
+            self._failure_counts[f'{stage}.{record["error"]}'] += 1
+            if self.failures_path:
+                with open(self.failures_path, 'a') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+
+    def counter(self, name):
+        """:return: int - value of counter name"""
+        with self._lock:
+            return self._counters[name]
+
+    def failures(self):
+        """:return: list of dict - failure records held in memory, oldest first"""
+        with self._lock:
+            return list(self._failures)
+
+    def snapshot(self):
+        """
+        :return: dict - json serialisable copy of every metric
+        """
+        gauges = {name: fn() for name, fn in sorted(self.gauges.items())}
+        with self._lock:
+            elapsed = time.time() - self._started
+            return {'time': round(time.time(), 3),
+                    'elapsed_seconds': round(elapsed, 3),
+                    'counters': dict(sorted(self._counters.items())),
+                    'histograms': {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())},
+                    'gauges': gauges,
+                    'failure_counts': dict(sorted(self._failure_counts.items())),
+                    'recent_failures': list(self._failures)[-20:]}
+
+    def summary(self):
+        """
+        :return: str - one line per stage, for printing at the end of a crawl
+        """
+        snapshot = self.snapshot()
+        lines = [f'{name}: {value}' for name, value in snapshot['counters'].items()]
+        for name, histogram in snapshot['histograms'].items():
+            lines.append(f'{name}: {histogram["count"]} in {histogram["sum"]:.1f}s, '
+                         f'mean {histogram["mean"]:.4f}s, p95 <= {histogram["p95"]}s')
+        lines.extend(f'failed {name}: {count}' for name, count in snapshot['failure_counts'].items())
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """
+        write snapshot to path as json - written to a temporary file and renamed, so readers never see half a file
+        :param path: str - json file
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+
+class MetricsReporter:
+    """Dump metrics to a json file every interval seconds from a background thread, and once more on stop"""
+
+    def __init__(self, metrics, path, interval=30):
+        """
+        instantiate MetricsReporter class
+        :param metrics: CrawlMetrics
+        :param path: str - json file, overwritten on each dump
+        :param interval: float - seconds between dumps
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.dump(self.path)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.metrics.dump(self.path)
+
+
+# Metrics shared by the whole crawl
+_metrics = CrawlMetrics()
+_reporter = None
+
+
+def configure_metrics(dump_path=None, interval=30, failures_path=None, max_failures=1000):
+    """
+    start collecting metrics afresh, optionally dumping them periodically
+    :param dump_path: str - json file metrics are written to every interval seconds. None doesn't dump
+    :param interval: float - seconds between dumps
+    :param failures_path: str - json lines file every failure record is appended to
+    :param max_failures: int - failure records kept in memory
+    :return: CrawlMetrics
+    """
+    global _metrics, _reporter
+    stop_metrics()
+    gauges = _metrics.gauges
+    _metrics = CrawlMetrics(max_failures, failures_path)
+    # Gauges registered before metrics were configured e.g the rate limiter
+    _metrics.gauges.update(gauges)
+    if dump_path:
+        _reporter = MetricsReporter(_metrics, dump_path, interval).start()
+    return _metrics
+
+
+def stop_metrics():
+    """stop periodic dumps, writing a final dump"""
+    global _reporter
+    if _reporter is not None:
+        _reporter.stop()
+        _reporter = None
+
+
+def get_metrics():
+    """
+    :return: CrawlMetrics - shared metrics
+    """
+    return _metrics
+
+
+def register_gauge(name, fn):
+    """report fn() in every snapshot of the shared metrics"""
+    _metrics.register_gauge(name, fn)
+
+
+def incr(name, value=1):
+    """add to a counter of the shared metrics"""
+    _metrics.incr(name, value)
+
+
+def observe(name, value):
+    """observe a value in a histogram of the shared metrics"""
+    _metrics.observe(name, value)
+
+
+def timer(name):
+    """time a with block in a histogram of the shared metrics"""
+    return _metrics.timer(name)
+
+
+def record_failure(stage, error, **context):
+    """record a failure in the shared metrics - see CrawlMetrics.record_failure"""
+    _metrics.record_failure(stage, error, **context)
@@ -0,0 +1,135 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum operations per batch is 500
+MAX_BATCH_SIZE = 499
+
+
+class BulkWriteError(Exception):
+    """Raised when one or more batches could not be committed after all retries"""
+
+    def __init__(self, failed_batches):
+        """
+        :param failed_batches: list of tuples (first document number, last document number, exception)
+        """
+        self.failed_batches = failed_batches
+        super().__init__(f'{len(failed_batches)} batches failed to commit: '
+                         + ', '.join(f'{first} --> {last} ({e})' for first, last, e in failed_batches))
+
+
+class BulkWriter:
+    """
+    Commit documents to Firestore in concurrent batches
+
+    Documents are written as operations:
+        ('set', doc_id, data) - doc_id None for an automatically generated id
+        ('delete', doc_id, None)
+    Operations are grouped into WriteBatches of batch_size, with up to max_in_flight batches being
+    committed at once. A failed commit is retried with exponential backoff. The db only needs
+    .batch() and .collection(name).document(id), so the Firestore emulator or LocalFirestoreClient
+    can be used in place of a live google.cloud.firestore_v1.client.
+    """
+
+    def __init__(self, db, batch_size=MAX_BATCH_SIZE, max_in_flight=4, max_retries=3, backoff_factor=1.0):
+        """
+        instantiate BulkWriter class
+        :param db: google.cloud.firestore_v1.client
+        :param batch_size: int - operations per batch, at most 500
+        :param max_in_flight: int - batches committed concurrently
+        :param max_retries: int - retries after a batch fails to commit
+        :param backoff_factor: float - seconds to wait before first retry, doubled after each retry
+        """
+        self.db = db
+        self.batch_size = min(batch_size, 500)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+    def _commit_batch(self, collection_name, ops):
+        """
+        commit one batch, retrying on failure
+        :param collection_name: str - name of collection on Firestore
+        :param ops: list of tuples (op, doc_id, data)
+        """
+        collection = self.db.collection(collection_name)
+        # Resolve refs once - a retry must not generate new automatic ids for the same documents
+        refs = [(op, collection.document(doc_id) if doc_id is not None else collection.document(), data)
+                for op, doc_id, data in ops]
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self.db.batch()
+                for op, doc_ref, data in refs:
+                    if op == 'delete':
+                        batch.delete(doc_ref)
+                    else:
+                        batch.set(doc_ref, data)
+                batch.commit()
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f'Batch commit failed ({e}), retrying')
+                time.sleep(self.backoff_factor * 2 ** attempt)
+
+    def write(self, collection_name, ops):
+        """
+        commit all operations to a collection
+        :param collection_name: str - name of collection on Firestore to save to
+        :param ops: iterable of tuples (op, doc_id, data)
+        :return: dict - documents, batches, seconds, docs_per_sec
+        """
+        start = time.time()
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        lock = threading.Lock()
+        failed_batches = []
+        stats = {'documents': 0, 'batches': 0}
+
+        def on_done(future, first, last):
+            in_flight.release()
+            if future.exception() is not None:
+                with lock:
+                    failed_batches.append((first, last, future.exception()))
+                return
+            with lock:
+                stats['documents'] += last - first + 1
+                stats['batches'] += 1
+            print(f'Completed batch {first} --> {last}')
+
+        def submit(executor, ops_batch, first):
+            # Blocks while max_in_flight batches are committing - bounds memory held in pending batches
+            in_flight.acquire()
+            future = executor.submit(self._commit_batch, collection_name, ops_batch)
+            last = first + len(ops_batch) - 1
+            future.add_done_callback(lambda f: on_done(f, first, last))
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            ops_batch = []
+            first = 1
+            for op in ops:
+                ops_batch.append(op)
+                if len(ops_batch) == self.batch_size:
+                    submit(executor, ops_batch, first)
+                    first += len(ops_batch)
+                    ops_batch = []
+            # Final partial batch
+            if ops_batch:
+                submit(executor, ops_batch, first)
+
+        stats['seconds'] = time.time() - start
+        stats['docs_per_sec'] = stats['documents'] / stats['seconds'] if stats['seconds'] else 0.0
+        print(f"Wrote {stats['documents']} documents in {stats['batches']} batches "
+              f"in {stats['seconds']:.1f}s ({stats['docs_per_sec']:.0f} docs/s)")
+        if failed_batches:
+            raise BulkWriteError(sorted(failed_batches, key=lambda batch: batch[0]))
+        return stats
+
+    def set_documents(self, collection_name, doc_ids, documents):
+        """
+        write documents to a collection
+        :param collection_name: str - name of collection on Firestore to save to
+        :param doc_ids: iterable of str - document ids, None for automatically generated ids
+        :param documents: iterable of dict - document data
+        :return: dict - write stats
+        """
+        return self.write(collection_name, (('set', doc_id, data) for doc_id, data in zip(doc_ids, documents)))
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+from firestore_bulk_writer import BulkWriter
+
+
+def document_hash(data):
+    """
+    content hash of a document - stable across runs and key order
+    :param data: dict - document data
+    :return: str - sha1 hex digest
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def rank_document_id(record):
+    """
+    deterministic id for a ranking row - player_name_tsid_category
+    :param record: dict - ranking row
+    :return: str
+    """
+    return f"{'_'.join(str(record.get('Player')).lower().split(' '))}_{record.get('tsid')}_{record.get('Category')}"
+
+
+def _id_part(value):
+    """format id value - ints read back from csv as floats (1.0) are written as ints (1)"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def match_document_id(record):
+    """
+    deterministic id for a match - tournament_id_draw_id_match_id
+    Matches without a match_id fall back to a hash of the fields that identify the match
+    :param record: dict - match result
+    :return: str
+    """
+    match_id = record.get('match_id')
+    if match_id is None or match_id != match_id or str(match_id) == 'n/a':
+        key = {k: record.get(k) for k in ['match_title', 'match_date', 'winning_team_p1', 'winning_team_p2',
+                                          'losing_team_p1', 'losing_team_p2']}
+        match_id = 'h' + document_hash(key)[:16]
+    # '/' is not allowed in a Firestore document id
+    parts = [_id_part(record.get('tournament_id')), _id_part(record.get('draw_id')), _id_part(match_id)]
+    return '_'.join(parts).replace('/', '-')
+
+
+class SyncManifest:
+    """
+    Local record of what has been written to Firestore
+
+    Stored as json: {collection name: {source: {document id: content hash}}}, where source is the file the
+    documents were synced from e.g one season's results. Comparing against it lets a sync write only new or
+    changed documents and delete the ones removed from the same source.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str - path to manifest json, created on first save
+        """
+        self.path = path
+        self.collections = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.collections = json.load(f)
+
+    def get_collection(self, collection_name, source=''):
+        """
+        :param collection_name: str - name of collection on Firestore
+        :param source: str - file the documents were synced from
+        :return: dict - document id: content hash
+        """
+        return self.collections.get(collection_name, {}).get(source, {})
+
+    def set_collection(self, collection_name, doc_hashes, source=''):
+        """
+        :param collection_name: str - name of collection on Firestore
+        :param doc_hashes: dict - document id: content hash
+        :param source: str - file the documents were synced from
+        """
+        self.collections.setdefault(collection_name, {})[source] = doc_hashes
+
+    def other_sources(self, collection_name, source=''):
+        """
+        :param collection_name: str - name of collection on Firestore
+        :param source: str - file the documents were synced from
+        :return: set of str - ids of documents synced to the collection from any other source
+        """
+        return {doc_id for other, doc_hashes in self.collections.get(collection_name, {}).items() if other != source
+                for doc_id in doc_hashes}
+
+    def save(self):
+        """write manifest - via a temp file so an interrupted save keeps the previous manifest"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.collections, f)
+        os.replace(tmp_path, self.path)
+
+
+def sync_collection(db, collection_name, doc_ids, documents, manifest, delete_removed=True, max_in_flight=4,
+                    source=''):
+    """
+    Write only the documents that are new or changed since the last sync and delete removed ones
+
+    The manifest is only updated once every batch has committed, so a failed sync is
+    retried in full by the next run. Writes use deterministic ids, so re-writing is idempotent.
+    Only documents synced before from the same source are deleted, and never one another source still has,
+    so syncing one season's results leaves the other seasons in place. Documents written without a
+    manifest, e.g by the auto-id upload, are not known to it and are never deleted.
+
+    :param db: google.cloud.firestore_v1.client
+    :param collection_name: str - name of collection on Firestore to save to
+    :param doc_ids: iterable of str - deterministic document ids
+    :param documents: iterable of dict - document data
+    :param manifest: SyncManifest
+    :param delete_removed: bool - delete documents in the manifest that are no longer present
+    :param max_in_flight: int - batches committed concurrently
+    :param source: str - file the documents are synced from - deletions are limited to it
+    :return: dict - counts of new, changed, deleted and unchanged documents
+    """
+    # Last document wins if the same id appears more than once
+    current = dict(zip(doc_ids, documents))
+    previous = manifest.get_collection(collection_name, source)
+    current_hashes = {doc_id: document_hash(data) for doc_id, data in current.items()}
+
+    ops = []
+    counts = {'new': 0, 'changed': 0, 'deleted': 0, 'unchanged': 0}
+    for doc_id, doc_hash in current_hashes.items():
+        if doc_id not in previous:
+            counts['new'] += 1
+        elif previous[doc_id] != doc_hash:
+            counts['changed'] += 1
+        else:
+            counts['unchanged'] += 1
+            continue
+        ops.append(('set', doc_id, current[doc_id]))
+
+    if delete_removed:
+        elsewhere = manifest.other_sources(collection_name, source)
+        removed = [doc_id for doc_id in previous if doc_id not in current_hashes and doc_id not in elsewhere]
+        counts['deleted'] = len(removed)
+        ops += [('delete', doc_id, None) for doc_id in removed]
+    else:
+        # Keep tracking documents that were left in place
+        current_hashes = {**previous, **current_hashes}
+
+    print(f"{collection_name}: {counts['new']} new, {counts['changed']} changed, "
+          f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+    if ops:
+        BulkWriter(db, max_in_flight=max_in_flight).write(collection_name, ops)
+
+    manifest.set_collection(collection_name, current_hashes, source)
+    manifest.save()
+    return counts
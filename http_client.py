@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from crawl_metrics import incr, observe, record_failure, register_gauge
+from rate_limiter import HostRateLimiter
+from response_cache import ResponseCache, CacheMiss
+
+# Cookies required to gain access to Badminton England
+COOKIES = {'ASP.NET_SessionId': 'samot0pr3nnbuav0vs3l1oop',
+           'st': 'l=2057&exp=44802.7753505324&c=1&cp=20',
+           'expires': 'Mon, 29-Aug-2022 16:36:30 GMT',
+           'path': '/'
+           }
+
+# Site the pages belong to - urls are recorded, cached and compared with this host
+SITE_URL = 'https://be.tournamentsoftware.com'
+
+# Responses worth retrying - throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched after all retries"""
+
+
+class HttpClient:
+    """
+    Pooled keep-alive HTTP client used for every page fetch
+
+    A single requests.Session holds the session cookies and a pool of keep-alive connections,
+    so pages from the same host reuse connections instead of a new TLS handshake per page.
+    Connection errors, timeouts and RETRY_STATUS_CODES responses are retried with jittered
+    exponential backoff. FetchError is raised once retries are exhausted, rather than returning an
+    error page for the parsers to turn into 'N/A' values. With a rate_limiter every request, retries
+    included, waits for its host's limiter - cache hits don't.
+    """
+
+    def __init__(self, cookies=None, timeout=(5, 30), max_retries=3, backoff_factor=0.5, max_backoff=30,
+                 pool_size=20, cache=None, rate_limiter=None):
+        """
+        instantiate HttpClient class
+        :param cookies: dict - session cookies, defaults to COOKIES
+        :param timeout: float or tuple - (connect, read) timeout in seconds
+        :param max_retries: int - retries after the first attempt
+        :param backoff_factor: float - base delay in seconds, doubled on each retry
+        :param max_backoff: float - upper bound of a single delay in seconds
+        :param pool_size: int - keep-alive connections kept per host
+        :param cache: ResponseCache - optional on-disk response cache
+        :param rate_limiter: HostRateLimiter - optional per host rate and concurrency limits
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.cookies.update(COOKIES if cookies is None else cookies)
+
+    def _backoff(self, attempt, retry_after=None):
+        """
+        seconds to wait before retry - full jitter exponential backoff, honouring Retry-After
+        :param attempt: int - number of attempts made so far
+        :param retry_after: str - Retry-After header value if sent
+        :return: float
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def get_content(self, url, cookies=None):
+        """
+        Fetch page content, going through the response cache if configured
+        :param url: str - page url
+        :param cookies: dict - extra cookies for this request
+        :return: bytes - page content
+        """
+        if self.cache is not None:
+            content = self.cache.get(url)
+            if content is not None:
+                incr('fetch.cache_hits')
+                return content
+            if self.cache.replay:
+                incr('fetch.cache_misses')
+                raise CacheMiss(url)
+
+        error = None
+        fetch_url = rebase_url(url)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            if attempt:
+                incr('fetch.retries')
+            limiter = self.rate_limiter
+            permit = limiter.acquire(fetch_url) if limiter is not None else None
+            start = time.perf_counter()
+            try:
+                page = self.session.get(fetch_url, cookies=cookies, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                latency = time.perf_counter() - start
+                if limiter is not None:
+                    limiter.release(fetch_url, permit, latency)
+                observe('fetch.latency', latency)
+                incr(f'fetch.errors.{type(e).__name__}')
+                error = e
+            except BaseException:
+                if limiter is not None:
+                    limiter.release(fetch_url, permit, time.perf_counter() - start)
+                raise
+            else:
+                latency = time.perf_counter() - start
+                if limiter is not None:
+                    limiter.release(fetch_url, permit, latency, page.status_code, page.headers.get('Retry-After'))
+                observe('fetch.latency', latency)
+                incr(f'fetch.status.{page.status_code}')
+                if page.status_code not in RETRY_STATUS_CODES:
+                    incr('fetch.pages')
+                    incr('fetch.bytes', len(page.content))
+                    if self.cache is not None and page.status_code == 200:
+                        self.cache.put(url, page.content)
+                    return page.content
+                error = FetchError(f'HTTP {page.status_code} for url: {url}')
+                retry_after = page.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+
+        record_failure('fetch', error, url=url, attempts=self.max_retries + 1)
+        raise FetchError(f'Failed to fetch {url} after {self.max_retries + 1} attempts: {error}') from error
+
+
+# Client shared by scrapper, TournamentResults and TourPlayerId - created on first use
+_client = None
+_client_lock = threading.Lock()
+
+# Host requests for SITE_URL pages are sent to - see configure_base_url
+_base_url = SITE_URL
+
+
+def configure_base_url(base_url):
+    """
+    send requests for SITE_URL pages to another host e.g a local mock_server.
+    Urls in results and the response cache keep SITE_URL, only the request is redirected.
+    :param base_url: str - scheme and host e.g 'http://localhost:8000'. None restores SITE_URL
+    """
+    global _base_url
+    _base_url = (base_url or SITE_URL).rstrip('/')
+
+
+def get_base_url():
+    """
+    :return: str - scheme and host requests for SITE_URL pages are sent to
+    """
+    return _base_url
+
+
+def rebase_url(url):
+    """
+    :param url: str - page url
+    :return: str - url on the configured base url if it's a SITE_URL page, otherwise url
+    """
+    if _base_url != SITE_URL and url.startswith(SITE_URL + '/'):
+        return _base_url + url[len(SITE_URL):]
+    return url
+
+
+def configure_client(**kwargs):
+    """
+    Replace the shared client, e.g to change timeouts or retries
+    :param kwargs: HttpClient arguments
+    :return: HttpClient
+    """
+    global _client
+    with _client_lock:
+        if 'cache' not in kwargs and _client is not None:
+            kwargs['cache'] = _client.cache
+        if 'rate_limiter' not in kwargs and _client is not None:
+            kwargs['rate_limiter'] = _client.rate_limiter
+        _client = HttpClient(**kwargs)
+    return _client
+
+
+def get_client():
+    """
+    :return: HttpClient - shared client
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+    return _client
+
+
+def configure_cache(cache_dir, max_bytes=2 * 1024 ** 3, max_age=None, replay=False):
+    """
+    Enable the on-disk response cache for all page fetches
+    :param cache_dir: str - directory to store cached pages in
+    :param max_bytes: int - maximum total size of cached pages
+    :param max_age: int - seconds a cached page remains valid
+    :param replay: bool - serve only from cache, raise CacheMiss instead of fetching
+    :return: ResponseCache
+    """
+    cache = ResponseCache(cache_dir, max_bytes=max_bytes, max_age=max_age, replay=replay)
+    get_client().cache = cache
+    return cache
+
+
+def configure_rate_limiter(**kwargs):
+    """
+    Limit request rate and adapt concurrency per host for all page fetches.
+    The limiter's state is reported in crawl metrics snapshots as the 'rate_limiter' gauge
+    :param kwargs: AdaptiveLimiter arguments e.g max_rate, max_concurrency
+    :return: HostRateLimiter
+    """
+    rate_limiter = HostRateLimiter(**kwargs)
+    get_client().rate_limiter = rate_limiter
+    register_gauge('rate_limiter', rate_limiter.state)
+    return rate_limiter
+
+
+def get_content(url, cookies=None):
+    """
+    Fetch page content with the shared client
+    :param url: str - page url
+    :param cookies: dict - extra cookies for this request
+    :return: bytes - page content
+    """
+    return get_client().get_content(url, cookies)
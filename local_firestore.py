@@ -0,0 +1,90 @@
+import copy
+import random
+import threading
+import uuid
+
+
+class LocalDocumentReference:
+    """Stand-in for google.cloud.firestore_v1.document.DocumentReference"""
+
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self.collection_name = collection_name
+        self.id = doc_id
+
+    def get(self):
+        """:return: dict - document data or None if missing"""
+        return copy.deepcopy(self._client.collections.get(self.collection_name, {}).get(self.id))
+
+
+class LocalCollectionReference:
+    """Stand-in for google.cloud.firestore_v1.collection.CollectionReference"""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def document(self, document_id=None):
+        """
+        :param document_id: str - id of document, automatically generated if None
+        :return: LocalDocumentReference
+        """
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return LocalDocumentReference(self._client, self.name, document_id)
+
+
+class LocalWriteBatch:
+    """Stand-in for google.cloud.firestore_v1.batch.WriteBatch - applied atomically on commit"""
+
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, doc_ref, data):
+        self._ops.append(('set', doc_ref, copy.deepcopy(data)))
+
+    def delete(self, doc_ref):
+        self._ops.append(('delete', doc_ref, None))
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError('Maximum 500 operations per batch')
+        self._client.commits += 1
+        if self._client.random.random() < self._client.fail_rate:
+            raise ConnectionError('Simulated commit failure')
+        with self._client.lock:
+            for op, doc_ref, data in self._ops:
+                collection = self._client.collections.setdefault(doc_ref.collection_name, {})
+                if op == 'delete':
+                    collection.pop(doc_ref.id, None)
+                else:
+                    collection[doc_ref.id] = data
+
+
+class LocalFirestoreClient:
+    """
+    In-memory stand-in for google.cloud.firestore_v1.client
+
+    Supports the calls made by the upload functions: .collection(name).document(id) and
+    .batch() with set/delete/commit. Documents are kept in self.collections as
+    {collection name: {document id: data}}. fail_rate makes that fraction of commits raise,
+    to exercise retries without a live database.
+    """
+
+    def __init__(self, fail_rate=0.0, seed=None):
+        """
+        :param fail_rate: float - probability that a batch commit raises ConnectionError
+        :param seed: int - seed for choosing the commits that fail, None for a random choice
+        """
+        self.collections = {}
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return LocalCollectionReference(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
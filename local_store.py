@@ -0,0 +1,527 @@
+import argparse
+import json
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from firestore_sync import match_document_id
+from match_record import SCORE_COLUMNS, MatchRecord
+from result_sink import RESULT_COLUMNS
+from tournament_crawler import TOURNAMENT_COLUMNS
+from tsid_resolver import TsidResolver
+
+# Ranking csv column: store column
+RANKING_COLUMNS = {'Rank': 'rank',
+                   'Change': 'change',
+                   'Player': 'player',
+                   'Profile_url': 'profile_url',
+                   'Year of birth': 'year_of_birth',
+                   'Points': 'points',
+                   'Total points': 'total_points',
+                   'County': 'county',
+                   'Tournaments': 'tournaments',
+                   'Category': 'category',
+                   'tsid': 'tsid',
+                   'region': 'region'}
+
+# Columns holding ids - stored as text whether read from a page (str) or a csv (int, or float with gaps)
+ID_COLUMNS = {'draw_id', 'match_id', 'tournament_id', 'winning_team_p1_tsid', 'winning_team_p2_tsid',
+              'losing_team_p1_tsid', 'losing_team_p2_tsid'}
+
+TSID_COLUMNS = ['winning_team_p1_tsid', 'winning_team_p2_tsid', 'losing_team_p1_tsid', 'losing_team_p2_tsid']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rankings (
+    profile_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    rank INTEGER,
+    change TEXT,
+    player TEXT,
+    profile_url TEXT,
+    year_of_birth INTEGER,
+    points REAL,
+    total_points REAL,
+    county TEXT,
+    tournaments INTEGER,
+    tsid TEXT,
+    region TEXT,
+    updated REAL,
+    PRIMARY KEY (profile_id, category)
+);
+CREATE INDEX IF NOT EXISTS rankings_tsid ON rankings (tsid);
+CREATE INDEX IF NOT EXISTS rankings_category_rank ON rankings (category, rank);
+
+CREATE TABLE IF NOT EXISTS tournaments (
+    tournament_id TEXT PRIMARY KEY,
+    tournament TEXT,
+    location TEXT,
+    tour_dates TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS tournaments_dates ON tournaments (start_date, end_date);
+
+CREATE TABLE IF NOT EXISTS matches (
+    match_key TEXT PRIMARY KEY,
+    season INTEGER,
+    match_day TEXT,
+    %s,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS matches_tournament ON matches (tournament_id, draw_id);
+CREATE INDEX IF NOT EXISTS matches_day ON matches (match_day);
+CREATE INDEX IF NOT EXISTS matches_season ON matches (season);
+%s
+
+CREATE TABLE IF NOT EXISTS tsid_map (
+    tour_ref TEXT NOT NULL,
+    tour_player_id TEXT NOT NULL,
+    tsid TEXT,
+    updated REAL,
+    PRIMARY KEY (tour_ref, tour_player_id)
+);
+CREATE INDEX IF NOT EXISTS tsid_map_tsid ON tsid_map (tsid);
+""" % (',\n    '.join(f'{col} TEXT' for col in RESULT_COLUMNS),
+       '\n'.join(f'CREATE INDEX IF NOT EXISTS matches_{col} ON matches ({col});' for col in TSID_COLUMNS))
+
+
+def _text(value):
+    """
+    :param value: id, name or number as read from a page or csv
+    :return: str - None if missing. Whole floats (1.0, as pandas reads an int column with gaps) lose the '.0'
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _value(value):
+    """numbers kept as numbers, nan as None - for columns with numeric affinity"""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def iso_date(text, last=False):
+    """
+    :param text: str - date as shown on the site e.g 'Sat 12/10/2019 10:01' or '01/01/2019 to 02/01/2019'
+    :param last: bool - take the last date in text rather than the first
+    :return: str - YYYY-MM-DD, None if text has no dd/mm/yyyy date
+    """
+    found = re.findall(r'(\d{1,2})/(\d{1,2})/(\d{4})', str(text)) if text is not None else []
+    if not found:
+        return None
+    day, month, year = found[-1] if last else found[0]
+    return f'{year}-{int(month):02d}-{int(day):02d}'
+
+
+def _scores(value):
+    """scores as a list - read from a csv they are text e.g '[21, 15]'"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+class LocalStore:
+    """
+    Rankings, tournaments, matches and TSID mappings in one indexed SQLite database
+
+    Replaces re-reading the csvs under /home/cdsw for look ups - players are found by TSID or profile,
+    matches by TSID, tournament or date, and TSIDs by (tour_ref, tour_player_id) without loading a table.
+    Every table is written with bulk upserts keyed on its natural key, so a crawl can write into the store
+    as it goes, and re-crawling a player or tournament updates its rows rather than adding new ones:
+        rankings - (profile_id, category)
+        tournaments - tournament_id
+        matches - tournament_id_draw_id_match_id, as match_document_id
+        tsid_map - (tour_ref, tour_player_id)
+
+    Matches are read back as MatchRecord and rankings as dicts with the ranking csv columns, so they can be
+    passed to the code that reads the csvs e.g MatchTable.from_records(records).to_dataframe().
+    Safe to share between threads. Several processes can read while one writes.
+    """
+
+    def __init__(self, path, timeout=60):
+        """
+        instantiate LocalStore class
+        :param path: str - SQLite database, created if missing
+        :param timeout: float - seconds to wait for another process's write to finish
+        """
+        self.path = path
+        # Autocommit - transactions are begun explicitly
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            # Readers don't block the writer, and a commit doesn't wait for a full sync
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+
+    def _transaction(self, fn):
+        """run fn(connection) in a write transaction, taking the database write lock up front"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _upsert(self, table, columns, rows):
+        """
+        insert rows, replacing those with the same key
+        :return: int - rows written
+        """
+        sql = f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+        rows = list(rows)
+        if rows:
+            self._transaction(lambda conn: conn.executemany(sql, rows))
+        return len(rows)
+
+    # Writes
+
+    def upsert_rankings(self, rows):
+        """
+        :param rows: DataFrame or iterable of dict - ranking rows, schema as the ranking csv (README Rank Table)
+        :return: int - rows written
+        """
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict('records')
+        now = time.time()
+        columns = ['profile_id'] + list(RANKING_COLUMNS.values()) + ['updated']
+
+        def values(row):
+            profile_url = row.get('Profile_url')
+            profile_id = row.get('Id')
+            if profile_id is None and isinstance(profile_url, str):
+                profile_id = profile_url.split('player-profile/')[-1]
+            return ([_text(profile_id)]
+                    + [_text(row.get(col)) if col in ('tsid', 'Category') else _value(row.get(col))
+                       for col in RANKING_COLUMNS]
+                    + [now])
+        return self._upsert('rankings', columns, (values(row) for row in rows))
+
+    def upsert_tournaments(self, tour_metas):
+        """
+        :param tour_metas: iterable of dict - TOURNAMENT_COLUMNS e.g from load_tournaments or match records
+        :return: int - tournaments written
+        """
+        now = time.time()
+        columns = TOURNAMENT_COLUMNS + ['start_date', 'end_date', 'updated']
+        rows = {}
+        for meta in tour_metas:
+            tournament_id = _text(meta.get('tournament_id'))
+            if tournament_id is not None:
+                tour_dates = _text(meta.get('tour_dates'))
+                rows[tournament_id] = ([_text(meta.get(col)) for col in TOURNAMENT_COLUMNS]
+                                       + [iso_date(tour_dates), iso_date(tour_dates, last=True), now])
+        return self._upsert('tournaments', columns, rows.values())
+
+    def upsert_matches(self, records, season=None):
+        """
+        write match records and their tournaments
+        :param records: iterable of MatchRecord or dict - match records, as collected or read from a results csv
+        :param season: int - season the matches were collected for. None takes the year the tournament ends in
+        :return: int - matches written
+        """
+        now = time.time()
+        columns = ['match_key', 'season', 'match_day'] + RESULT_COLUMNS + ['updated']
+        rows = []
+        tournaments = {}
+        for record in records:
+            if not isinstance(record, MatchRecord):
+                record = MatchRecord.from_dict({**record, **{col: _scores(record.get(col)) for col in SCORE_COLUMNS}})
+            values = []
+            for col in RESULT_COLUMNS:
+                value = getattr(record, col)
+                if col in SCORE_COLUMNS:
+                    values.append(json.dumps(list(value)) if value is not None else None)
+                else:
+                    values.append(_text(value))
+            tournaments.setdefault(record.tournament_id, record)
+            end_date = iso_date(record.tour_dates, last=True)
+            match_season = season if season is not None else int(end_date[:4]) if end_date else None
+            rows.append([match_document_id(record), match_season,
+                         iso_date(record.match_date) or iso_date(record.tour_dates)] + values + [now])
+        self.upsert_tournaments({col: getattr(record, col) for col in TOURNAMENT_COLUMNS}
+                                for record in tournaments.values())
+        return self._upsert('matches', columns, rows)
+
+    def upsert_tsids(self, entries):
+        """
+        :param entries: iterable of tuples (tour_ref, tour_player_id, tsid) - e.g TsidResolver.pop_new_entries.
+                        A TSID of nan (not found when scraped) is stored as NULL
+        :return: int - mappings written
+        """
+        now = time.time()
+        return self._upsert('tsid_map', ['tour_ref', 'tour_player_id', 'tsid', 'updated'],
+                            ([_text(tour_ref), _text(tour_player_id), _text(tsid), now]
+                             for tour_ref, tour_player_id, tsid in entries))
+
+    def upsert_resolver(self, tsid_resolver):
+        """
+        :param tsid_resolver: TsidResolver - every mapping is written
+        :return: int - mappings written
+        """
+        df = tsid_resolver.to_dataframe()
+        return self.upsert_tsids(zip(df['tour_ref'], df['tour_player_id'], df['tsid']))
+
+    # Look ups
+
+    def _rankings(self, where, params):
+        rows = self._query(f'SELECT * FROM rankings WHERE {where} ORDER BY category, rank', params)
+        return [{col: row[store_col] for col, store_col in RANKING_COLUMNS.items()} for row in rows]
+
+    def rankings_for_tsid(self, tsid):
+        """
+        :param tsid: str - TSID
+        :return: list of dict - ranking rows for player across categories
+        """
+        return self._rankings('tsid = ?', (_text(tsid),))
+
+    def rankings_for_profile(self, profile_id):
+        """
+        :param profile_id: str - guid from player-profile/<guid> url
+        :return: list of dict - ranking rows for player across categories
+        """
+        return self._rankings('profile_id = ?', (profile_id,))
+
+    def rankings_for_category(self, category):
+        """
+        :param category: str - category accronym e.g 'MS'
+        :return: list of dict - ranking rows in category, by rank
+        """
+        return self._rankings('category = ?', (category,))
+
+    def get_tsid(self, tour_ref, tour_player_id, default=None):
+        """
+        :param tour_ref: str - tournament id from player link
+        :param tour_player_id: str - player id within tournament from player link
+        :param default: value returned if mapping not known
+        :return: str - TSID (np.nan if previously scraped and not found)
+        """
+        rows = self._query('SELECT tsid FROM tsid_map WHERE tour_ref = ? AND tour_player_id = ?',
+                           (_text(tour_ref), _text(tour_player_id)))
+        if not rows:
+            return default
+        return rows[0]['tsid'] if rows[0]['tsid'] is not None else np.nan
+
+    def player_refs(self, tsid):
+        """
+        :param tsid: str - TSID
+        :return: list of tuples (tour_ref, tour_player_id) - the player's references in every tournament
+        """
+        return [(row['tour_ref'], row['tour_player_id'])
+                for row in self._query('SELECT tour_ref, tour_player_id FROM tsid_map WHERE tsid = ? '
+                                       'ORDER BY tour_ref, tour_player_id', (_text(tsid),))]
+
+    def tsid_resolver(self):
+        """
+        :return: TsidResolver - every mapping, to seed a crawl with the TSIDs already found
+        """
+        resolver = TsidResolver()
+        for row in self._query('SELECT tour_ref, tour_player_id, tsid FROM tsid_map'):
+            resolver.add(row['tour_ref'], row['tour_player_id'], row['tsid'] if row['tsid'] is not None else np.nan)
+        resolver.pop_new_entries()
+        return resolver
+
+    def get_tournament(self, tournament_id):
+        """
+        :param tournament_id: str - tournament id
+        :return: dict - TOURNAMENT_COLUMNS plus start_date and end_date (YYYY-MM-DD), None if not stored
+        """
+        rows = self._query('SELECT * FROM tournaments WHERE tournament_id = ?', (_text(tournament_id),))
+        return {col: rows[0][col] for col in TOURNAMENT_COLUMNS + ['start_date', 'end_date']} if rows else None
+
+    def tournaments_between(self, start=None, end=None):
+        """
+        :param start: str or date - first day YYYY-MM-DD, None for no lower bound
+        :param end: str or date - last day YYYY-MM-DD, None for no upper bound
+        :return: list of dict - tournaments starting in the range, by start date
+        """
+        where, params = self._date_range('start_date', start, end)
+        rows = self._query(f'SELECT * FROM tournaments WHERE {where} ORDER BY start_date, tournament_id', params)
+        return [{col: row[col] for col in TOURNAMENT_COLUMNS + ['start_date', 'end_date']} for row in rows]
+
+    @staticmethod
+    def _date_range(column, start, end):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append(f'{column} >= ?')
+            params.append(str(start))
+        if end is not None:
+            conditions.append(f'{column} <= ?')
+            params.append(str(end))
+        return ' AND '.join(conditions) or '1', params
+
+    def _matches(self, where, params):
+        rows = self._query(f'SELECT * FROM matches WHERE {where} ORDER BY match_day, tournament_id, draw_id, '
+                           f'CAST(match_id AS INTEGER)', params)
+        records = []
+        for row in rows:
+            fields = {col: row[col] for col in RESULT_COLUMNS}
+            for col in SCORE_COLUMNS:
+                if fields[col] is not None:
+                    fields[col] = tuple(json.loads(fields[col]))
+            records.append(MatchRecord(**fields))
+        return records
+
+    def matches_for_tsid(self, tsid, start=None, end=None):
+        """
+        :param tsid: str - TSID
+        :param start: str or date - first match day YYYY-MM-DD, None for no lower bound
+        :param end: str or date - last match day YYYY-MM-DD, None for no upper bound
+        :return: list of MatchRecord - matches the player played in, by date
+        """
+        # One indexed look up per player column, combined by SQLite (multi-index OR)
+        where = '(' + ' OR '.join(f'{col} = ?' for col in TSID_COLUMNS) + ')'
+        date_where, date_params = self._date_range('match_day', start, end)
+        return self._matches(f'{where} AND {date_where}', [_text(tsid)] * len(TSID_COLUMNS) + date_params)
+
+    def matches_for_tournament(self, tournament_id):
+        """
+        :param tournament_id: str - tournament id
+        :return: list of MatchRecord - matches of the tournament, by date, draw and match
+        """
+        return self._matches('tournament_id = ?', (_text(tournament_id),))
+
+    def matches_between(self, start=None, end=None):
+        """
+        :param start: str or date - first match day YYYY-MM-DD, None for no lower bound
+        :param end: str or date - last match day YYYY-MM-DD, None for no upper bound
+        :return: list of MatchRecord - matches played in the range, by date
+        """
+        return self._matches(*self._date_range('match_day', start, end))
+
+    def counts(self):
+        """
+        :return: dict - table: number of rows
+        """
+        return {table: self._query(f'SELECT COUNT(*) FROM {table}')[0][0]
+                for table in ['rankings', 'tournaments', 'matches', 'tsid_map']}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StoreResultSink:
+    """
+    Result sink writing a season's match records into a LocalStore - written with each write_many, so
+    matches are in the store as soon as a player or tournament completes
+    """
+
+    def __init__(self, store, season=None):
+        """
+        instantiate StoreResultSink class
+        :param store: LocalStore
+        :param season: int - season of the records written
+        """
+        self.store = store
+        self.season = season
+        self.rows_written = 0
+
+    def write(self, record):
+        """
+        :param record: MatchRecord or dict - match record
+        """
+        self.write_many([record])
+
+    def write_many(self, records):
+        """
+        :param records: iterable of MatchRecord or dict - match records
+        """
+        self.rows_written += self.store.upsert_matches(records, self.season)
+
+    def flush(self):
+        # Every write_many is committed
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def import_csvs(store, rankings_csv=None, results_csv=None, references_csv=None, season=None, chunksize=50000):
+    """
+    load csvs written by scrapper.py and collect_match_data.py into the store - read in chunks, so a
+    table is never held in memory whole
+    :param store: LocalStore
+    :param rankings_csv: str - ranking table csv
+    :param results_csv: str - tournament results csv
+    :param references_csv: str - TSID references csv
+    :param season: int - season of results_csv. None takes the year each tournament ends in
+    :param chunksize: int - rows upserted per transaction
+    :return: dict - table: rows written
+    """
+    written = {}
+    if rankings_csv:
+        written['rankings'] = sum(store.upsert_rankings(chunk)
+                                  for chunk in pd.read_csv(rankings_csv, chunksize=chunksize))
+    if results_csv:
+        written['matches'] = sum(store.upsert_matches(chunk.to_dict('records'), season)
+                                 for chunk in pd.read_csv(results_csv, chunksize=chunksize))
+    if references_csv:
+        written['tsid_map'] = sum(store.upsert_tsids(zip(chunk['tour_ref'], chunk['tour_player_id'], chunk['tsid']))
+                                  for chunk in pd.read_csv(references_csv, chunksize=chunksize,
+                                                           dtype={'tour_ref': str, 'tour_player_id': str}))
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load csvs into the local SQLite store, or look up players and matches')
+    parser.add_argument('db', help='SQLite database, created if missing')
+    parser.add_argument('--rankings', default=None, help='ranking csv to load')
+    parser.add_argument('--results', default=None, help='tournament results csv to load')
+    parser.add_argument('--references', default=None, help='TSID references csv to load')
+    parser.add_argument('--season', type=int, default=None,
+                        help='season of --results (default: the year each tournament ends in)')
+    parser.add_argument('--tsid', default=None, help='print the rankings and matches of a player')
+    parser.add_argument('--tournament', default=None, help='print the matches of a tournament')
+    parser.add_argument('--start', default=None, help='first day YYYY-MM-DD of matches printed')
+    parser.add_argument('--end', default=None, help='last day YYYY-MM-DD of matches printed')
+    args = parser.parse_args()
+
+    with LocalStore(args.db) as store:
+        if args.rankings or args.results or args.references:
+            print(f'Loaded {import_csvs(store, args.rankings, args.results, args.references, args.season)}')
+        if args.tsid:
+            for row in store.rankings_for_tsid(args.tsid):
+                print(row)
+            matches = store.matches_for_tsid(args.tsid, args.start, args.end)
+        elif args.tournament:
+            matches = store.matches_for_tournament(args.tournament)
+        elif args.start or args.end:
+            matches = store.matches_between(args.start, args.end)
+        else:
+            matches = []
+        for record in matches:
+            print(record.to_dict())
+        print(store.counts())
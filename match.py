@@ -1,5 +1,6 @@
 import numpy as np
 import re
+from http_client import SITE_URL
 from tournament_player_id import TourPlayerId
 
 
@@ -7,19 +8,22 @@ class Match:
     """
     Class to represent a match
     TO DO - HANDLE FOR BYE'S OR MATCHES CALLED OFF
+
+    Crawls extract matches with match_extractor.MatchExtractor, which reads the same fields in one
+    pass over the tag. Changes to the fields read here must be made there too.
     """
 
-    def __init__(self, tag, player_ratings_df, df_tour_res):
+    def __init__(self, tag, ranking_index, tsid_resolver):
         """
         initialise a match object
         :param
             tag: bs4.tag - li class=match-group__item
-            player_ratings_df: DataFrame - Collected by scraping ranking tables
-            df_tour_res: DataFrame - Schema: tour_player_id, tour_ref, tsid
+            ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+            tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
         """
         self.tag = tag
-        self.player_ratings_df = player_ratings_df
-        self.df_tour_res = df_tour_res
+        self.ranking_index = ranking_index
+        self.tsid_resolver = tsid_resolver
 
     def check_for_no_match(self):
         """
@@ -92,14 +96,6 @@ class Match:
             court = 'n/a'
         return court
 
-    def get_df_tour_res(self):
-        """
-        Helper function to get DataFrame with tour results to map to players
-        :return:
-            df_tour_res - DataFrame
-        """
-        return self.df_tour_res
-
     def get_match_stats(self):
         """
         TO DO - HANDLE FOR BYE'S OR MATCHES CALLED OFF
@@ -149,11 +145,9 @@ class Match:
             match_data_dict[f'winning_team_p{num + 1}'] = player.text.strip()
             # print(f'winning team p{num + 1}: {player.text.strip()}')
             # Getting TSID for player
-            win_href = 'https://be.tournamentsoftware.com' + player.find('a')['href']
-            tp_id = TourPlayerId(win_href, self.player_ratings_df, self.df_tour_res)
+            win_href = SITE_URL + player.find('a')['href']
+            tp_id = TourPlayerId(win_href, self.ranking_index, self.tsid_resolver)
             match_data_dict[f'winning_team_p{num + 1}_tsid'] = tp_id.get_tsid()
-            # Update tournament result dataframe - used to quickly allocate TSID to players
-            self.df_tour_res = tp_id.get_tour_ref_df()
 
         for num, player in enumerate(
                 self.tag.find(lambda tag: tag.name == 'div' and tag['class'] == 'match__row '.split())
@@ -161,11 +155,9 @@ class Match:
             match_data_dict[f'losing_team_p{num + 1}'] = player.text.strip()
             # print(f'losing team p{num + 1}: {player.text.strip()}')
             # Getting TSID for player
-            win_href = 'https://be.tournamentsoftware.com' + player.find('a')['href']
-            tp_id = TourPlayerId(win_href, self.player_ratings_df, self.df_tour_res)
+            win_href = SITE_URL + player.find('a')['href']
+            tp_id = TourPlayerId(win_href, self.ranking_index, self.tsid_resolver)
             match_data_dict[f'losing_team_p{num + 1}_tsid'] = tp_id.get_tsid()
-            # Update tournament result dataframe - used to quickly allocate TSID to players
-            self.df_tour_res = tp_id.get_tour_ref_df()
 
         for lab, val in zip(['winning_team_scores', 'losing_team_scores'], ['match__row has-won', 'match__row ']):
             match_data_dict[lab] = self.get_match_scores_list(val)
@@ -0,0 +1,323 @@
+import re
+import numpy as np
+from bs4.element import Tag
+from http_client import SITE_URL
+from tournament_player_id import TourPlayerId
+
+DURATION_STATS_RE = re.compile('(?i)Match stats')
+
+
+class Rule:
+    """
+    Declares a tag to locate in a match subtree. Rules are compiled once into a MatchExtractor.
+
+    Classes are matched as bs4 matches class_: a single class must be one of the tag's classes,
+    space separated classes must be exactly the tag's classes.
+    """
+
+    def __init__(self, name, css_class=None, exact=False, classless=False, many=False, children=False,
+                 within=None):
+        """
+        instantiate Rule class
+        :param
+            name: str - tag name
+            css_class: str - class to match, None matches any tag called name
+            exact: bool - tag's classes must be exactly css_class.split() - as the lambda finds in Match
+            classless: bool - only match tags without a class attribute
+            many: bool - collect every matching tag, not just the first
+            children: bool - only match direct children of the enclosing tag, not all descendants
+            within: dict - slot: Rule - rules applied to the descendants of each matching tag
+        """
+        self.name = name
+        self.many = many
+        self.children = children
+        self.within = within or {}
+        if classless:
+            self.matches_class = lambda classes: classes is None
+        elif css_class is None:
+            self.matches_class = lambda classes: True
+        elif exact or ' ' in css_class:
+            target = css_class.split()
+            self.matches_class = lambda classes: classes is not None and classes == target
+        else:
+            self.matches_class = lambda classes: classes is not None and css_class in classes
+
+
+class _Scope:
+    """tags found by a set of compiled rules below one tag - slot: (position, tag, scope of tag)"""
+
+    __slots__ = ('tag', 'rules', 'found')
+
+    def __init__(self, tag, rules):
+        self.tag = tag
+        self.rules = rules
+        self.found = {}
+
+    def first(self, slot):
+        """:return: tuple (position, tag, scope) - None if not found"""
+        return self.found.get(slot)
+
+    def tag_of(self, slot):
+        """:return: bs4.Tag - first tag found for slot, None if not found"""
+        found = self.found.get(slot)
+        return found[1] if found else None
+
+    def scope_of(self, slot):
+        """:return: _Scope - rules applied within first tag found for slot, None if not found"""
+        found = self.found.get(slot)
+        return found[2] if found else None
+
+    def all(self, slot):
+        """:return: list of tuples (position, tag, scope) - every tag found for a many rule"""
+        return self.found.get(slot, [])
+
+
+def _compile(rules):
+    """
+    index rules by tag name so each tag is only tested against rules that can match it
+    :param rules: dict - slot: Rule
+    :return: dict - tag name: list of tuples (slot, rule, compiled rules within)
+    """
+    compiled = {}
+    for slot, rule in rules.items():
+        compiled.setdefault(rule.name, []).append((slot, rule, _compile(rule.within)))
+    return compiled
+
+
+# Rules within a winning or losing row
+ROW_RULES = {
+    'title': Rule('div', 'match__row-title', within={
+        'player': Rule(None, children=True, many=True, within={'link': Rule('a')})}),
+    'result': Rule('div', 'match__result', within={
+        'points': Rule('li', 'points__cell', many=True)}),
+}
+
+# Rules within li class=match-group__item - the same tags Match finds
+MATCH_RULES = {
+    'message': Rule('span', 'tag--warning tag match__message'),
+    'title': Rule('div', 'match__header-title'),
+    'aside': Rule('div', 'match__header-aside', within={'link': Rule('a')}),
+    'footer': Rule('div', 'match__footer', within={
+        'clock': Rule('svg', 'icon-clock nav-link__prefix'),
+        'date': Rule('span', 'nav-link__value'),
+        'items': Rule('li', 'match__footer-list-item', many=True)}),
+    'winner': Rule('div', 'match__row has-won', within=ROW_RULES),
+    'loser': Rule('div', 'match__row', exact=True, within=ROW_RULES),
+    # Raises KeyError in Match's lambda finds if reached before the row they look for
+    'classless_div': Rule('div', classless=True),
+}
+
+
+class ParsedMatch:
+    """
+    Fields of one match, extracted in a single pass over its tag - no TSIDs resolved yet
+
+    players holds (column, name, href) in the order Match resolves TSIDs. If Match would have
+    raised part way through, error is the exception and players holds only the players whose
+    TSIDs were resolved before it.
+    """
+
+    __slots__ = ('no_match', 'match_id', 'fields', 'players', 'error')
+
+    def __init__(self, no_match, match_id, fields=None, players=None, error=None):
+        self.no_match = no_match
+        self.match_id = match_id
+        self.fields = fields
+        self.players = players or []
+        self.error = error
+
+    def to_record(self, ranking_index, tsid_resolver):
+        """
+        resolve TSIDs of players - same dict as Match.get_match_stats
+        :param ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+        :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+        :return: dict - match stats
+        """
+        record = dict(self.fields) if self.fields else {}
+        for column, name, href in self.players:
+            record[column] = name
+            if href is not None:
+                tp_id = TourPlayerId(SITE_URL + href, ranking_index, tsid_resolver)
+                record[f'{column}_tsid'] = tp_id.get_tsid()
+        if self.error is not None:
+            raise self.error
+        return record
+
+
+class MatchExtractor:
+    """
+    Extract every field of a match in one walk over its subtree
+
+    Match finds each field separately, walking the match tag once per find. Here the rules in
+    MATCH_RULES are compiled once and every tag in the subtree is visited once, collecting the tags
+    each field is read from. Output is identical to Match, including its failure modes.
+    """
+
+    def __init__(self, rules=None):
+        """
+        instantiate MatchExtractor class
+        :param rules: dict - slot: Rule - default MATCH_RULES
+        """
+        self.rules = _compile(rules or MATCH_RULES)
+
+    def scan(self, tag):
+        """
+        visit every tag below tag once, recording those matched by rules
+        :param tag: bs4.tag - li class=match-group__item
+        :return: _Scope - tags found
+        """
+        root = _Scope(tag, self.rules)
+        position = 0
+        # Depth first in document order - same order bs4 find searches. Entries are (tag, parent, scopes)
+        stack = [(child, tag, (root,)) for child in reversed(tag.contents) if isinstance(child, Tag)]
+        while stack:
+            node, parent, scopes = stack.pop()
+            position += 1
+            classes = node.get('class')
+            inner = scopes
+            for scope in scopes:
+                for rules in (scope.rules.get(node.name), scope.rules.get(None)):
+                    if not rules:
+                        continue
+                    for slot, rule, within in rules:
+                        if rule.children and parent is not scope.tag:
+                            continue
+                        if not rule.matches_class(classes):
+                            continue
+                        if not rule.many and slot in scope.found:
+                            continue
+                        node_scope = _Scope(node, within) if within else None
+                        if rule.many:
+                            scope.found.setdefault(slot, []).append((position, node, node_scope))
+                        else:
+                            scope.found[slot] = (position, node, node_scope)
+                        if node_scope is not None:
+                            inner = inner + (node_scope,)
+            stack.extend((child, node, inner) for child in reversed(node.contents) if isinstance(child, Tag))
+        return root
+
+    def extract(self, tag):
+        """
+        :param tag: bs4.tag - li class=match-group__item
+        :return: ParsedMatch
+        """
+        found = self.scan(tag)
+
+        # Match.check_for_no_match
+        message = found.tag_of('message')
+        if message is not None and message.text.strip():
+            return ParsedMatch(True, None)
+
+        aside = found.tag_of('aside')
+        match_id = _match_id(aside, found.scope_of('aside'))
+        try:
+            fields = {
+                'match_title': found.tag_of('title').text.strip(),
+                'match_id': match_id,
+                'match_duration': _match_duration(aside),
+                'match_date': _match_date(found.scope_of('footer')),
+                'match_court': _match_court(found.scope_of('footer')),
+                'winning_team_p1': np.nan,
+                'winning_team_p1_tsid': np.nan,
+                'winning_team_p2': np.nan,
+                'winning_team_p2_tsid': np.nan,
+                'losing_team_p1': np.nan,
+                'losing_team_p1_tsid': np.nan,
+                'losing_team_p2': np.nan,
+                'losing_team_p2_tsid': np.nan,
+                'winning_team_scores': np.nan,
+                'losing_team_scores': np.nan
+            }
+        except Exception as e:
+            return ParsedMatch(False, match_id, error=e)
+
+        players = []
+        try:
+            _row_players(found.scope_of('winner'), 'winning_team', players)
+            # Match finds the losing row with tag['class'] - a div without a class before it raises KeyError
+            loser = found.first('loser')
+            classless = found.first('classless_div')
+            if classless is not None and (loser is None or classless[0] < loser[0]):
+                raise KeyError('class')
+            _row_players(found.scope_of('loser'), 'losing_team', players)
+        except Exception as e:
+            return ParsedMatch(False, match_id, fields, players, e)
+
+        fields['winning_team_scores'] = _row_scores(found.first('winner'), found.first('classless_div'))
+        fields['losing_team_scores'] = _row_scores(found.first('loser'), found.first('classless_div'))
+        return ParsedMatch(False, match_id, fields, players)
+
+
+def _match_id(aside, aside_scope):
+    """Match.get_match_id"""
+    try:
+        return aside_scope.tag_of('link')['href'].split('match=')[-1]
+    except Exception:
+        return 'n/a'
+
+
+def _match_duration(aside):
+    """Match.get_match_duration"""
+    try:
+        match_duration = aside.text.strip()
+        if DURATION_STATS_RE.search(match_duration):
+            match_duration = match_duration.split('Match stats')[-1].strip()
+    except Exception:
+        match_duration = 'n/a'
+    return match_duration
+
+
+def _match_date(footer_scope):
+    """Match.get_match_date - raises if there is no footer or it has no date"""
+    try:
+        return footer_scope.tag_of('clock').find_next_sibling().text
+    except Exception:
+        return footer_scope.tag_of('date').text
+
+
+def _match_court(footer_scope):
+    """Match.get_court"""
+    try:
+        return footer_scope.all('items')[-1][1].text.strip()
+    except Exception:
+        return 'n/a'
+
+
+def _row_players(row_scope, team, players):
+    """
+    append (column, name, href) for each player in a row, raising where Match would
+    :param row_scope: _Scope - scope of winning or losing row, None if row not found
+    :param team: str - 'winning_team' or 'losing_team'
+    :param players: list - players appended here
+    """
+    if row_scope is None:
+        raise AttributeError(f'No {team} row')
+    title_scope = row_scope.scope_of('title')
+    if title_scope is None:
+        raise AttributeError(f'No {team} row title')
+    for num, (_, player, player_scope) in enumerate(title_scope.all('player')):
+        column = f'{team}_p{num + 1}'
+        link = player_scope.tag_of('link')
+        if link is None or not link.has_attr('href'):
+            players.append((column, player.text.strip(), None))
+            # Match subscripts player.find('a') - None without a link, a tag without href otherwise
+            if link is None:
+                raise TypeError("'NoneType' object is not subscriptable")
+            raise KeyError('href')
+        players.append((column, player.text.strip(), link['href']))
+
+
+def _row_scores(row, classless):
+    """
+    Match.get_match_scores_list
+    :param row: tuple (position, tag, scope) - winning or losing row, None if not found
+    :param classless: tuple (position, tag, scope) - first div without a class, None if there isn't one
+    :return: list of int - 'n/a' if not available
+    """
+    if row is None or (classless is not None and classless[0] < row[0]):
+        return 'n/a'
+    try:
+        result_scope = row[2].scope_of('result')
+        return [int(cell.text.strip()) for _, cell, _ in result_scope.all('points')]
+    except Exception:
+        return 'n/a'
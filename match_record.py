@@ -0,0 +1,200 @@
+import sys
+from array import array
+import numpy as np
+import pandas as pd
+from result_sink import RESULT_COLUMNS
+
+# Value each column held for a missing value before MatchRecord - Match uses 'n/a' for fields it
+# failed to read and np.nan for players that aren't there
+LEGACY_NULLS = {col: np.nan for col in RESULT_COLUMNS}
+LEGACY_NULLS.update({'match_id': 'n/a',
+                     'match_duration': 'n/a',
+                     'match_court': 'n/a',
+                     'winning_team_scores': 'n/a',
+                     'losing_team_scores': 'n/a'})
+
+SCORE_COLUMNS = ['winning_team_scores', 'losing_team_scores']
+
+# Columns repeated on every match of a tournament, event or draw - interned in MatchRecord
+# and dictionary encoded in MatchTable
+CATEGORY_COLUMNS = ['tournament', 'tournament_id', 'location', 'tour_dates', 'event_title', 'draw_title',
+                    'draw_id', 'match_title', 'match_court']
+
+
+def _is_null(column, value):
+    """True if value is a missing value - None, nan, or the legacy 'n/a' of the column"""
+    if value is None:
+        return True
+    if isinstance(value, float) and value != value:
+        return True
+    return isinstance(value, str) and value == 'n/a' and LEGACY_NULLS[column] == 'n/a'
+
+
+class MatchRecord:
+    """
+    One match result - attributes are RESULT_COLUMNS
+
+    Compared to a match dict:
+        no per record dict - attributes are slots
+        strings repeated across a tournament (CATEGORY_COLUMNS) are interned so every record shares one copy
+        missing values are always None, rather than a mix of np.nan and 'n/a'
+        scores are tuples of int
+
+    get(column) returns the value as the match dict held it ('n/a', np.nan, list of scores), so a
+    MatchRecord can be passed anywhere a match dict is read - CsvResultSink, SeenMatches.record_key.
+    """
+
+    __slots__ = tuple(RESULT_COLUMNS)
+
+    def __init__(self, **fields):
+        """
+        instantiate MatchRecord class
+        :param fields: values of RESULT_COLUMNS - missing columns are None
+        """
+        for column in RESULT_COLUMNS:
+            setattr(self, column, fields.get(column))
+
+    @classmethod
+    def from_dict(cls, record):
+        """
+        build from a match dict - as yielded by TournamentResults or read from a crawl journal
+        :param record: dict - match record
+        :return: MatchRecord
+        """
+        fields = {}
+        for column in RESULT_COLUMNS:
+            value = record.get(column)
+            if _is_null(column, value):
+                value = None
+            elif column in SCORE_COLUMNS:
+                value = tuple(value)
+            elif column in CATEGORY_COLUMNS and type(value) is str:
+                value = sys.intern(value)
+            fields[column] = value
+        return cls(**fields)
+
+    def get(self, column, default=None):
+        """
+        value of column as held in a match dict
+        :param column: str - column name
+        :param default: returned if column isn't a RESULT_COLUMN
+        :return: value - legacy null ('n/a' or np.nan) if missing, scores as list
+        """
+        if column not in LEGACY_NULLS:
+            return default
+        value = getattr(self, column)
+        if value is None:
+            return LEGACY_NULLS[column]
+        if column in SCORE_COLUMNS:
+            return list(value)
+        return value
+
+    def to_dict(self):
+        """
+        :return: dict - match dict, as yielded before MatchRecord
+        """
+        return {column: self.get(column) for column in RESULT_COLUMNS}
+
+    def __eq__(self, other):
+        if not isinstance(other, MatchRecord):
+            return NotImplemented
+        return all(getattr(self, column) == getattr(other, column) for column in RESULT_COLUMNS)
+
+    def __repr__(self):
+        return f'MatchRecord({self.tournament_id}, {self.draw_id}, {self.match_id})'
+
+
+class MatchTable:
+    """
+    Column store of match records
+
+    CATEGORY_COLUMNS are dictionary encoded - each distinct value is stored once and rows hold an
+    int code (-1 for missing). Other columns are lists of values. to_dataframe builds the
+    DataFrame column by column with categorical dtypes, never a dict per row.
+    """
+
+    def __init__(self):
+        self._categories = {col: {} for col in CATEGORY_COLUMNS}
+        self._columns = {col: array('l') if col in CATEGORY_COLUMNS else [] for col in RESULT_COLUMNS}
+        self._len = 0
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        :param records: iterable of MatchRecord or dict
+        :return: MatchTable
+        """
+        table = cls()
+        table.extend(records)
+        return table
+
+    def append(self, record):
+        """
+        :param record: MatchRecord or dict - match record
+        """
+        if not isinstance(record, MatchRecord):
+            record = MatchRecord.from_dict(record)
+        for column in RESULT_COLUMNS:
+            value = getattr(record, column)
+            if column in self._categories:
+                if value is None:
+                    code = -1
+                else:
+                    code = self._categories[column].setdefault(value, len(self._categories[column]))
+                self._columns[column].append(code)
+            else:
+                self._columns[column].append(value)
+        self._len += 1
+
+    def extend(self, records):
+        """
+        :param records: iterable of MatchRecord or dict
+        """
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self._len
+
+    def categories(self, column):
+        """
+        :param column: str - one of CATEGORY_COLUMNS
+        :return: list - distinct values of column, indexed by code
+        """
+        return list(self._categories[column])
+
+    def codes(self, column):
+        """
+        :param column: str - one of CATEGORY_COLUMNS
+        :return: array of int - code of each row, -1 if missing
+        """
+        return self._columns[column]
+
+    def column(self, column):
+        """
+        :param column: str - column name
+        :return: list - value of each row, None if missing
+        """
+        if column in self._categories:
+            categories = self.categories(column)
+            return [categories[code] if code >= 0 else None for code in self._columns[column]]
+        return list(self._columns[column])
+
+    def __iter__(self):
+        columns = [self.column(col) for col in RESULT_COLUMNS]
+        for values in zip(*columns):
+            yield MatchRecord(**dict(zip(RESULT_COLUMNS, values)))
+
+    def to_dataframe(self, columns=None):
+        """
+        :param columns: list of str - columns to include, default RESULT_COLUMNS
+        :return: DataFrame - CATEGORY_COLUMNS categorical, missing values NaN, scores tuples of int
+        """
+        data = {}
+        for column in columns or RESULT_COLUMNS:
+            if column in self._categories:
+                data[column] = pd.Categorical.from_codes(np.asarray(self._columns[column], dtype='int64'),
+                                                         self.categories(column))
+            else:
+                data[column] = self._columns[column]
+        return pd.DataFrame(data, columns=columns or RESULT_COLUMNS)
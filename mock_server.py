@@ -0,0 +1,187 @@
+import argparse
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote
+from http_client import SITE_URL
+from response_cache import ResponseCache
+
+
+class MockSite:
+    """
+    Serves pages recorded in a response cache as if it were SITE_URL, misbehaving on request
+
+    Each request for a path is answered with the page cached for SITE_URL + path, after latency
+    seconds (plus up to jitter seconds). Requests can be made to fail:
+        error_rate - fraction of requests answered 500
+        throttle_rate - fraction of requests answered 429 with a Retry-After header
+        max_rps - requests per second above which every request is answered 429, as a rate limited site does
+    Pages that aren't in the cache are answered 404.
+
+    Point a crawl at it with configure_base_url / --base-url:
+
+        with MockSite('cache', latency=0.2, throttle_rate=0.05) as site:
+            collect_match_data.main(cache_dir=None, base_url=site.url)
+    """
+
+    def __init__(self, cache_dir, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, max_rps=None, retry_after=1, seed=None):
+        """
+        instantiate MockSite class
+        :param cache_dir: str - response cache recorded by a crawl run with --cache-dir
+        :param host: str - interface to listen on
+        :param port: int - port to listen on, 0 picks a free port
+        :param latency: float - seconds before each response
+        :param jitter: float - up to this many seconds added to latency at random
+        :param error_rate: float - fraction of requests answered 500
+        :param throttle_rate: float - fraction of requests answered 429
+        :param max_rps: float - requests per second over the last second answered 429 beyond. None for no limit
+        :param retry_after: int - Retry-After seconds sent with 429s
+        :param seed: int - seed for the random failures and jitter, for repeatable runs
+        """
+        self.cache = ResponseCache(cache_dir, max_bytes=None, replay=True)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.requests = 0
+        self.status_counts = Counter()
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = _ThreadingHTTPServer((host, port), _handler(self))
+
+    @property
+    def url(self):
+        """:return: str - base url to pass to configure_base_url e.g 'http://127.0.0.1:8000'"""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _status(self):
+        """
+        decide how to answer the next request and how long to wait first
+        :return: tuple (status or None to serve the page, delay in seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._recent.append(now)
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            if self.max_rps is not None and len(self._recent) > self.max_rps:
+                return 429, delay
+            draw = self._random.random()
+            if draw < self.error_rate:
+                return 500, delay
+            if draw < self.error_rate + self.throttle_rate:
+                return 429, delay
+        return None, delay
+
+    def _page(self, path):
+        """:return: bytes - cached page for path, None if not recorded"""
+        content = self.cache.get(SITE_URL + path)
+        if content is None and unquote(path) != path:
+            content = self.cache.get(SITE_URL + unquote(path))
+        return content
+
+    def respond(self, path):
+        """
+        :param path: str - request path and query
+        :return: tuple (status, headers, body)
+        """
+        status, delay = self._status()
+        if delay:
+            time.sleep(delay)
+        if status == 429:
+            response = 429, {'Retry-After': str(self.retry_after)}, b'Too Many Requests'
+        elif status == 500:
+            response = 500, {}, b'Internal Server Error'
+        else:
+            content = self._page(path)
+            response = (200, {}, content) if content is not None else (404, {}, b'Not Found')
+        with self._lock:
+            self.status_counts[response[0]] += 1
+        return response
+
+    def start(self):
+        """serve in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _handler(site):
+    """:return: BaseHTTPRequestHandler subclass answering from site"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            status, headers, body = site.respond(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # One line per request drowns out the crawl's own output
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded pages as a local tournamentsoftware site')
+    parser.add_argument('cache_dir', help='response cache directory recorded with --cache-dir')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before each response (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency up to this (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered 429')
+    parser.add_argument('--max-rps', type=float, default=None,
+                        help='requests per second above which requests are answered 429 (default: no limit)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for repeatable failures')
+    args = parser.parse_args()
+
+    site = MockSite(args.cache_dir, args.host, args.port, args.latency, args.jitter, args.error_rate,
+                    args.throttle_rate, args.max_rps, seed=args.seed)
+    print(f'Serving {args.cache_dir} at {site.url} - Ctrl+C to stop')
+    # Stopped with kill when run in the background - print the counts all the same
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+        print(f'{site.requests} requests: {dict(site.status_counts)}')
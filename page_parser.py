@@ -0,0 +1,52 @@
+from bs4 import BeautifulSoup as bs, SoupStrainer
+
+# Fastest available BeautifulSoup tree builder - lxml is C backed, html.parser is pure python
+try:
+    import lxml  # noqa: F401
+    DEFAULT_BACKEND = 'lxml'
+except ImportError:
+    DEFAULT_BACKEND = 'html.parser'
+
+# Regions of each page read by the extractors - anything outside them is never built into the tree.
+# Extractors navigate from the first tag of their region, so they work on full and partial soups alike.
+# Player tournament results: TournamentResults
+RESULTS_REGION = SoupStrainer('div', class_='page-content-start js-is-loading')
+# Ranking table (scrapper) and player.aspx profile link (TourPlayerId)
+LEGACY_REGION = SoupStrainer('div', class_='wrapper--legacy')
+# Player profile heading holding TSID and region
+PROFILE_HEAD_REGION = SoupStrainer('div', class_='page-head page-head--pattern wrapper wrapper--branding')
+# Matches of a draw: TournamentCrawler
+MATCH_REGION = SoupStrainer('li', class_='match-group__item')
+# Links to events and draws: TournamentCrawler
+LINK_REGION = SoupStrainer('a', href=True)
+
+_backend = DEFAULT_BACKEND
+
+
+def configure_parser(backend):
+    """
+    choose the BeautifulSoup tree builder used by parse
+    :param backend: str - 'lxml' or 'html.parser'. None restores DEFAULT_BACKEND
+    """
+    global _backend
+    backend = backend or DEFAULT_BACKEND
+    # Fail now rather than on the first page - raises bs4.FeatureNotFound if not installed
+    bs('', backend)
+    _backend = backend
+
+
+def get_parser():
+    """
+    :return: str - BeautifulSoup tree builder in use
+    """
+    return _backend
+
+
+def parse(content, region=None):
+    """
+    parse html
+    :param content: bytes - page html
+    :param region: SoupStrainer - only parse tags matching region and their descendants. None parses the whole page
+    :return: bs object of page
+    """
+    return bs(content, _backend, parse_only=region)
@@ -0,0 +1,64 @@
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from crawl_metrics import timer
+from page_parser import configure_parser, get_parser
+
+# Process pool pages are parsed in - None parses in the calling thread
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_parse_pool(max_workers):
+    """
+    parse pages in a pool of worker processes rather than in the threads that fetch them.
+    Parsing is CPU bound, so fetch threads alone are capped at one core by the GIL.
+    Call before configure_metrics and before any page is fetched - on Python 3.6 workers are forked, and are
+    started here, so none inherits a lock held by the metrics reporter or a fetch thread.
+    :param max_workers: int - number of parser processes. None or 0 parses in the calling thread
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+        if max_workers:
+            if sys.version_info >= (3, 7):
+                # spawn - fork is unsafe once fetch threads are running
+                _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                # No mp_context before 3.7 - workers are forked, so fork them all now, before any other thread
+                # holds a lock they would inherit. Every worker is started on the first submit
+                if threading.active_count() > 1:
+                    print('Warning: parser processes forked while other threads are running')
+                _pool = ProcessPoolExecutor(max_workers=max_workers)
+                _pool.submit(get_parser).result()
+
+
+def shutdown_parse_pool():
+    """stop parser processes - later pages are parsed in the calling thread"""
+    configure_parse_pool(None)
+
+
+def _parse_in_worker(parser, parse_fn, content):
+    """run parse_fn with the parser chosen in the parent process - workers don't share its page_parser state"""
+    if get_parser() != parser:
+        configure_parser(parser)
+    return parse_fn(content)
+
+
+def parse_page(parse_fn, content):
+    """
+    run a page parser in the pool, blocking the calling thread until it's done
+    :param parse_fn: function - module level function of page html returning plain records. Must not
+                                fetch or touch shared state (TsidResolver, SeenMatches) - workers have their own copy
+    :param content: bytes - page html
+    :return: value returned by parse_fn
+    """
+    # Timed here rather than in the worker - includes waiting for a free worker and pickling the result
+    with timer(f'parse.{parse_fn.__name__}'):
+        pool = _pool
+        if pool is None:
+            return parse_fn(content)
+        return pool.submit(_parse_in_worker, get_parser(), parse_fn, content).result()
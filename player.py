@@ -1,16 +1,19 @@
-from tournament_results import TournamentResults
+from http_client import get_content
+from parse_pool import parse_page
+from tournament_results import iter_parsed_records, parse_results_page
 
 
 class Player:
     '''Class to collect tournament results for a specific player'''
 
-    def __init__(self, url, name, player_ratings_df, df_tour_res):
+    def __init__(self, url, name, ranking_index, tsid_resolver, seen_matches=None):
         '''
         instantiates player object with profile url
         :param url: str - profile url from tournament software
                 name: str - Player name
-                player_ratings_df: DataFrame - Collected by scraping ranking tables
-                df_tour_res: DataFrame - Schema: tour_player_id, tour_ref, tsid
+                ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+                tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+                seen_matches: SeenMatches - matches already extracted from other players' pages, skipped
         '''
         if url[-1] == '/':
             url = url[:-1]
@@ -18,24 +21,55 @@ class Player:
 
         self.url = url
         self.name = name
-        self.player_ratings_df = player_ratings_df
-        self.df_tour_res = df_tour_res
+        self.ranking_index = ranking_index
+        self.tsid_resolver = tsid_resolver
+        self.seen_matches = seen_matches
+        # Matches this player claimed in seen_matches
+        self.claimed_keys = []
 
-    def get_df_tour_res(self):
-        return self.df_tour_res
-
-    def get_tournament_results(self,year):
+    def iter_tournament_results(self, year):
         '''
-        Get results for all tournament matches in given year
+        Yield results for tournament matches in given year as their TSIDs are resolved.
+        The page is parsed in the parse pool if one is configured - TSIDs are always resolved here.
         :param year: int - year in format YYYY e.g 2019
-        :return: pd.DataFrame - results of all matches within given year
+        :return: generator of MatchRecord - results of matches within given year
         '''
         tour_url = self.url + str(year)
-        tour = TournamentResults(tour_url, self.player_ratings_df, self.df_tour_res)
-        if tour.check_if_results_exist():
-            ply_tour_res = tour.collect_all_results()
-            self.df_tour_res = tour.get_df_tour_res()
-            return ply_tour_res
+        results_exist, draws = parse_page(parse_results_page, get_content(tour_url))
+        if results_exist:
+            for draw_dict, parsed_matches in draws:
+                yield from iter_parsed_records(parsed_matches, draw_dict, self.ranking_index, self.tsid_resolver,
+                                               self.seen_matches, self.claimed_keys)
         else:
             print(f'No results for: {self.name} in {year}')
-            return []
\ No newline at end of file
+
+    def get_tournament_results(self,year):
+        '''
+        Get results for all tournament matches in given year
+        :param year: int - year in format YYYY e.g 2019
+        :return: list of MatchRecord - results of all matches within given year
+        '''
+        return list(self.iter_tournament_results(year))
+
+    def iter_season_results(self, years):
+        '''
+        Yield results for tournament matches in each of several years, sharing this player's TSID look ups
+        and seen matches across seasons
+        :param years: iterable of int - years in format YYYY e.g range(2016, 2025)
+        :return: generator of tuples (year, MatchRecord)
+        '''
+        for year in years:
+            for record in self.iter_tournament_results(year):
+                yield year, record
+
+    def get_season_results(self, years):
+        '''
+        Get results for all tournament matches in each of several years
+        :param years: iterable of int - years in format YYYY e.g range(2016, 2025)
+        :return: dict - year: list of MatchRecord, every year included even without results
+        '''
+        years = list(years)
+        results = {year: [] for year in years}
+        for year, record in self.iter_season_results(years):
+            results[year].append(record)
+        return results
\ No newline at end of file
@@ -0,0 +1,89 @@
+import pandas as pd
+
+
+class RankingIndex:
+    """
+    Ranking table loaded once into dict indexes
+
+    The ranking table has one row per player per category (schema as README Rank Table plus Category).
+    Rows are indexed by profile id (the guid at the end of Profile_url), TSID, name and category,
+    so resolving a player does not require filtering the whole table.
+    """
+
+    def __init__(self, df_player_table):
+        """
+        instantiate RankingIndex class
+        :param df_player_table: DataFrame - Collected by scraping ranking tables
+        """
+        self.rows = df_player_table.to_dict('records')
+        self._by_profile_id = {}
+        self._by_tsid = {}
+        self._by_name = {}
+        self._by_category = {}
+        for row in self.rows:
+            profile_url = row.get('Profile_url')
+            profile_id = row.get('Id')
+            if profile_id is None and isinstance(profile_url, str):
+                profile_id = profile_url.split('player-profile/')[-1]
+            if profile_id is not None:
+                # first row wins - same as taking .values[0] of the filtered table
+                self._by_profile_id.setdefault(profile_id, row)
+            self._by_tsid.setdefault(row.get('tsid'), []).append(row)
+            if isinstance(row.get('Player'), str):
+                self._by_name.setdefault(row['Player'].strip().lower(), []).append(row)
+            self._by_category.setdefault(row.get('Category'), []).append(row)
+
+    @classmethod
+    def from_csv(cls, path_csv):
+        """
+        load ranking table csv written by scrapper.py
+        :param path_csv: str - path to csv
+        :return: RankingIndex
+        """
+        return cls(pd.read_csv(path_csv))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, profile_id):
+        return profile_id in self._by_profile_id
+
+    def get_tsid(self, profile_id, default=None):
+        """
+        look up TSID for player profile
+        :param profile_id: str - guid from player-profile/<guid> url
+        :param default: value returned if profile not in ranking table
+        :return: str - TSID
+        """
+        row = self._by_profile_id.get(profile_id)
+        if row is None:
+            return default
+        return row.get('tsid')
+
+    def get_profile(self, profile_id):
+        """
+        :param profile_id: str - guid from player-profile/<guid> url
+        :return: dict - first ranking row for player or None
+        """
+        return self._by_profile_id.get(profile_id)
+
+    def find_by_tsid(self, tsid):
+        """
+        :param tsid: str - TSID
+        :return: list of dict - ranking rows for player across categories
+        """
+        return list(self._by_tsid.get(tsid, []))
+
+    def find_by_name(self, name):
+        """
+        :param name: str - player name, case insensitive
+        :return: list of dict - ranking rows for players with name
+        """
+        return list(self._by_name.get(name.strip().lower(), []))
+
+    def get_category(self, category):
+        """
+        :param category: str - category accronym e.g 'MS'
+        :return: list of dict - ranking rows in category, in table order
+        """
+        return list(self._by_category.get(category, []))
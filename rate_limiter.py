@@ -0,0 +1,213 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class Permit:
+    """One request allowed through an AdaptiveLimiter - handed back to release with how it went"""
+
+    __slots__ = ('started', 'window')
+
+    def __init__(self, started, window):
+        self.started = started
+        # Number of decreases when the request started - only requests started since the last decrease can cause another
+        self.window = window
+
+
+class AdaptiveLimiter:
+    """
+    Limits requests to one host - a token bucket caps the request rate, and an AIMD concurrency limit
+    caps requests in flight
+
+    Concurrency grows additively while responses are healthy (about +1 per limit responses, i.e once per
+    round of requests) and is cut multiplicatively when a response is throttled (429), fails (5xx, connection
+    error, timeout) or is slow. One cut per round - responses to requests started before the last cut don't
+    cut again. A 429's Retry-After pauses every request to the host, not just the one retried.
+
+    A response is slow if it took longer than latency_target. Without a latency_target it's slow when the
+    moving average latency is slow_factor times its lowest value, and over min_slow_latency.
+    """
+
+    def __init__(self, max_rate=10, burst=None, initial_concurrency=4, min_concurrency=1, max_concurrency=32,
+                 increase=1.0, decrease_factor=0.5, latency_target=None, slow_factor=3.0, min_slow_latency=0.5,
+                 max_pause=60):
+        """
+        instantiate AdaptiveLimiter class
+        :param max_rate: float - requests per second. None for no rate limit
+        :param burst: int - requests that can be made at once after an idle period, default max(1, max_rate)
+        :param initial_concurrency: int - requests in flight allowed at first
+        :param min_concurrency: int - lowest concurrency limit backed off to
+        :param max_concurrency: int - highest concurrency limit grown to
+        :param increase: float - concurrency added per round of healthy responses
+        :param decrease_factor: float - concurrency limit multiplied by this on a throttled, failed or slow response
+        :param latency_target: float - seconds above which a response is slow. None adapts to the host
+        :param slow_factor: float - moving average latency this many times its lowest value is slow
+        :param min_slow_latency: float - moving average latency below this is never slow
+        :param max_pause: float - upper bound of a pause for Retry-After in seconds
+        """
+        self.max_rate = max_rate
+        self.burst = burst if burst is not None else max(1, int(max_rate or 1))
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.slow_factor = slow_factor
+        self.min_slow_latency = min_slow_latency
+        self.max_pause = max_pause
+
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.in_flight = 0
+        self.tokens = float(self.burst)
+        self.paused_until = 0.0
+        self.latency = None
+        self.lowest_latency = None
+        self.counts = {'requests': 0, 'ok': 0, 'throttled': 0, 'errors': 0, 'slow': 0, 'increases': 0,
+                       'decreases': 0}
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.max_rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled) * self.max_rate)
+        self._refilled = now
+
+    def acquire(self):
+        """
+        block until a request is allowed - under the concurrency limit, not paused and a token available
+        :return: Permit - pass to release once the response, or error, is in
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.in_flight >= int(self.limit):
+                    # Woken by release
+                    wait = None
+                elif now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if not self.max_rate or self.tokens >= 1:
+                        if self.max_rate:
+                            self.tokens -= 1
+                        self.in_flight += 1
+                        self.counts['requests'] += 1
+                        return Permit(now, self.counts['decreases'])
+                    wait = (1 - self.tokens) / self.max_rate
+                self._cond.wait(wait)
+
+    def _is_slow(self, latency):
+        if self.latency_target is not None:
+            return latency > self.latency_target
+        return (self.lowest_latency is not None and self.latency > self.min_slow_latency
+                and self.latency > self.slow_factor * self.lowest_latency)
+
+    def release(self, permit, latency, status=None, retry_after=None):
+        """
+        :param permit: Permit - from acquire
+        :param latency: float - seconds the request took
+        :param status: int - HTTP status, None if the request failed without a response
+        :param retry_after: str - Retry-After header of a 429
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status == 429:
+                self.counts['throttled'] += 1
+                self._pause(now, retry_after)
+                self._decrease(permit, now)
+            elif status is None or status >= 500:
+                self.counts['errors'] += 1
+                self._decrease(permit, now)
+            else:
+                self.counts['ok'] += 1
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self._is_slow(latency):
+                    self.counts['slow'] += 1
+                    self._decrease(permit, now)
+                else:
+                    if self.lowest_latency is None or self.latency < self.lowest_latency:
+                        self.lowest_latency = self.latency
+                    if self.limit < self.max_concurrency:
+                        self.limit = min(self.max_concurrency, self.limit + self.increase / self.limit)
+                        self.counts['increases'] += 1
+            self._cond.notify_all()
+
+    def _pause(self, now, retry_after):
+        try:
+            pause = min(self.max_pause, float(retry_after)) if retry_after else 0
+        except ValueError:
+            # Retry-After as an HTTP date - left to the client's backoff
+            pause = 0
+        self.paused_until = max(self.paused_until, now + pause)
+
+    def _decrease(self, permit, now):
+        if permit.window < self.counts['decreases']:
+            # Already cut since this request started
+            return
+        self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+        self.counts['decreases'] += 1
+
+    def state(self):
+        """
+        :return: dict - current limits and counts, json serialisable
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {'concurrency_limit': round(self.limit, 2),
+                    'in_flight': self.in_flight,
+                    'max_rate': self.max_rate,
+                    'tokens': round(self.tokens, 2),
+                    'paused_for': round(max(0.0, self.paused_until - now), 3),
+                    'latency_avg': round(self.latency, 4) if self.latency is not None else None,
+                    'latency_lowest': round(self.lowest_latency, 4) if self.lowest_latency is not None else None,
+                    **self.counts}
+
+
+class HostRateLimiter:
+    """
+    An AdaptiveLimiter per host, created on first request to it with the same settings
+
+        limiter = HostRateLimiter(max_rate=5)
+        permit = limiter.acquire(url)
+        ...
+        limiter.release(url, permit, latency, status)
+    """
+
+    def __init__(self, **kwargs):
+        """
+        instantiate HostRateLimiter class
+        :param kwargs: AdaptiveLimiter arguments, applied to every host
+        """
+        self.kwargs = kwargs
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, url):
+        """
+        :param url: str - request url
+        :return: AdaptiveLimiter - limiter of url's host
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveLimiter(**self.kwargs)
+            return limiter
+
+    def acquire(self, url):
+        """:return: Permit - see AdaptiveLimiter.acquire"""
+        return self.for_host(url).acquire()
+
+    def release(self, url, permit, latency, status=None, retry_after=None):
+        """see AdaptiveLimiter.release"""
+        self.for_host(url).release(permit, latency, status, retry_after)
+
+    def state(self):
+        """
+        :return: dict - host: AdaptiveLimiter.state()
+        """
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: limiter.state() for host, limiter in sorted(limiters.items())}
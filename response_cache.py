@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a url has not been cached"""
+
+
+class ResponseCache:
+    """
+    On-disk cache of page content keyed by url
+
+    Each url is hashed (sha256) to a key. The page body is saved as <key>.html and
+    a small <key>.json sidecar records the url, size and time fetched:
+
+        cache_dir/ab/abcdef....html
+        cache_dir/ab/abcdef....json
+
+    Entries older than max_age are treated as misses and removed. When the total size of cached
+    bodies grows beyond max_bytes the least recently used entries are evicted, down to low_water of
+    max_bytes - so the directory is scanned once per low_water fraction of max_bytes written, not on
+    every put of a full cache. total_bytes is re-counted from disk on each eviction, as other processes
+    may share the directory.
+
+    In replay mode the cache never goes to the network: stale entries are still served and a
+    url that is not cached raises CacheMiss. This allows parsers to be re-run over a season of html offline.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, max_age=None, replay=False, low_water=0.9):
+        """
+        instantiate ResponseCache class
+        :param cache_dir: str - directory to store cached pages in (created if missing)
+        :param max_bytes: int - maximum total size of cached page bodies. None for no limit
+        :param max_age: int - seconds an entry remains valid. None for no limit
+        :param replay: bool - serve only from cache, never fetch
+        :param low_water: float - fraction of max_bytes eviction brings the cache down to
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.replay = replay
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._scan())
+
+    @staticmethod
+    def url_key(url):
+        """hash url to cache key"""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        """return (body path, meta path) for key"""
+        stem = os.path.join(self.cache_dir, key[:2], key)
+        return stem + '.html', stem + '.json'
+
+    def _scan(self):
+        """
+        list all cached bodies
+        :return: list of tuples (body path, size, last used)
+        """
+        entries = []
+        for sub_dir in os.listdir(self.cache_dir):
+            sub_path = os.path.join(self.cache_dir, sub_dir)
+            if not os.path.isdir(sub_path):
+                continue
+            for file_name in os.listdir(sub_path):
+                if file_name.endswith('.html'):
+                    stat = os.stat(os.path.join(sub_path, file_name))
+                    entries.append((os.path.join(sub_path, file_name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def _remove(self, body_path):
+        """remove body and sidecar for an entry, updating cache size"""
+        try:
+            size = os.path.getsize(body_path)
+            os.remove(body_path)
+            self.total_bytes -= size
+        except OSError:
+            pass
+        try:
+            os.remove(body_path[:-len('.html')] + '.json')
+        except OSError:
+            pass
+
+    def _is_expired(self, meta_path):
+        if self.max_age is None:
+            return False
+        try:
+            with open(meta_path) as f:
+                fetched_at = json.load(f)['fetched_at']
+        except (OSError, ValueError, KeyError):
+            return True
+        return time.time() - fetched_at > self.max_age
+
+    def get(self, url):
+        """
+        look up url in cache
+        :param url: str - page url
+        :return: bytes - cached page content or None if not cached/expired
+        """
+        body_path, meta_path = self._paths(self.url_key(url))
+        with self._lock:
+            if not os.path.exists(body_path):
+                return None
+            if not self.replay and self._is_expired(meta_path):
+                self._remove(body_path)
+                return None
+            with open(body_path, 'rb') as f:
+                content = f.read()
+            # Touch entry so eviction is least recently used
+            os.utime(body_path, None)
+        return content
+
+    def put(self, url, content):
+        """
+        save page content to cache
+        :param url: str - page url
+        :param content: bytes - page content
+        """
+        body_path, meta_path = self._paths(self.url_key(url))
+        with self._lock:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            if os.path.exists(body_path):
+                self.total_bytes -= os.path.getsize(body_path)
+            # Write to temp file first so a crash never leaves a truncated page in the cache. Named uniquely,
+            # as workers sharing the directory may write the same page at once
+            tmp_path = f'{body_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, body_path)
+            with open(meta_path, 'w') as f:
+                json.dump({'url': url, 'size': len(content), 'fetched_at': time.time()}, f)
+            self.total_bytes += len(content)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """remove least recently used entries until cache is within low_water of max_bytes"""
+        entries = self._scan()
+        # Re-sync - workers sharing the directory add and evict entries this instance doesn't count
+        self.total_bytes = sum(size for _, size, _ in entries)
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * self.low_water
+        for body_path, _, _ in sorted(entries, key=lambda entry: entry[2]):
+            if self.total_bytes <= target:
+                break
+            self._remove(body_path)
+
+    def iter_entries(self):
+        """
+        every page in the cache, in url order - e.g to replay a recorded corpus through the parsers
+        :return: generator of tuples (url, content)
+        """
+        entries = []
+        for body_path, _, _ in self._scan():
+            try:
+                with open(body_path[:-len('.html')] + '.json') as f:
+                    entries.append((json.load(f)['url'], body_path))
+            except (OSError, ValueError, KeyError):
+                continue
+        for url, body_path in sorted(entries):
+            try:
+                with open(body_path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                continue
+            yield url, content
+
+    def prune(self):
+        """remove expired entries and evict down to max_bytes"""
+        with self._lock:
+            for body_path, _, _ in self._scan():
+                if self._is_expired(body_path[:-len('.html')] + '.json'):
+                    self._remove(body_path)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
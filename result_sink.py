@@ -0,0 +1,188 @@
+import csv
+import os
+
+# Columns of the tournament results csv - same order as the DataFrame previously written by collect_match_data
+RESULT_COLUMNS = ['draw_id',
+                  'draw_title',
+                  'event_title',
+                  'location',
+                  'losing_team_p1',
+                  'losing_team_p1_tsid',
+                  'losing_team_p2',
+                  'losing_team_p2_tsid',
+                  'losing_team_scores',
+                  'match_court',
+                  'match_date',
+                  'match_duration',
+                  'match_id',
+                  'match_title',
+                  'tour_dates',
+                  'tournament',
+                  'tournament_id',
+                  'winning_team_p1',
+                  'winning_team_p1_tsid',
+                  'winning_team_p2',
+                  'winning_team_p2_tsid',
+                  'winning_team_scores']
+
+
+def _csv_value(value):
+    """format value as pandas would in to_csv - missing values (None, nan) are empty"""
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return value
+
+
+class CsvResultSink:
+    """
+    Write match records to csv as they are collected
+
+    Rows are written straight to disk so the crawl never holds a whole season of results in memory.
+    Can be used as a context manager:
+
+        with CsvResultSink(path) as sink:
+            sink.write_many(records)
+    """
+
+    def __init__(self, path_csv, columns=None, append=False):
+        """
+        instantiate CsvResultSink class
+        :param path_csv: str - path to csv
+        :param columns: list of str - csv columns, default RESULT_COLUMNS
+        :param append: bool - append to an existing csv rather than overwrite it
+        """
+        self.path_csv = path_csv
+        self.columns = columns or RESULT_COLUMNS
+        self.rows_written = 0
+        write_header = not (append and os.path.exists(path_csv) and os.path.getsize(path_csv) > 0)
+        self._file = open(path_csv, 'a' if append else 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+        if write_header:
+            self._writer.writeheader()
+
+    def write(self, record):
+        """
+        :param record: MatchRecord or dict - match record
+        """
+        self._writer.writerow({col: _csv_value(record.get(col)) for col in self.columns})
+        self.rows_written += 1
+
+    def write_many(self, records):
+        """
+        :param records: iterable of MatchRecord or dict - match records
+        """
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """flush buffered rows to disk"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TeeResultSink:
+    """Write match records to several sinks e.g a csv and a LocalStore - rows_written is the first sink's"""
+
+    def __init__(self, sinks):
+        """
+        instantiate TeeResultSink class
+        :param sinks: list - result sinks, each written every record
+        """
+        self.sinks = list(sinks)
+
+    @property
+    def rows_written(self):
+        return self.sinks[0].rows_written
+
+    def write(self, record):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def write_many(self, records):
+        """
+        :param records: iterable of MatchRecord or dict - match records
+        """
+        records = list(records)
+        for sink in self.sinks:
+            sink.write_many(records)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SeasonResultSinks:
+    """
+    A result sink per season - records of a multi-season crawl are written to their season's partition
+
+        with SeasonResultSinks(lambda year: CsvResultSink(f'results_{year}.csv'), range(2016, 2025)) as sinks:
+            sinks.write_many(records, 2017)
+    """
+
+    def __init__(self, open_sink, seasons):
+        """
+        instantiate SeasonResultSinks class
+        :param open_sink: function - season -> CsvResultSink or ParquetResultSink
+        :param seasons: iterable of int - seasons opened now, so each has a file even without results.
+                                          Other seasons are opened on first write
+        """
+        self.open_sink = open_sink
+        self.seasons = list(seasons)
+        self._sinks = {}
+        for season in self.seasons:
+            self.sink(season)
+
+    def sink(self, season):
+        """
+        :param season: int - year in format YYYY
+        :return: CsvResultSink or ParquetResultSink - sink of season
+        """
+        if season not in self._sinks:
+            self._sinks[season] = self.open_sink(season)
+        return self._sinks[season]
+
+    @property
+    def rows_written(self):
+        return sum(sink.rows_written for sink in self._sinks.values())
+
+    def write_many(self, records, season):
+        """
+        :param records: iterable of MatchRecord or dict - match records
+        :param season: int - year in format YYYY
+        """
+        self.sink(season).write_many(records)
+
+    def flush(self):
+        for sink in self._sinks.values():
+            sink.flush()
+
+    def close(self):
+        for sink in self._sinks.values():
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,14 +1,17 @@
-import requests
-from bs4 import BeautifulSoup as bs
+import argparse
 import pandas as pd
 import re
-
-# Cookies required to gain access to Badminton England
-cookies = {'ASP.NET_SessionId': 'samot0pr3nnbuav0vs3l1oop',
-           'st': 'l=2057&exp=44802.7753505324&c=1&cp=20',
-           'expires': 'Mon, 29-Aug-2022 16:36:30 GMT',
-           'path': '/'
-           }
+from concurrent.futures import ThreadPoolExecutor
+from columnar_store import write_rankings
+from local_store import LocalStore
+from crawl_metrics import configure_metrics, get_metrics, incr, record_failure, stop_metrics
+from http_client import COOKIES, SITE_URL, FetchError, configure_base_url, configure_cache, configure_rate_limiter, \
+    get_content
+from page_parser import LEGACY_REGION, PROFILE_HEAD_REGION, parse
+from parse_pool import configure_parse_pool, parse_page, shutdown_parse_pool
+
+# Cookies required to gain access to Badminton England - shared with all other fetches
+cookies = COOKIES
 
 # Set up categories to iteraate through
 categories_ = ['MS', 'WS', 'MD', 'WD', 'Men\'s XD', 'Woman\'s XD']
@@ -42,25 +45,25 @@ def create_url_ranking_table(rank_table_id, cat, pg, rows_per_page):
     returns:
         url - str - url for the requested table
     '''
-    return f'https://be.tournamentsoftware.com/ranking/' \
+    return f'{SITE_URL}/ranking/' \
            f'category.aspx?id={last_entry_dec_2018}&' \
            f'category={cat}&C574CS=0&C574FTYAF=0&C57' \
            f'4FTYAT=0&C574FOG_2_F512=&p={pg}&ps={rows_per_page}'
 
 
-def generateSoup(url, cookies):
+def generateSoup(url, cookies, region=None):
     '''
     Generate bs object from url and cookies
 
     args:
         url - str - url of ranking result tables
         cookies - dict - providing cookies to avoid data privacy pop up
+        region - SoupStrainer - only parse this part of the page, None parses the whole page
 
     return:
         soup - bs object of page
     '''
-    page = requests.get(url, cookies=cookies)
-    return bs(page.content, 'html.parser')
+    return parse(get_content(url, cookies), region)
 
 
 def find_last_pg_pagination(soup):
@@ -76,8 +79,7 @@ def find_last_pg_pagination(soup):
     return:
         last_page - int - page number of last page e.g 8 (max last page will actually be 7)
     '''
-    last_page = re.search('1 of \d*', soup.find('div', class_='content') \
-                          .find('div', class_='wrapper--legacy').find('table') \
+    last_page = re.search('1 of \d*', soup.find('div', class_='wrapper--legacy').find('table') \
                           .find_all('tr')[-1].text).group().split(' ')[-1]
 
     last_page = int(last_page) + 1
@@ -126,8 +128,7 @@ def getTableRows(soup):
     return:
         table_rows - list (bs.elements) - list of table row elements
     '''
-    table_rows = soup.find('div', class_='content') \
-        .find('div', class_='wrapper--legacy') \
+    table_rows = soup.find('div', class_='wrapper--legacy') \
         .find('table').find_all('tr')
 
     return table_rows
@@ -161,7 +162,7 @@ def extractRowData(soup, headings, result_dict):
 
                     else:
                         if val.find('a').get('href'):
-                            url = 'https://be.tournamentsoftware.com' + val.find('a').get('href')
+                            url = SITE_URL + val.find('a').get('href')
                             result_dict[hd].append(url)
                         else:
                             result_dict[hd].append(None)
@@ -182,72 +183,99 @@ def createEmptyResultsDict():
     return results_dict
 
 
-def appendResultsDF(df_results, cat_results):
+def parseRankingPage(content, first_page=False):
     '''
-    append results dict for a category to Results DataFrame
+    Parse a single page of a ranking table - safe to run in a parser process
 
     args:
-        df_results - DataFrame - DataFrame of all results
-        cat_results - dict - Results from single category
+        content - bytes - page html
+        first_page - bool - also read the number of pages from the pagination row
 
     return:
-        df_results - DataFrame - DataFrame of all result updated with cat_resulst
+        (last_page, results_dict) - see find_last_pg_pagination, None if not first_page, and the rows of the page
     '''
-    # Convert dict to DF
-    df_cat = pd.DataFrame.from_dict(cat_results)
+    # Only the ranking table is parsed
+    soup = parse(content, LEGACY_REGION)
+    last_page = find_last_pg_pagination(soup) if first_page else None
+    return last_page, extractRowData(soup, headings, createEmptyResultsDict())
 
-    df_results = pd.concat([df_results, df_cat],
-                           axis=0,
-                           ignore_index=True)
 
-    return df_results
+def parseFirstRankingPage(content):
+    return parseRankingPage(content, first_page=True)
 
 
-def generateResultsDF(cookies, category_dict, rows_per_page):
+def collectRankingPage(cat_id, page, rows_per_page, cookies):
+    '''
+    Fetch and parse a single page of a ranking table. Parsed in the parse pool if one is configured
+
+    args:
+        cat_id - int - category id e.g 574
+        page - int - page number
+        rows_per_page - str - number of results to display per page "100"
+        cookies - dict - providing cookies to avoid data privacy pop up
+
+    return:
+        (last_page, results_dict) - last page if page is 1, else None, and the rows extracted from the page
+    '''
+    url = create_url_ranking_table(last_entry_dec_2018, cat_id, str(page), rows_per_page)
+    return parse_page(parseFirstRankingPage if page == 1 else parseRankingPage, get_content(url, cookies))
+
+
+def generateResultsDF(cookies, category_dict, rows_per_page, max_workers=16):
     '''
     Top level function to generate results DataFrame
 
+    Page 1 of every category is fetched first to find the number of pages. All remaining
+    pages are then known up front, so every (category, page) is fetched and parsed concurrently
+    and the rows are assembled into one DataFrame in category and page order.
+
     args:
         cookies - dict - providing cookies to avoid data privacy pop up
         category_dict - dict - keys category accronyms, values category ids
         rows_per_page - str - number of results to display per page "100"
+        max_workers - int - number of pages fetched at once
 
     return:
         df_results - DataFrame - ranking results
     '''
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # First page of each category - gives the last page of the table
+        first_pages = {cat: executor.submit(collectRankingPage, cat_id, 1, rows_per_page, cookies)
+                       for cat, cat_id in category_dict.items()}
+
+        page_futures = {}
+        for cat, cat_id in category_dict.items():
+            last_page, results_dict = first_pages[cat].result()
+            print(f"Working on {cat} - extracting results from {last_page - 1} pages")
+            page_futures[cat] = [results_dict] + [
+                executor.submit(collectRankingPage, cat_id, page, rows_per_page, cookies)
+                for page in range(2, last_page)]
+
+        # Combine pages in order
+        all_results = createEmptyResultsDict()
+        all_results['Category'] = []
+        for cat, pages in page_futures.items():
+            for page in pages:
+                results_dict = page if isinstance(page, dict) else page.result()[1]
+                for hd, values in results_dict.items():
+                    all_results[hd] += values
+                all_results['Category'] += [cat] * len(results_dict['Rank'])
+                incr('ranking.rows', len(results_dict['Rank']))
+
+    return pd.DataFrame.from_dict(all_results)
+
+
+def extractTSID(soup):
+    '''
+    Extract TSID from player profile page
 
-    # Generate empy result DF
-    df_results = pd.DataFrame.from_dict(createEmptyResultsDict())
-    # Iterate through all categories
-    for cat, cat_id in category_dict.items():
-        print(f"Working on {cat}")
-        # Generate url
-        url = create_url_ranking_table(last_entry_dec_2018, cat_id, '1', rows_per_page)
-        # Create emtpy results dict
-        results_dict = createEmptyResultsDict()
-        # Convert page to soup
-        soup = generateSoup(url, cookies)
-        # Get last page of table
-        last_page = find_last_pg_pagination(soup)
-        # Iterate through pages
-        for page in range(1, last_page):
-            if page == 1 or page % 5 == 0 or page == (last_page - 1):
-                print(f'Extracting results from page {page} of {last_page - 1}')
-            url_ = create_url_ranking_table(last_entry_dec_2018, cat_id, str(page), rows_per_page)
-            soup_ = generateSoup(url_, cookies)
-            results_dict = extractRowData(soup_, headings, results_dict)
-
-        # Create category column
-        results_dict['Category'] = cat
-
-        df_results = appendResultsDF(df_results, results_dict)
-
-    return df_results
-
+    args:
+        soup - BS object - soup of player profile page
 
-def getTSID(url, cookies):
+    return:
+        tsid - str - TSID or 'N/A' if not shown
+    '''
     try:
-        soup = generateSoup(url, cookies)
         tsid = soup.find('div', class_='page-head page-head--pattern wrapper wrapper--branding') \
                    .find('span',class_='media__title-aside').text[1:-1]
     except:
@@ -255,9 +283,17 @@ def getTSID(url, cookies):
     return tsid
 
 
-def getRegion(url, cookies):
+def extractRegion(soup):
+    '''
+    Extract region from player profile page
+
+    args:
+        soup - BS object - soup of player profile page
+
+    return:
+        region - str - region or 'N/A' if not shown
+    '''
     try:
-        soup = generateSoup(url, cookies)
         region = soup.find('div', class_='page-head page-head--pattern wrapper wrapper--branding') \
             .find('div', class_='media__content-subinfo') \
             .find('small', class_='media__subheading') \
@@ -266,16 +302,155 @@ def getRegion(url, cookies):
         region = 'N/A'
     return region
 
-def main():
+
+# Columns added to the ranking table from the player profile page - column name: extractor
+profile_fields = {'tsid': extractTSID,
+                  'region': extractRegion}
+
+
+def parseProfilePage(content):
+    '''
+    Extract every field in profile_fields from a player profile page - safe to run in a parser process
+
+    args:
+        content - bytes - page html
+
+    return:
+        details - dict - keys profile_fields
+    '''
+    soup = parse(content, PROFILE_HEAD_REGION)
+    return {field: extract(soup) for field, extract in profile_fields.items()}
+
+
+def getProfileDetails(url, cookies, failed_urls=None):
+    '''
+    Fetch a player profile page once and extract every field in profile_fields from it.
+    Parsed in the parse pool if one is configured
+
+    args:
+        url - str - player profile url
+        cookies - dict - providing cookies to avoid data privacy pop up
+        failed_urls - list - url is appended if the page could not be fetched after all retries
+
+    return:
+        details - dict - keys profile_fields, values 'N/A' if page could not be read
+    '''
+    try:
+        content = get_content(url, cookies)
+    except FetchError as e:
+        # One profile must not fail the whole ranking table - recorded, and retried by enrichProfiles
+        record_failure('profile', e, url=url)
+        if failed_urls is not None:
+            failed_urls.append(url)
+        return {field: 'N/A' for field in profile_fields}
+    except Exception as e:
+        record_failure('profile', e, url=url)
+        return {field: 'N/A' for field in profile_fields}
+    return parse_page(parseProfilePage, content)
+
+
+def getTSID(url, cookies):
+    return getProfileDetails(url, cookies)['tsid']
+
+
+def getRegion(url, cookies):
+    return getProfileDetails(url, cookies)['region']
+
+
+def enrichProfiles(df_rank_results, cookies, max_workers=16):
+    '''
+    Add profile_fields columns to the ranking table.
+    Players ranked in several categories share a profile, so each distinct profile url is fetched
+    once, with up to max_workers pages fetched concurrently. Profiles that could not be fetched are
+    tried once more at the end, and left 'N/A' if they fail again.
+
+    args:
+        df_rank_results - DataFrame - ranking results with Profile_url column
+        cookies - dict - providing cookies to avoid data privacy pop up
+        max_workers - int - number of profile pages fetched at once
+
+    return:
+        df_rank_results - DataFrame - with a column for each of profile_fields
+    '''
+    profile_urls = list(df_rank_results['Profile_url'].dropna().unique())
+    print(f'Collecting {len(profile_urls)} player profiles')
+    failed_urls = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        details = dict(zip(profile_urls, executor.map(lambda url: getProfileDetails(url, cookies, failed_urls),
+                                                      profile_urls)))
+        if failed_urls:
+            print(f'Retrying {len(failed_urls)} player profiles')
+            retry_urls = list(failed_urls)
+            details.update(zip(retry_urls, executor.map(lambda url: getProfileDetails(url, cookies), retry_urls)))
+
+    missing = {field: 'N/A' for field in profile_fields}
+    for field in profile_fields:
+        df_rank_results[field] = df_rank_results['Profile_url'].apply(lambda x: details.get(x, missing)[field])
+
+    return df_rank_results
+
+def main(cache_dir=None, replay=False, max_workers=16, parse_workers=None, output_format='csv', base_url=None,
+         metrics_path=None, max_rate=10, store_path=None):
+    '''
+    Collect ranking tables, TSIDs and regions for all categories
+
+    args:
+        cache_dir - str - directory for the on-disk response cache. None disables caching
+        replay - bool - only parse pages already in cache_dir, never touch the network
+        max_workers - int - number of pages fetched at once
+        parse_workers - int - number of processes pages are parsed in. None parses in the fetching threads
+        output_format - str - 'csv' or 'parquet'
+        base_url - str - host to fetch pages from e.g a mock_server 'http://localhost:8000'. None fetches from SITE_URL
+        metrics_path - str - json file fetch and parse metrics are written to every 30s and at the end
+        max_rate - float - requests per second to the site, None or 0 for no limit. Requests in flight adapt
+                           up to max_workers to how quickly the site responds
+        store_path - str - LocalStore SQLite database the ranking table is also upserted into
+    '''
+    # First - on Python 3.6 parser processes are forked, before the metrics reporter or any fetch thread starts
+    configure_parse_pool(parse_workers)
+    configure_metrics(metrics_path)
+    configure_rate_limiter(max_rate=max_rate, max_concurrency=max_workers)
+    configure_base_url(base_url)
+    if cache_dir:
+        configure_cache(cache_dir, replay=replay)
+
     print('Generating Basic Results Table...')
-    df_rank_results = generateResultsDF(cookies, category_dict, rows_per_page)
-    print('Collecting TSIDs')
-    df_rank_results['tsid'] = df_rank_results['Profile_url'].apply(lambda x: getTSID(x, cookies))
-    print('Collecting Region')
-    df_rank_results['region'] = df_rank_results['Profile_url'].apply(lambda x: getRegion(x, cookies))
+    df_rank_results = generateResultsDF(cookies, category_dict, rows_per_page, max_workers)
+    print('Collecting TSIDs and Region')
+    df_rank_results = enrichProfiles(df_rank_results, cookies, max_workers)
     print('Save Results')
-    df_rank_results.to_csv('player_rankings_2019.csv',index=False)
+    if output_format == 'parquet':
+        write_rankings(df_rank_results, 'player_rankings_2019.parquet')
+    else:
+        df_rank_results.to_csv('player_rankings_2019.csv',index=False)
+    if store_path:
+        with LocalStore(store_path) as store:
+            store.upsert_rankings(df_rank_results)
+    shutdown_parse_pool()
+    stop_metrics()
+    print(get_metrics().summary())
 
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Collect ranking tables, TSIDs and regions for all categories')
+    parser.add_argument('--max-workers', type=int, default=16,
+                        help='number of pages fetched at once, and most requests in flight to the site (default: 16)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory to cache downloaded pages in')
+    parser.add_argument('--replay', action='store_true',
+                        help='re-run parsers over pages in --cache-dir without fetching')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='number of processes to parse pages in (default: parse in the fetching threads)')
+    parser.add_argument('--format', '--output-format', dest='output_format', default='csv', choices=['csv', 'parquet'],
+                        help='ranking table file format (default: csv)')
+    parser.add_argument('--base-url', default=None,
+                        help='host to fetch pages from e.g a mock_server http://localhost:8000 (default: the live site)')
+    parser.add_argument('--metrics', default=None,
+                        help='json file fetch and parse metrics are written to periodically (default: printed at the end only)')
+    parser.add_argument('--max-rate', type=float, default=10,
+                        help='requests per second to the site, 0 for no limit (default: 10)')
+    parser.add_argument('--store', default=None,
+                        help='SQLite store the ranking table is also written to (see local_store.py)')
+    args = parser.parse_args()
+    main(args.cache_dir, args.replay, args.max_workers, args.parse_workers, args.output_format, args.base_url,
+         args.metrics, args.max_rate, args.store)
\ No newline at end of file
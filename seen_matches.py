@@ -0,0 +1,139 @@
+import threading
+
+
+class SeenMatches:
+    """
+    Set of matches already extracted during a crawl, keyed on (tournament_id, draw_id, match_id)
+
+    The same match appears on the tournament page of every player in it. The first player to
+    claim a match extracts it and everyone else skips it before any parsing or TSID resolution.
+    Claims made by a player whose crawl fails can be released so another player picks the match up.
+
+    When units of work are crawled concurrently, which unit claims a match first depends on timing.
+    Claims can be made for an owner - the unit's index. A unit with a lower index takes a match over
+    from a higher one, and a unit with a higher index extracts its own copy while every lower owner is
+    still running, since that owner may yet fail and release it. Once a unit completes it is settled and
+    later units skip its matches. Each match is written by its lowest remaining owner (owns), so every
+    match ends up with the first unit that has it, as in a sequential crawl. Claims without an owner
+    e.g matches already journaled are never taken over.
+    """
+
+    def __init__(self):
+        # key: tuple of owner indexes, lowest first - (None,) if claimed without an owner
+        self._keys = {}
+        # owners whose unit completed - their claims are never released
+        self._settled = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def match_key(tournament_id, draw_id, match_id):
+        """
+        :return: tuple - key of match, None if match has no id and can't be de-duplicated
+        """
+        if match_id is None or match_id == 'n/a':
+            return None
+        return str(tournament_id), str(draw_id), str(match_id)
+
+    @classmethod
+    def record_key(cls, record):
+        """
+        :param record: dict - match record
+        :return: tuple - key of match, None if match has no id
+        """
+        return cls.match_key(record.get('tournament_id'), record.get('draw_id'), record.get('match_id'))
+
+    def claim(self, key, owner=None):
+        """
+        :param key: tuple - key from match_key
+        :param owner: int - index of the claiming unit. None claims for good
+        :return: bool - True if match should be extracted - it had not been seen, or no earlier unit that has
+                        it is settled
+        """
+        with self._lock:
+            owners = self._keys.get(key)
+            if owners is None:
+                self._keys[key] = (owner,)
+                return True
+            if owner is None or owners[0] is None or owner in owners:
+                return False
+            if any(current < owner and current in self._settled for current in owners):
+                return False
+            self._keys[key] = tuple(sorted(owners + (owner,)))
+            return True
+
+    def release(self, keys, owner=None):
+        """
+        forget claims - used when the player that claimed the matches failed
+        :param keys: iterable of tuple
+        :param owner: int - only forget owner's claims, a match passes to the next unit that extracted it.
+                            None forgets every claim
+        """
+        with self._lock:
+            for key in keys:
+                owners = self._keys.get(key)
+                if owners is None:
+                    continue
+                remaining = tuple(current for current in owners if current != owner) if owner is not None else ()
+                if remaining:
+                    self._keys[key] = remaining
+                else:
+                    del self._keys[key]
+
+    def settle(self, owner=None):
+        """
+        mark a unit completed - its claims are final, so later units skip its matches
+        :param owner: int - index of a unit, None for claims without an owner which are final already
+        """
+        if owner is not None:
+            with self._lock:
+                self._settled.add(owner)
+
+    def owns(self, key, owner):
+        """
+        :param key: tuple - key from match_key, None for a match without an id
+        :param owner: int - index of a unit
+        :return: bool - False if an earlier unit that extracted the match still has it
+        """
+        if key is None:
+            return True
+        with self._lock:
+            owners = self._keys.get(key)
+            return owners is None or owners[0] == owner
+
+    def for_owner(self, owner):
+        """
+        :param owner: int - index of a unit of work
+        :return: OwnedClaims - claims made through it are owner's
+        """
+        return OwnedClaims(self, owner)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class OwnedClaims:
+    """SeenMatches as seen by one unit of work - passed to Player or TournamentCrawler in its place"""
+
+    __slots__ = ('seen_matches', 'owner')
+
+    def __init__(self, seen_matches, owner):
+        self.seen_matches = seen_matches
+        self.owner = owner
+
+    def claim(self, key):
+        return self.seen_matches.claim(key, self.owner)
+
+    def release(self, keys):
+        self.seen_matches.release(keys, self.owner)
+
+    def settle(self):
+        self.seen_matches.settle(self.owner)
+
+    def __contains__(self, key):
+        return key in self.seen_matches
+
+    def __len__(self):
+        return len(self.seen_matches)
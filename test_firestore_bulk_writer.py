@@ -0,0 +1,91 @@
+"""
+BulkWriter against LocalFirestoreClient with injected commit failures - every document lands exactly once
+
+Run with: python -m pytest test_firestore_bulk_writer.py
+"""
+import threading
+import time
+import pytest
+from firestore_bulk_writer import BulkWriteError, BulkWriter
+from local_firestore import LocalFirestoreClient, LocalWriteBatch
+
+COLLECTION = 'Player_Tournament_Results'
+# Not a multiple of the batch size - the last batch is partial
+DOCUMENTS = 1234
+BATCH_SIZE = 100
+
+
+class CountingClient(LocalFirestoreClient):
+    """LocalFirestoreClient recording the most commits in progress at once"""
+
+    def __init__(self, fail_rate=0.0, seed=None):
+        super().__init__(fail_rate, seed)
+        self.in_progress = 0
+        self.most_in_progress = 0
+        self.count_lock = threading.Lock()
+
+    def batch(self):
+        return CountingBatch(self)
+
+
+class CountingBatch(LocalWriteBatch):
+
+    def commit(self):
+        with self._client.count_lock:
+            self._client.in_progress += 1
+            self._client.most_in_progress = max(self._client.most_in_progress, self._client.in_progress)
+        try:
+            # Long enough for other batches to start committing
+            time.sleep(0.01)
+            super().commit()
+        finally:
+            with self._client.count_lock:
+                self._client.in_progress -= 1
+
+
+def documents():
+    return [{'match_id': str(num), 'winning_team_scores': [21, 15]} for num in range(DOCUMENTS)]
+
+
+def written_match_ids(db):
+    return sorted(int(data['match_id']) for data in db.collections.get(COLLECTION, {}).values())
+
+
+def test_failed_batches_are_retried_without_duplicates():
+    db = LocalFirestoreClient(fail_rate=0.3, seed=1)
+    writer = BulkWriter(db, batch_size=BATCH_SIZE, max_in_flight=4, max_retries=10, backoff_factor=0)
+    # Automatic ids - a retried batch that generated new ids would write its documents twice
+    stats = writer.set_documents(COLLECTION, [None] * DOCUMENTS, documents())
+
+    assert written_match_ids(db) == list(range(DOCUMENTS))
+    assert stats['documents'] == DOCUMENTS
+    assert stats['batches'] == -(-DOCUMENTS // BATCH_SIZE)
+    # Some commits failed and were retried
+    assert db.commits > stats['batches']
+
+
+def test_final_partial_batch_is_committed():
+    db = LocalFirestoreClient()
+    writer = BulkWriter(db, batch_size=BATCH_SIZE, max_in_flight=4)
+    writer.set_documents(COLLECTION, [f'doc{num}' for num in range(DOCUMENTS)], documents())
+    assert written_match_ids(db) == list(range(DOCUMENTS))
+    assert db.commits == -(-DOCUMENTS // BATCH_SIZE)
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 3])
+def test_max_in_flight_limits_concurrent_commits(max_in_flight):
+    db = CountingClient()
+    writer = BulkWriter(db, batch_size=BATCH_SIZE, max_in_flight=max_in_flight)
+    writer.set_documents(COLLECTION, [None] * DOCUMENTS, documents())
+    assert written_match_ids(db) == list(range(DOCUMENTS))
+    assert db.most_in_progress == max_in_flight
+
+
+def test_batches_failing_every_retry_are_reported():
+    db = LocalFirestoreClient(fail_rate=1.0)
+    writer = BulkWriter(db, batch_size=BATCH_SIZE, max_in_flight=4, max_retries=1, backoff_factor=0)
+    with pytest.raises(BulkWriteError) as error:
+        writer.set_documents(COLLECTION, [None] * DOCUMENTS, documents())
+    assert len(error.value.failed_batches) == -(-DOCUMENTS // BATCH_SIZE)
+    assert db.commits == 2 * len(error.value.failed_batches)
+    assert written_match_ids(db) == []
@@ -0,0 +1,65 @@
+"""
+Delta sync against LocalFirestoreClient - deletions are limited to the source a document was synced from
+
+Run with: python -m pytest test_firestore_sync.py
+"""
+from firestore_sync import SyncManifest, match_document_id, sync_collection
+from local_firestore import LocalFirestoreClient
+
+COLLECTION = 'Player_Tournament_Results'
+
+
+def season(year, matches):
+    """
+    :return: (doc ids, records) of a season's results
+    """
+    records = [{'tournament_id': f'T{year}', 'draw_id': 1, 'match_id': match_id, 'winning_team_scores': '21,21'}
+               for match_id in matches]
+    return [match_document_id(record) for record in records], records
+
+
+def sync(db, manifest, year, matches):
+    doc_ids, records = season(year, matches)
+    return sync_collection(db, COLLECTION, doc_ids, records, manifest, source=f'results_{year}.csv')
+
+
+def test_sync_writes_only_changes(tmp_path):
+    db = LocalFirestoreClient()
+    manifest = SyncManifest(str(tmp_path / 'manifest.json'))
+    assert sync(db, manifest, 2019, [1, 2, 3])['new'] == 3
+    commits = db.commits
+    counts = sync(db, SyncManifest(str(tmp_path / 'manifest.json')), 2019, [1, 2, 3])
+    assert counts == {'new': 0, 'changed': 0, 'deleted': 0, 'unchanged': 3}
+    assert db.commits == commits
+
+
+def test_other_season_is_not_deleted(tmp_path):
+    db = LocalFirestoreClient()
+    manifest = SyncManifest(str(tmp_path / 'manifest.json'))
+    sync(db, manifest, 2019, [1, 2, 3])
+    assert sync(db, manifest, 2020, [4, 5])['deleted'] == 0
+    assert len(db.collections[COLLECTION]) == 5
+
+    # A match removed from 2019's results is deleted, 2020's are left alone
+    assert sync(db, manifest, 2019, [1, 2])['deleted'] == 1
+    assert sorted(db.collections[COLLECTION]) == sorted(season(2019, [1, 2])[0] + season(2020, [4, 5])[0])
+
+
+def test_document_in_another_source_is_not_deleted(tmp_path):
+    db = LocalFirestoreClient()
+    manifest = SyncManifest(str(tmp_path / 'manifest.json'))
+    doc_ids, records = season(2019, [1])
+    sync_collection(db, COLLECTION, doc_ids, records, manifest, source='a.csv')
+    sync_collection(db, COLLECTION, doc_ids, records, manifest, source='b.csv')
+    assert sync_collection(db, COLLECTION, [], [], manifest, source='a.csv')['deleted'] == 0
+    assert doc_ids[0] in db.collections[COLLECTION]
+
+
+def test_auto_id_documents_are_kept(tmp_path):
+    db = LocalFirestoreClient()
+    batch = db.batch()
+    batch.set(db.collection(COLLECTION).document('auto'), {'match_id': 1})
+    batch.commit()
+    manifest = SyncManifest(str(tmp_path / 'manifest.json'))
+    sync(db, manifest, 2019, [])
+    assert 'auto' in db.collections[COLLECTION]
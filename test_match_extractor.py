@@ -0,0 +1,158 @@
+"""
+MatchExtractor against Match over randomly generated match tags - fixed seed, both parser backends
+
+Run with: python -m pytest test_match_extractor.py
+"""
+import math
+import random
+import pytest
+from bs4 import BeautifulSoup
+from match import Match
+from match_extractor import MatchExtractor
+from tournament_player_id import TourPlayerId
+
+SEED = 20190101
+MATCHES = 1500
+
+
+class RecordingResolver(dict):
+    """TsidResolver keyed on (tour_ref, tour_player_id), logging every add"""
+
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+    def get(self, tour_ref, tour_player_id, default=None):
+        return dict.get(self, (tour_ref, tour_player_id), default)
+
+    def add(self, tour_ref, tour_player_id, tsid):
+        self[(tour_ref, tour_player_id)] = tsid
+        self.log.append((tour_ref, tour_player_id, tsid))
+
+
+def fake_scrape_tsid(self):
+    """TSID from the url, without fetching the player page - a player id of 'bad' fails"""
+    if 'bad' in self.url:
+        raise ValueError(self.url)
+    return 'T' + self.url[-3:]
+
+
+class MatchGenerator:
+    """
+    Random match-group__item html, close to the site's markup but with fields missing, extra classless
+    divs, reordered classes and players without links - each a case where Match raises or differs
+    """
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def choice(self, *options):
+        return self.random.choice(options)
+
+    def maybe(self, html, p=0.85):
+        return html if self.random.random() < p else ''
+
+    def classless(self):
+        return '' if self.random.random() < 0.93 else self.choice('<div>cl</div>', '<div class="">e</div>')
+
+    def player(self, num):
+        if self.random.random() < 0.98:
+            if self.random.random() < 0.97:
+                href = f'/sport/player.aspx?id=T{self.random.randint(1, 3)}&amp;player={self.random.randint(1, 30)}'
+            else:
+                href = '/sport/player.aspx?id=X&amp;player=bad'
+            link = f'<a href="{href}">P{num}</a>'
+        else:
+            link = self.choice('<a>no href</a>', '<b>no link</b>')
+        return f'<span class="nav-link">{self.classless()}{link}</span>'
+
+    def row(self, won):
+        if won:
+            css_class = self.choice('match__row has-won', 'match__row  has-won', 'has-won match__row')
+        else:
+            css_class = self.choice('match__row ', 'match__row', 'match__row', 'match__row', 'match__row x')
+        players = ''.join(self.player(num) for num in range(self.random.randint(0, 3)))
+        title = self.maybe(f'<div class="match__row-title">{players}</div>', 0.97)
+        cells = ''.join(f'<li class="points__cell">{self.choice(21, 15, " 9 ", "W", "")}</li>'
+                        for _ in range(self.random.randint(0, 3)))
+        walkover = self.maybe('<ul class=points><li class=points__cell>W</li></ul>', 0.5)
+        result = self.maybe(f'<div class="match__result">{walkover}<ul>{cells}</ul></div>')
+        return f'<div class="{css_class}">{self.classless()}{title}{result}</div>'
+
+    def match(self):
+        message = self.maybe(f'<span class="tag--warning tag match__message">{self.choice("Walkover", "", " ")}'
+                             f'</span>', 0.2)
+        title = self.maybe('<div class="match__header-title"><span>R16</span></div>', 0.95)
+        stats_link = self.maybe(f'<a href=/sport/match.aspx?id=T1&amp;match={self.random.randint(1, 99)}>s</a>')
+        duration = self.choice('Match stats 3m', 'match stats 4m', '5m', '')
+        aside = self.maybe(f'<div class="match__header-aside">{duration}{stats_link}{self.maybe("<a>x</a>", 0.2)}'
+                           f'</div>', 0.9)
+        rows = [self.row(True), self.row(False)]
+        if self.random.random() < 0.2:
+            rows.reverse()
+        body = f'<div class="match__body">{self.classless()}{rows[0]}{self.classless()}{rows[1]}</div>'
+        clock = self.maybe('<svg class="icon-clock nav-link__prefix"></svg>'
+                           + self.maybe('<span class="nav-link__value">Sat 10:00</span>'), 0.8)
+        items = ''.join(f'<li class="match__footer-list-item">{self.maybe(clock) if num == 0 else ""} Court {num} </li>'
+                        for num in range(self.random.randint(0, 3)))
+        fallback = self.maybe('<span class=nav-link__value>fallback</span>', 0.3)
+        footer = self.maybe(f'<div class="match__footer">{fallback}<ul>{items}</ul></div>', 0.9)
+        return (f'<li class="match-group__item">{message}<div class="match">'
+                f'<div class="match__header">{title}{aside}</div>{body}{footer}</div></li>')
+
+
+def same_record(record, expected):
+    """records equal, with nan equal to nan and types matching"""
+    if record.keys() != expected.keys():
+        return False
+    for key, value in expected.items():
+        if isinstance(value, float) and math.isnan(value):
+            if not (isinstance(record[key], float) and math.isnan(record[key])):
+                return False
+        elif record[key] != value or type(record[key]) != type(value):
+            return False
+    return True
+
+
+def outcome(get_record):
+    """(record, error type) - messages differ, e.g AttributeError names the method called on None"""
+    try:
+        return get_record(), None
+    except Exception as e:
+        return None, type(e)
+
+
+@pytest.mark.parametrize('parser', ['lxml', 'html.parser'])
+def test_extractor_matches_match(parser, monkeypatch):
+    if parser == 'lxml':
+        pytest.importorskip('lxml')
+    monkeypatch.setattr(TourPlayerId, 'scrape_tsid', fake_scrape_tsid)
+    generator = MatchGenerator(SEED)
+    extractor = MatchExtractor()
+    counts = {'no_match': 0, 'record': 0, 'error': 0}
+
+    for _ in range(MATCHES):
+        html = generator.match()
+        tag = BeautifulSoup(html, parser).find('li', class_='match-group__item')
+        match_resolver, extractor_resolver = RecordingResolver(), RecordingResolver()
+        match = Match(tag, None, match_resolver)
+        parsed = extractor.extract(tag)
+
+        assert parsed.no_match == match.check_for_no_match(), html
+        if parsed.no_match:
+            counts['no_match'] += 1
+            continue
+        assert parsed.match_id == match.get_match_id(), html
+
+        expected, expected_error = outcome(match.get_match_stats)
+        record, error = outcome(lambda: parsed.to_record(None, extractor_resolver))
+        assert error == expected_error, html
+        assert extractor_resolver.log == match_resolver.log, html
+        if expected_error is None:
+            assert same_record(record, expected), html
+            counts['record'] += 1
+        else:
+            counts['error'] += 1
+
+    # the generator reaches every branch
+    assert all(counts.values()), counts
@@ -0,0 +1,33 @@
+"""
+ResponseCache shared by several processes
+
+Run with: python -m pytest test_response_cache.py
+"""
+import multiprocessing
+import os
+from response_cache import ResponseCache
+
+URL = 'https://be.tournamentsoftware.com/sport/player.aspx?id=T1&player=1'
+PUTS = 200
+
+
+def put_page(args):
+    """
+    put the same url over and over from one process
+    :param args: tuple (cache_dir, worker number)
+    """
+    cache_dir, num = args
+    cache = ResponseCache(cache_dir)
+    for _ in range(PUTS):
+        cache.put(URL, str(num).encode() * 5000)
+
+
+def test_processes_writing_the_same_page(tmp_path):
+    cache_dir = str(tmp_path)
+    with multiprocessing.Pool(4) as pool:
+        pool.map(put_page, [(cache_dir, num) for num in range(4)])
+
+    # One worker's page, whole - never a mix or a truncated write
+    content = ResponseCache(cache_dir).get(URL)
+    assert len(content) == 5000 and len(set(content)) == 1
+    assert not [name for _, _, names in os.walk(cache_dir) for name in names if name.endswith('.tmp')]
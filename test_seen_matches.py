@@ -0,0 +1,109 @@
+"""
+SeenMatches ownership in a concurrent crawl - a match goes to the first unit that has it, as in a sequential crawl,
+even when that unit fails after a later unit saw the match
+
+Run with: python -m pytest test_seen_matches.py
+"""
+import asyncio
+import threading
+from collect_match_data import crawl, crawl_async, unit_claims
+from seen_matches import SeenMatches
+from tsid_resolver import TsidResolver
+
+KEY = SeenMatches.match_key('T1', '1', '7')
+RECORD = {'tournament_id': 'T1', 'draw_id': '1', 'match_id': '7'}
+
+
+class ListSinks:
+    """SeasonResultSinks collecting records in a list"""
+
+    def __init__(self):
+        self.records = []
+
+    def write_many(self, records, season):
+        self.records.extend(records)
+
+
+def collect(claims, fail=False, wait_for=None, done=None):
+    """
+    a unit of work finding RECORD - as collect_player_results, settled on success and released on failure
+    :param claims: OwnedClaims - the unit's claims
+    :param fail: bool - fail as on a FetchError
+    :param wait_for: threading.Event - finish only once it is set
+    :param done: threading.Event - set once the match was claimed or skipped
+    :return: list of dict - records, None if the unit failed
+    """
+    results = [dict(RECORD)] if claims.claim(KEY) else []
+    if done is not None:
+        done.set()
+    if wait_for is not None:
+        assert wait_for.wait(5)
+    if fail:
+        claims.release([KEY])
+        return None
+    claims.settle()
+    return results
+
+
+def test_later_unit_keeps_copy_while_owner_runs():
+    seen = SeenMatches()
+    assert seen.claim(KEY, 0)
+    # Unit 0 hasn't completed - unit 1 extracts its own copy
+    assert seen.claim(KEY, 1)
+    assert not seen.owns(KEY, 1)
+    seen.release([KEY], 0)
+    assert seen.owns(KEY, 1)
+
+
+def test_settled_owner_is_skipped():
+    seen = SeenMatches()
+    assert seen.claim(KEY, 0)
+    seen.settle(0)
+    assert not seen.claim(KEY, 1)
+    assert seen.owns(KEY, 0)
+
+
+def test_earlier_unit_takes_over():
+    seen = SeenMatches()
+    assert seen.claim(KEY, 1)
+    seen.settle(1)
+    assert seen.claim(KEY, 0)
+    assert seen.owns(KEY, 0)
+    assert not seen.owns(KEY, 1)
+
+
+def test_claims_without_owner_are_final():
+    seen = SeenMatches()
+    assert seen.claim(KEY)
+    assert not seen.claim(KEY, 0)
+    assert not seen.claim(KEY)
+
+
+def run_units(owner_fails, concurrent):
+    """
+    crawl unit 0 and unit 1, both finding RECORD. Concurrently, unit 0 finishes after unit 1 has
+    claimed or skipped the match and completed
+    :return: list of dict - records written
+    """
+    seen = SeenMatches()
+    sinks = ListSinks()
+    later_done = threading.Event() if concurrent else None
+    units = [('p0', 'player 0', collect, (unit_claims(seen, 0), owner_fails, later_done), 2019),
+             ('p1', 'player 1', collect, (unit_claims(seen, 1), False, None, later_done), 2019)]
+    if concurrent:
+        asyncio.run(crawl_async(units, TsidResolver(), 2, sinks, seen_matches=seen))
+    else:
+        crawl(units, TsidResolver(), sinks)
+    return sinks.records
+
+
+def test_failed_owner_match_is_written_by_next_unit():
+    sequential = run_units(owner_fails=True, concurrent=False)
+    assert sequential == [RECORD]
+    assert run_units(owner_fails=True, concurrent=True) == sequential
+
+
+def test_match_is_written_once():
+    sequential = run_units(owner_fails=False, concurrent=False)
+    assert sequential == [RECORD]
+    assert run_units(owner_fails=False, concurrent=True) == sequential
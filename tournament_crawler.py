@@ -0,0 +1,125 @@
+import pandas as pd
+from crawl_metrics import timer
+from http_client import SITE_URL, get_content
+from page_parser import LINK_REGION, MATCH_REGION, parse
+from parse_pool import parse_page
+from tournament_results import event_title, iter_parsed_records, link_param, parse_matches
+
+# Pages of a tournament - listing its events, the draws of an event and the matches of a draw
+EVENTS_URL = SITE_URL + '/sport/events.aspx?id={tournament_id}'
+EVENT_URL = SITE_URL + '/sport/event.aspx?id={tournament_id}&event={event_id}'
+DRAW_MATCHES_URL = SITE_URL + '/sport/drawmatches.aspx?id={tournament_id}&draw={draw_id}'
+
+# Tournament meta columns - as extracted by TournamentResults.get_tournament_meta
+TOURNAMENT_COLUMNS = ['tournament', 'tournament_id', 'location', 'tour_dates']
+
+
+def find_links(soup, param):
+    """
+    find links to pages selected by a query parameter e.g all 'draw=' links
+    :param soup: bs object of page
+    :param param: str - query parameter e.g 'event'
+    :return: list of tuples (id, link text) - in page order, each id once
+    """
+    links = []
+    seen = set()
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if f'{param}=' not in href:
+            continue
+        link_id = link_param(href, param)
+        if link_id not in seen:
+            seen.add(link_id)
+            links.append((link_id, link.text.strip()))
+    return links
+
+
+def load_tournaments(path_csv):
+    """
+    list the tournaments in a csv with TOURNAMENT_COLUMNS - e.g a tournament list or the results csv
+    of a previous crawl
+    :param path_csv: str - path to csv
+    :return: list of dict - tournament meta
+    """
+    df = pd.read_csv(path_csv, usecols=TOURNAMENT_COLUMNS, dtype=str)
+    return df.drop_duplicates(subset='tournament_id').to_dict('records')
+
+
+def parse_draw_matches_page(content):
+    """
+    parse the matches of a draw without resolving TSIDs - safe to run in a parser process
+    :param content: bytes - page html
+    :return: list of ParsedMatch
+    """
+    return parse_matches(parse(content, MATCH_REGION).find_all('li', class_='match-group__item'))
+
+
+class TournamentCrawler:
+    """
+    Class to collect all match results of one tournament
+
+    Unlike Player -> TournamentResults, which reads a tournament's matches from every player's page,
+    the tournament is walked once: events page -> each event's draws -> each draw's matches.
+    Requests are therefore proportional to tournaments and draws rather than players.
+    Records have the same schema as TournamentResults.iter_results.
+    """
+
+    def __init__(self, tour_meta, ranking_index, tsid_resolver, seen_matches=None):
+        """
+        instantiate TournamentCrawler class
+        :param
+            tour_meta: dict - {'tournament': name, 'tournament_id': id, 'location': loc, 'tour_dates': date}
+            ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+            tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+            seen_matches: SeenMatches - matches already extracted are skipped
+        """
+        self.tour_meta = {col: tour_meta.get(col, 'n/a') for col in TOURNAMENT_COLUMNS}
+        self.tournament_id = self.tour_meta['tournament_id']
+        self.ranking_index = ranking_index
+        self.tsid_resolver = tsid_resolver
+        self.seen_matches = seen_matches
+        self.claimed_keys = []
+
+    def find_events(self):
+        """
+        :return: list of tuples (event_id, event title) - title as TournamentResults.get_event_name gives it
+        """
+        content = get_content(EVENTS_URL.format(tournament_id=self.tournament_id))
+        with timer('parse.links'):
+            return [(event_id, event_title(title)) for event_id, title in find_links(parse(content, LINK_REGION), 'event')]
+
+    def find_draws(self, event_id):
+        """
+        :param event_id: str - event id
+        :return: list of dict - {'draw_title': title, 'draw_id': id}
+        """
+        content = get_content(EVENT_URL.format(tournament_id=self.tournament_id, event_id=event_id))
+        with timer('parse.links'):
+            draws = find_links(parse(content, LINK_REGION), 'draw')
+        return [{'draw_title': title, 'draw_id': draw_id} for draw_id, title in draws]
+
+    def get_parsed_matches(self, draw_id):
+        """
+        :param draw_id: str - draw id
+        :return: list of ParsedMatch - parsed in the parse pool if one is configured
+        """
+        return parse_page(parse_draw_matches_page,
+                          get_content(DRAW_MATCHES_URL.format(tournament_id=self.tournament_id, draw_id=draw_id)))
+
+    def iter_results(self):
+        """
+        yields match records of every draw in the tournament as they are parsed
+        :return: generator of MatchRecord
+        """
+        for event_id, title in self.find_events():
+            for draw_title_id_dict in self.find_draws(event_id):
+                draw_dict = {**self.tour_meta, 'event_title': title, **draw_title_id_dict}
+                yield from iter_parsed_records(self.get_parsed_matches(draw_title_id_dict['draw_id']), draw_dict,
+                                               self.ranking_index, self.tsid_resolver,
+                                               self.seen_matches, self.claimed_keys)
+
+    def collect_all_results(self):
+        """
+        :return: list of MatchRecord - all match records of the tournament
+        """
+        return list(self.iter_results())
@@ -1,32 +1,165 @@
-import requests
-from bs4 import BeautifulSoup as bs
-from match import Match
+from crawl_metrics import incr, record_failure
+from http_client import FetchError, get_content
+from match_extractor import MatchExtractor, ParsedMatch
+from match_record import MatchRecord
+from page_parser import RESULTS_REGION, parse
+from seen_matches import SeenMatches
+
+# Match field rules compiled once - shared by every page
+MATCH_EXTRACTOR = MatchExtractor()
+
+
+def claim_match(seen_matches, claimed_keys, tournament_id, draw_id, match_id):
+    """
+    check match hasn't already been extracted from another page, claiming it if not
+    :param seen_matches: SeenMatches - None if not de-duplicating
+    :param claimed_keys: list - key is appended here if match is claimed
+    :param tournament_id: str
+    :param draw_id: str
+    :param match_id: str
+    :return: bool - True if match should be extracted
+    """
+    if seen_matches is None:
+        return True
+    key = SeenMatches.match_key(tournament_id, draw_id, match_id)
+    if key is None:
+        return True
+    if not seen_matches.claim(key):
+        return False
+    claimed_keys.append(key)
+    return True
+
+
+def link_param(href, param):
+    """
+    id in a link to an event or draw - the same whether read from a player's results page or a tournament's
+    pages, so records of either crawl mode join
+    :param href: str - e.g '/sport/drawmatches.aspx?id=T1&draw=4&tab=2'
+    :param param: str - query parameter e.g 'draw'
+    :return: str - e.g '4'
+    """
+    return href.split(f'{param}=')[-1].split('&')[0]
+
+
+def event_title(text):
+    """
+    event title as written to results - the same whether read from a player's results page or a tournament's
+    events page, so records of either crawl mode join
+    :param text: str - event heading of a results page e.g 'Event: MS U17', or event link text e.g 'MS U17'
+    :return: str - e.g 'MS U17'
+    """
+    text = ' '.join(text.split())
+    if text.startswith('Event:'):
+        text = text[len('Event:'):].strip()
+    return text
+
+
+def parse_matches(match_tags):
+    """
+    extract the matches of one draw without resolving TSIDs - safe to run in a parser process
+    :param match_tags: list (bs4.li) - li class=match-group__item
+    :return: list of ParsedMatch - matches that were played
+    """
+    parsed_matches = []
+    for match in match_tags:
+        try:
+            m1 = MATCH_EXTRACTOR.extract(match)
+        except Exception as e:
+            # Unreadable match - carried to the resolving process, where it's skipped and recorded as a failure
+            m1 = ParsedMatch(False, None, error=e)
+        if not m1.no_match:
+            parsed_matches.append(m1)
+    return parsed_matches
+
+
+def iter_parsed_records(parsed_matches, draw_dict, ranking_index, tsid_resolver, seen_matches=None,
+                        claimed_keys=None):
+    """
+    resolve TSIDs of the parsed matches of one draw into match records
+    :param parsed_matches: list of ParsedMatch - from parse_matches
+    :param draw_dict: dict - tournament meta, event title, draw title and draw id - added to every record
+    :param ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param seen_matches: SeenMatches - matches already extracted are skipped
+    :param claimed_keys: list - keys of matches claimed in seen_matches are appended here
+    :return: generator of MatchRecord
+    """
+    if claimed_keys is None:
+        claimed_keys = []
+    for m1 in parsed_matches:
+        try:
+            if not claim_match(seen_matches, claimed_keys, draw_dict['tournament_id'], draw_dict['draw_id'],
+                               m1.match_id):
+                # Already extracted from another page
+                incr('matches.duplicate')
+                continue
+            # Combine all results
+            record = MatchRecord.from_dict({**draw_dict, **m1.to_record(ranking_index, tsid_resolver)})
+        except FetchError:
+            raise
+        except Exception as e:
+            # Match stats not provided due to some issue with scrapping - skipped
+            incr('matches.failed')
+            record_failure('match', e, tournament_id=draw_dict.get('tournament_id'),
+                           draw_id=draw_dict.get('draw_id'), match_id=m1.match_id)
+            continue
+        incr('matches.extracted')
+        yield record
+
+
+def iter_match_records(match_tags, draw_dict, ranking_index, tsid_resolver, seen_matches=None, claimed_keys=None):
+    """
+    parse the matches of one draw into match records
+    :param match_tags: list (bs4.li) - li class=match-group__item
+    :param draw_dict: dict - tournament meta, event title, draw title and draw id - added to every record
+    :param ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+    :param tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+    :param seen_matches: SeenMatches - matches already extracted are skipped
+    :param claimed_keys: list - keys of matches claimed in seen_matches are appended here
+    :return: generator of MatchRecord
+    """
+    yield from iter_parsed_records(parse_matches(match_tags), draw_dict, ranking_index, tsid_resolver,
+                                   seen_matches, claimed_keys)
+
+
+def parse_results_page(content):
+    """
+    parse a player's tournament results page without resolving TSIDs - safe to run in a parser process
+    :param content: bytes - page html
+    :return: tuple (bool, list) - whether the page has results, list of (draw_dict, list of ParsedMatch)
+    """
+    page = TournamentResults(None, None, None, content=content)
+    if not page.check_if_results_exist():
+        return False, []
+    return True, [(draw_dict, parse_matches(match_tags)) for draw_dict, match_tags in page.iter_draws()]
 
 
 class TournamentResults:
-    def __init__(self, url, player_ratings_df, df_tour_res):
+    def __init__(self, url, ranking_index, tsid_resolver, seen_matches=None, claimed_keys=None, content=None):
         """
         instantiate TournamentResults class
         :param
             url: str - url for player tournament stats
-            player_ratings_df: DataFrame - Collected by scraping ranking tables
-            df_tour_res: DataFrame - Schema: tour_player_id, tour_ref, tsid
-        """
-        self.cookies = {'ASP.NET_SessionId': 'samot0pr3nnbuav0vs3l1oop',
-                        'st': 'l=2057&exp=44802.7753505324&c=1&cp=20',
-                        'expires': 'Mon, 29-Aug-2022 16:36:30 GMT',
-                        'path': '/'
-                        }
+            ranking_index: RankingIndex - ranking table indexed by profile id, TSID, name and category
+            tsid_resolver: TsidResolver - shared (tour_ref, tour_player_id) -> tsid look up
+            seen_matches: SeenMatches - matches already extracted from other players' pages, skipped
+            claimed_keys: list - keys of matches claimed in seen_matches by this page are appended here
+            content: bytes - page html if already fetched, otherwise url is fetched
+        """
         self.results = []
+        self.seen_matches = seen_matches
+        self.claimed_keys = claimed_keys if claimed_keys is not None else []
         self.url = url
-        self.soup = bs(requests.get(self.url, cookies=self.cookies).content, 'html.parser')
-        self.player_ratings_df = player_ratings_df
-        self.df_tour_res = df_tour_res
+        # Only the page content is read - header, navigation and footer are skipped
+        if content is None:
+            content = get_content(self.url)
+        self.soup = parse(content, RESULTS_REGION)
+        self.ranking_index = ranking_index
+        self.tsid_resolver = tsid_resolver
 
     def check_if_results_exist(self):
         try:
-            no_match_text = self.soup.find('div', class_='content') \
-                .find('div', class_='page-content-start js-is-loading') \
+            no_match_text = self.soup.find('div', class_='page-content-start js-is-loading') \
                 .find('div', class_='is-loading-element is-loading-element--blur') \
                 .find('div', class_='wrapper wrapper--padding').find('div', class_='module js-is-loading') \
                 .find('p', class_='text--center text--muted margin-bottom--small').text.strip()
@@ -45,7 +178,7 @@ class TournamentResults:
         return:
             list (bs4.element)
         """
-        return self.soup.find('div', class_='content').find('div', class_='page-content-start js-is-loading') \
+        return self.soup.find('div', class_='page-content-start js-is-loading') \
             .find('div', class_='is-loading-element is-loading-element--blur') \
             .find('div', class_='is-loading-element is-loading-element--blur') \
             .find_all(recursive=False)
@@ -99,7 +232,7 @@ class TournamentResults:
         returns:
             dict - {'event_title':even_title}
         """
-        return {'event_title': event[0].text.strip().split('Event: ')[1]}
+        return {'event_title': event_title(event[0].text)}
 
     def get_draw_tuples(self, event):
         """
@@ -120,7 +253,7 @@ class TournamentResults:
         :param tup: (bs.h5, bs.ol)
         :return: draw_title_id_dict - dict
         """
-        draw_id, draw_title = tup[0].find('a')['href'].split('draw=')[-1], tup[0].find('a').text.strip()
+        draw_id, draw_title = link_param(tup[0].find('a')['href'], 'draw'), tup[0].find('a').text.strip()
         draw_title_id_dict = {'draw_title': draw_title, 'draw_id': draw_id}
         return draw_title_id_dict
 
@@ -132,10 +265,13 @@ class TournamentResults:
         """
         return tup[1].find_all('li', class_='match-group__item')
 
-    def collect_all_results(self):
+    def iter_draws(self):
         """
-        stores all tournament results for a player on a specific year
-        :return: list of dict
+        yields the matches of each draw with the draw's details.
+        Each tournament's parse tree is freed once its draws have been consumed, and the
+        page soup is released when the generator is exhausted.
+        :return: generator of tuples (draw_dict, list (bs4.li)) - draw_dict holds tournament meta, event title,
+                 draw title and draw id
         """
         for tour in self.find_all_tournaments():
             tour_data_dict = self.get_tournament_meta(tour)
@@ -143,25 +279,25 @@ class TournamentResults:
                 event_dict = self.get_event_name(event)
                 for tup in self.get_draw_tuples(event):
                     draw_title_id_dict = self.get_draw_title_id(tup)
-                    for match in self.get_match_list(tup):
-                        try:
-                            m1 = Match(match, self.player_ratings_df, self.df_tour_res)
-                            if m1.check_for_no_match():
-                                pass
-                            else:
-                                m1_stats = m1.get_match_stats()
-                                # Upate the tournament result df used to located TSID
-                                self.df_tour_res = m1.get_df_tour_res()
-                                # Combine all results and append to result list
-                                comb = {**tour_data_dict, **event_dict, **draw_title_id_dict, **m1_stats}
-                                self.results.append(comb)
-                        except Exception as e:
-                            pass
-                            # Match stats not provided due to some issue with scrapping
-                            # comb = {**tour_data_dict, **event_dict,**draw_title_id_dict}
-                            # print(f'{comb}\n')
-                            # print(traceback.format_exc())
-        return self.results
+                    yield {**tour_data_dict, **event_dict, **draw_title_id_dict}, self.get_match_list(tup)
+            # Tournament consumed - free its subtree
+            tour.decompose()
+        self.soup.decompose()
+        self.soup = None
 
-    def get_df_tour_res(self):
-        return self.df_tour_res
+    def iter_results(self):
+        """
+        yields tournament results for a player on a specific year as each match is parsed.
+        :return: generator of MatchRecord
+        """
+        for draw_dict, match_tags in self.iter_draws():
+            yield from iter_match_records(match_tags, draw_dict, self.ranking_index, self.tsid_resolver,
+                                          self.seen_matches, self.claimed_keys)
+
+    def collect_all_results(self):
+        """
+        stores all tournament results for a player on a specific year
+        :return: list of MatchRecord
+        """
+        self.results.extend(self.iter_results())
+        return self.results
@@ -0,0 +1,107 @@
+import threading
+import pandas as pd
+
+
+class TsidResolver:
+    """
+    Look up table mapping a player's tournament reference to their TSID
+
+    Keyed on (tour_ref, tour_player_id) - the two ids in a player.aspx?id=<tour_ref>&player=<tour_player_id> link.
+    One resolver is shared by every Player, TournamentResults, Match and TourPlayerId in a crawl,
+    so a TSID scraped for one match is immediately available to all others.
+    Lookups and inserts are dict operations and safe to call from several threads.
+    """
+
+    columns = ['tsid', 'tour_ref', 'tour_player_id']
+
+    def __init__(self):
+        self._tsids = {}
+        # Mappings added since pop_new_entries was last called
+        self._new_entries = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dataframe(cls, df_tour_res):
+        """
+        build resolver from reference table
+        :param df_tour_res: DataFrame - Schema: tsid, tour_ref, tour_player_id
+        :return: TsidResolver
+        """
+        resolver = cls()
+        for tsid, tour_ref, tour_player_id in zip(df_tour_res['tsid'], df_tour_res['tour_ref'],
+                                                  df_tour_res['tour_player_id']):
+            resolver.add(tour_ref, tour_player_id, tsid)
+        resolver.pop_new_entries()
+        return resolver
+
+    @classmethod
+    def from_csv(cls, path_csv):
+        """
+        build resolver from reference csv written by to_csv
+        :param path_csv: str - path to csv
+        :return: TsidResolver
+        """
+        # Read ids as str - they are compared against ids split from urls
+        return cls.from_dataframe(pd.read_csv(path_csv, dtype={'tour_ref': str, 'tour_player_id': str}))
+
+    def get(self, tour_ref, tour_player_id, default=None):
+        """
+        look up TSID
+        :param tour_ref: str - tournament id from player link
+        :param tour_player_id: str - player id within tournament from player link
+        :param default: value returned if mapping not known
+        :return: str - TSID (np.nan if previously scraped and not found)
+        """
+        return self._tsids.get((tour_ref, tour_player_id), default)
+
+    def add(self, tour_ref, tour_player_id, tsid):
+        """
+        record TSID for tournament player reference
+        :param tour_ref: str - tournament id from player link
+        :param tour_player_id: str - player id within tournament from player link
+        :param tsid: str - TSID
+        """
+        with self._lock:
+            self._tsids[(tour_ref, tour_player_id)] = tsid
+            self._new_entries.append((tour_ref, tour_player_id, tsid))
+
+    def pop_new_entries(self):
+        """
+        mappings added since the last call - used to persist mappings as a crawl progresses
+        :return: list of tuples (tour_ref, tour_player_id, tsid)
+        """
+        with self._lock:
+            new_entries, self._new_entries = self._new_entries, []
+        return new_entries
+
+    def restore_new_entries(self, entries):
+        """
+        put back mappings from pop_new_entries that could not be persisted - returned by the next call
+        :param entries: list of tuples (tour_ref, tour_player_id, tsid)
+        """
+        with self._lock:
+            self._new_entries[:0] = entries
+
+    def __contains__(self, key):
+        return key in self._tsids
+
+    def __len__(self):
+        return len(self._tsids)
+
+    def to_dataframe(self):
+        """
+        export mappings
+        :return: DataFrame - Schema: tsid, tour_ref, tour_player_id
+        """
+        with self._lock:
+            items = list(self._tsids.items())
+        return pd.DataFrame.from_dict({'tsid': [tsid for _, tsid in items],
+                                       'tour_ref': [key[0] for key, _ in items],
+                                       'tour_player_id': [key[1] for key, _ in items]})[self.columns]
+
+    def to_csv(self, path_csv):
+        """
+        write mappings to reference csv
+        :param path_csv: str - path to csv
+        """
+        self.to_dataframe().to_csv(path_csv, index=False)
@@ -0,0 +1,280 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from crawl_journal import json_default
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    key TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    season INTEGER,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    results TEXT,
+    tsids TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS units_status_seq ON units (status, seq);
+"""
+
+# Unit states - a leased unit whose lease has expired is available again
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+def default_worker_id():
+    """:return: str - host and process id, unique per worker process"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Lease:
+    """A unit of work leased to a worker - hand back to WorkQueue.complete or WorkQueue.fail"""
+
+    __slots__ = ('key', 'season', 'payload', 'attempt', 'owner', 'token')
+
+    def __init__(self, key, season, payload, attempt, owner, token):
+        self.key = key
+        self.season = season
+        self.payload = payload
+        self.attempt = attempt
+        self.owner = owner
+        self.token = token
+
+    def __repr__(self):
+        return f'Lease({self.key}, attempt {self.attempt}, {self.owner})'
+
+
+class WorkQueue:
+    """
+    Queue of crawl units shared by workers on several nodes, stored in SQLite
+
+    Units are added once, in crawl order, with a json payload describing the work. A worker leases
+    units for lease_seconds and keeps them with heartbeat while it works. A completed unit stores its
+    match records and the TSID mappings found, for merging once every unit is done. A worker that
+    crashes stops heartbeating, its leases expire and the units are leased again by another worker.
+    Each lease has a token, so a worker whose lease expired and was taken over can't complete the unit
+    after the new holder. A unit is failed after max_attempts leases.
+
+    The database file must be on storage every worker can reach e.g a shared volume.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3, timeout=60):
+        """
+        instantiate WorkQueue class
+        :param path: str - SQLite database, created if missing
+        :param lease_seconds: float - time a worker holds a unit without a heartbeat
+        :param max_attempts: int - leases of a unit before it's failed
+        :param timeout: float - seconds to wait for another worker's write to finish
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit - transactions are begun explicitly
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def _transaction(self, fn):
+        """run fn(connection) in a write transaction, taking the database write lock up front"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def add_units(self, units):
+        """
+        add units not already in the queue - adding the same units twice is harmless
+        :param units: iterable of tuples (key, season, payload) - payload json serialisable, in crawl order
+        :return: int - units added
+        """
+        def add(conn):
+            seq = conn.execute('SELECT COALESCE(MAX(seq), -1) + 1 FROM units').fetchone()[0]
+            added = 0
+            for key, season, payload in units:
+                cursor = conn.execute('INSERT OR IGNORE INTO units (key, seq, season, payload, updated) '
+                                      'VALUES (?, ?, ?, ?, ?)',
+                                      (key, seq, season, json.dumps(payload, default=json_default), time.time()))
+                if cursor.rowcount:
+                    added += 1
+                    seq += 1
+            return added
+        return self._transaction(add)
+
+    def lease(self, owner, limit=1):
+        """
+        lease the first available units - pending, or leased with an expired lease
+        :param owner: str - worker id
+        :param limit: int - most units to lease
+        :return: list of Lease - empty if nothing is available
+        """
+        if limit < 1:
+            return []
+
+        def lease(conn):
+            now = time.time()
+            rows = conn.execute('SELECT key, season, payload, attempts FROM units '
+                                'WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY seq LIMIT ?',
+                                (PENDING, LEASED, now, limit)).fetchall()
+            leases = []
+            for key, season, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # Expired on its last attempt
+                    conn.execute('UPDATE units SET status = ?, error = ?, updated = ? WHERE key = ?',
+                                 (FAILED, 'lease expired', now, key))
+                    continue
+                token = uuid.uuid4().hex
+                conn.execute('UPDATE units SET status = ?, attempts = ?, lease_owner = ?, lease_token = ?, '
+                             'lease_expires = ?, updated = ? WHERE key = ?',
+                             (LEASED, attempts + 1, owner, token, now + self.lease_seconds, now, key))
+                leases.append(Lease(key, season, json.loads(payload), attempts + 1, owner, token))
+            return leases
+        return self._transaction(lease)
+
+    def heartbeat(self, owner):
+        """
+        extend every lease held by owner
+        :param owner: str - worker id
+        :return: int - leases extended
+        """
+        def heartbeat(conn):
+            now = time.time()
+            return conn.execute('UPDATE units SET lease_expires = ?, updated = ? WHERE status = ? AND lease_owner = ?',
+                                (now + self.lease_seconds, now, LEASED, owner)).rowcount
+        return self._transaction(heartbeat)
+
+    def complete(self, lease, results, tsid_entries):
+        """
+        store a unit's results
+        :param lease: Lease - from lease
+        :param results: list of MatchRecord or dict - match records
+        :param tsid_entries: list of tuples (tour_ref, tour_player_id, tsid) - TSID mappings found
+        :return: bool - False if the lease was lost to another worker, and the results were discarded
+        """
+        results_json = json.dumps(results, default=json_default)
+        tsids_json = json.dumps([list(e) for e in tsid_entries], default=json_default)
+
+        def complete(conn):
+            return conn.execute('UPDATE units SET status = ?, results = ?, tsids = ?, error = NULL, '
+                                'lease_owner = NULL, lease_expires = NULL, updated = ? '
+                                'WHERE key = ? AND status = ? AND lease_token = ?',
+                                (DONE, results_json, tsids_json, time.time(), lease.key, LEASED,
+                                 lease.token)).rowcount == 1
+        return self._transaction(complete)
+
+    def fail(self, lease, error):
+        """
+        give a unit back - leased again unless it has had max_attempts
+        :param lease: Lease - from lease
+        :param error: str - why it failed
+        :return: bool - False if the lease was lost to another worker
+        """
+        status = FAILED if lease.attempt >= self.max_attempts else PENDING
+
+        def fail(conn):
+            return conn.execute('UPDATE units SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, '
+                                'updated = ? WHERE key = ? AND status = ? AND lease_token = ?',
+                                (status, str(error), time.time(), lease.key, LEASED, lease.token)).rowcount == 1
+        return self._transaction(fail)
+
+    def retry_failed(self):
+        """
+        make failed units pending again, with a fresh set of attempts
+        :return: int - units reset
+        """
+        def retry(conn):
+            return conn.execute('UPDATE units SET status = ?, attempts = 0, updated = ? WHERE status = ?',
+                                (PENDING, time.time(), FAILED)).rowcount
+        return self._transaction(retry)
+
+    def counts(self):
+        """
+        :return: dict - status: number of units
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def is_finished(self):
+        """:return: bool - True if every unit is done or failed"""
+        counts = self.counts()
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+    def _iter_done(self, columns):
+        with self._lock:
+            rows = self._conn.execute(f'SELECT {columns} FROM units WHERE status = ? ORDER BY seq',
+                                      (DONE,)).fetchall()
+        return rows
+
+    def iter_results(self):
+        """
+        :return: generator of tuples (key, season, list of match dicts) - completed units in crawl order
+        """
+        for key, season, results in self._iter_done('key, season, results'):
+            yield key, season, json.loads(results)
+
+    def iter_tsids(self):
+        """
+        :return: generator of tuples (tour_ref, tour_player_id, tsid) - TSID mappings of every completed unit
+        """
+        for (tsids,) in self._iter_done('tsids'):
+            for mapping in json.loads(tsids):
+                yield tuple(mapping)
+
+    def failures(self):
+        """
+        :return: list of tuples (key, attempts, error) - failed units
+        """
+        with self._lock:
+            return self._conn.execute('SELECT key, attempts, error FROM units WHERE status = ? ORDER BY seq',
+                                      (FAILED,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LeaseKeeper:
+    """Heartbeat a worker's leases from a background thread while it works"""
+
+    def __init__(self, queue, owner, interval=None):
+        """
+        instantiate LeaseKeeper class
+        :param queue: WorkQueue
+        :param owner: str - worker id
+        :param interval: float - seconds between heartbeats, default a third of the lease
+        """
+        self.queue = queue
+        self.owner = owner
+        self.interval = interval if interval is not None else queue.lease_seconds / 3
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.owner)
+            except sqlite3.OperationalError as e:
+                # Database busy - the lease has time left, try again next interval
+                print(f'Heartbeat failed for {self.owner} - {e}')
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()